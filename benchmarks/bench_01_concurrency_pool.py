@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+Compares the throughput of the default thread-per-job ConcurrencyQueue
+against the PooledConcurrencyQueue. Jobs are trivial so the numbers mostly
+reflect the cost of getting a job running rather than the job itself.
+
+No router is required. Run with:
+
+    python benchmarks/bench_01_concurrency_pool.py [jobs]
+"""
+
+import sys
+import time
+import threading
+
+import swampyer
+
+class CountingRunner(swampyer.ConcurrencyRunner):
+    """ Does nothing but let the benchmark know that it has run
+    """
+    def __init__(self, done):
+        super(CountingRunner, self).__init__(None, None)
+        self.done = done
+
+    def work(self):
+        self.done()
+
+def run_benchmark(queue_class, jobs, concurrency_max):
+    lock = threading.Lock()
+    finished = threading.Event()
+    completed = [0]
+
+    def done():
+        with lock:
+            completed[0] += 1
+            if completed[0] == jobs:
+                finished.set()
+
+    concurrency_queue = queue_class(
+                            'benchmark',
+                            concurrency_max=concurrency_max,
+                        )
+    concurrency_queue.start()
+
+    # Build the runners up front so we only measure the queue
+    runners = [ CountingRunner(done) for i in range(jobs) ]
+
+    start_time = time.perf_counter()
+    for runner in runners:
+        concurrency_queue.put(runner)
+    finished.wait()
+    duration = time.perf_counter() - start_time
+
+    concurrency_queue.shutdown()
+    return duration
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'mode':<12} {'concurrency_max':>16} {'seconds':>10} {'jobs/s':>12}")
+    for concurrency_max in (1, 8, 0):
+        for label, queue_class in (
+                    ('thread', swampyer.ConcurrencyQueue),
+                    ('pooled', swampyer.PooledConcurrencyQueue),
+                ):
+            duration = run_benchmark(queue_class, jobs, concurrency_max)
+            print(f"{label:<12} {concurrency_max:>16} {duration:>10.3f} {jobs/duration:>12.0f}")
+
+if __name__ == '__main__':
+    main()
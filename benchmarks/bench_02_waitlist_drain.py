@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+Measures how long it takes the ConcurrencyQueue scheduler to drain a
+waitlist of a given depth. The queue is driven synchronously and runners
+are never actually started so the numbers only reflect the cost of the
+waitlist bookkeeping.
+
+For comparison the `list` rows use the list based waitlist that the
+scheduler used to have, where each dequeue was a `list.pop(0)`.
+
+No router is required. Run with:
+
+    python benchmarks/bench_02_waitlist_drain.py
+"""
+
+import time
+
+import swampyer
+from swampyer.common import EV_INIT, EV_EXIT
+
+class NullRunner(swampyer.ConcurrencyRunner):
+    def __init__(self):
+        super(NullRunner, self).__init__(None, None)
+
+class SynchronousQueue(swampyer.ConcurrencyQueue):
+    """ Never starts a thread so we can drive the scheduler by hand
+    """
+    def runner_start(self, event):
+        pass
+
+class ListQueue(SynchronousQueue):
+    """ The previous list based waitlist
+    """
+    def reset(self):
+        super(ListQueue, self).reset()
+        self.waiting = []
+
+    def waitlist_pop(self):
+        if not self.waiting:
+            return None
+        return self.waiting.pop(0)
+
+def drain_time(queue_class, depth):
+    concurrency_queue = queue_class('benchmark', concurrency_max=1)
+    events = [
+        swampyer.ConcurrencyEvent(EV_INIT, NullRunner())
+        for i in range(depth)
+    ]
+    for event in events:
+        concurrency_queue.queue_event(event)
+
+    # Each exit frees the single slot and pulls the next job off
+    # of the waitlist
+    start_time = time.perf_counter()
+    for event in events:
+        concurrency_queue.queue_event(swampyer.ConcurrencyEvent(EV_EXIT, event.runner))
+    return time.perf_counter() - start_time
+
+def main():
+    print(f"{'waitlist':<10} {'depth':>8} {'seconds':>10} {'us/job':>10}")
+    for depth in (1000, 10000, 100000, 200000):
+        for label, queue_class in (
+                    ('deque', SynchronousQueue),
+                    ('list', ListQueue),
+                ):
+            duration = drain_time(queue_class, depth)
+            print(f"{label:<10} {depth:>8} {duration:>10.3f} {duration/depth*1e6:>10.2f}")
+
+if __name__ == '__main__':
+    main()
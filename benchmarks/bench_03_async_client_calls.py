@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Compares RPC call throughput of the threaded WAMPClient with the asyncio
+native AsyncWAMPClient. One client registers an echo procedure and a second
+client calls it CALLS times, either one call at a time or with up to
+INFLIGHT calls outstanding.
+
+The threaded client needs a thread per outstanding call so the concurrent
+rows use a ThreadPoolExecutor of INFLIGHT threads, the async client just
+gathers coroutines.
+
+A router is required. Configure it through the environment:
+
+    BENCH_URL=ws://localhost:8282/ws BENCH_REALM=izaber \\
+    BENCH_USERNAME=backend-1 BENCH_PASSWORD=backendpass \\
+        python benchmarks/bench_03_async_client_calls.py
+"""
+
+import os
+import time
+import asyncio
+import concurrent.futures
+
+import swampyer
+
+URL = os.environ.get('BENCH_URL', 'ws://localhost:8282/ws')
+REALM = os.environ.get('BENCH_REALM', 'izaber')
+USERNAME = os.environ.get('BENCH_USERNAME', 'backend-1')
+PASSWORD = os.environ.get('BENCH_PASSWORD', 'backendpass')
+CALLS = int(os.environ.get('BENCH_CALLS', 2000))
+INFLIGHT = int(os.environ.get('BENCH_INFLIGHT', 32))
+PROCEDURE = 'com.izaber.wamp.bench.echo'
+
+def echo(event, data):
+    return data
+
+def threaded_client():
+    return swampyer.WAMPClientTicket(
+                url=URL,
+                realm=REALM,
+                username=USERNAME,
+                password=PASSWORD,
+                concurrency_max=INFLIGHT,
+            ).start()
+
+async def async_client():
+    return await swampyer.AsyncWAMPClientTicket(
+                url=URL,
+                realm=REALM,
+                username=USERNAME,
+                password=PASSWORD,
+            ).start()
+
+def report(label, elapsed):
+    print("{:<28} {:>8} calls {:>8.3f}s {:>10.0f} calls/s".format(
+        label, CALLS, elapsed, CALLS / elapsed
+    ))
+
+def bench_threaded():
+    callee = threaded_client()
+    caller = threaded_client()
+    callee.register(PROCEDURE, echo, details={"force_reregister": True})
+
+    start = time.perf_counter()
+    for i in range(CALLS):
+        caller.call(PROCEDURE, i)
+    report('threaded sequential', time.perf_counter() - start)
+
+    with concurrent.futures.ThreadPoolExecutor(INFLIGHT) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda i: caller.call(PROCEDURE, i), range(CALLS)))
+        report('threaded x{}'.format(INFLIGHT), time.perf_counter() - start)
+
+    caller.shutdown()
+    callee.shutdown()
+
+async def bench_async():
+    callee = await async_client()
+    caller = await async_client()
+    await callee.register(PROCEDURE, echo, details={"force_reregister": True})
+
+    start = time.perf_counter()
+    for i in range(CALLS):
+        await caller.call(PROCEDURE, i)
+    report('async sequential', time.perf_counter() - start)
+
+    semaphore = asyncio.Semaphore(INFLIGHT)
+    async def call(i):
+        async with semaphore:
+            return await caller.call(PROCEDURE, i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(i) for i in range(CALLS)])
+    report('async x{}'.format(INFLIGHT), time.perf_counter() - start)
+
+    await caller.close()
+    await callee.close()
+
+def main():
+    print("Router: {}".format(URL))
+    bench_threaded()
+    asyncio.run(bench_async())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Measures how long a well behaved caller's jobs wait while another caller
+floods the same queue. A noisy caller submits a burst of BURST jobs at once
+while a quiet caller submits one job every few milliseconds. The wait time
+percentiles of the quiet caller are reported for the plain FIFO
+ConcurrencyQueue and the FairConcurrencyQueue.
+
+No router is required. Run with:
+
+    python benchmarks/bench_04_fair_queue.py
+"""
+
+import time
+import threading
+
+import swampyer
+
+BURST = 2000
+QUIET_JOBS = 100
+QUIET_INTERVAL = 0.005
+JOB_DURATION = 0.001
+CONCURRENCY = 4
+
+class TenantRunner(swampyer.ConcurrencyRunner):
+    def __init__(self, caller, histogram, done):
+        message = swampyer.INVOCATION(
+                      request_id=1,
+                      registration_id=1,
+                      details={ 'caller_authid': caller },
+                  )
+        super(TenantRunner, self).__init__(None, message)
+        self.histogram = histogram
+        self.done = done
+
+    def work(self):
+        if self.histogram is not None:
+            self.histogram.record(time.monotonic() - self.created_clock)
+        time.sleep(JOB_DURATION)
+        self.done.release()
+
+def run(queue_class):
+    concurrency_queue = queue_class('benchmark', concurrency_max=CONCURRENCY)
+    concurrency_queue.start()
+
+    quiet_waits = swampyer.LatencyHistogram()
+    done = threading.Semaphore(0)
+
+    for i in range(BURST):
+        concurrency_queue.put(TenantRunner('noisy', None, done))
+    for i in range(QUIET_JOBS):
+        concurrency_queue.put(TenantRunner('quiet', quiet_waits, done))
+        time.sleep(QUIET_INTERVAL)
+
+    for i in range(BURST + QUIET_JOBS):
+        done.acquire()
+    concurrency_queue.shutdown()
+    return quiet_waits.snapshot()
+
+def main():
+    print(f"{'queue':<10} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for label, queue_class in (
+                ('fifo', swampyer.ConcurrencyQueue),
+                ('fair', swampyer.FairConcurrencyQueue),
+            ):
+        snapshot = run(queue_class)
+        print(f"{label:<10} {snapshot['p50']*1000:>10.2f} {snapshot['p90']*1000:>10.2f} "
+              f"{snapshot['p99']*1000:>10.2f} {snapshot['max']*1000:>10.2f}")
+
+if __name__ == '__main__':
+    main()
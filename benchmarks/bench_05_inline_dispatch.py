@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Measures the dispatch overhead of the concurrency queues for handlers that
+do next to nothing. JOBS trivial jobs are put on the queue one after the
+other, much like the reader thread does with incoming EVENTs, and the
+throughput along with the p50/p99 of the time from `put()` until the job
+finished is reported for the thread per job ConcurrencyQueue, the
+PooledConcurrencyQueue and the InlineConcurrencyQueue.
+
+No router is required. Run with:
+
+    python benchmarks/bench_05_inline_dispatch.py
+"""
+
+import time
+import threading
+
+import swampyer
+
+JOBS = 20000
+CONCURRENCY = 8
+
+class NoopRunner(swampyer.ConcurrencyRunner):
+    def __init__(self, histogram, done):
+        super(NoopRunner, self).__init__(None, None)
+        self.histogram = histogram
+        self.done = done
+
+    def work(self):
+        pass
+
+    def finished(self, runner_stats):
+        self.histogram.record(runner_stats['total_duration'])
+        self.done.release()
+
+def run(queue_class):
+    concurrency_queue = queue_class('benchmark', concurrency_max=CONCURRENCY)
+    concurrency_queue.start()
+
+    histogram = swampyer.LatencyHistogram()
+    done = threading.Semaphore(0)
+
+    start = time.perf_counter()
+    for i in range(JOBS):
+        concurrency_queue.put(NoopRunner(histogram, done))
+    for i in range(JOBS):
+        done.acquire()
+    elapsed = time.perf_counter() - start
+
+    concurrency_queue.shutdown()
+    return elapsed, histogram.snapshot()
+
+def main():
+    print(f"{'queue':<10} {'jobs/s':>12} {'p50 us':>10} {'p99 us':>10}")
+    for label, queue_class in (
+                ('thread', swampyer.ConcurrencyQueue),
+                ('pooled', swampyer.PooledConcurrencyQueue),
+                ('inline', swampyer.InlineConcurrencyQueue),
+            ):
+        elapsed, snapshot = run(queue_class)
+        print(f"{label:<10} {JOBS/elapsed:>12.0f} {snapshot['p50']*1e6:>10.1f} "
+              f"{snapshot['p99']*1e6:>10.1f}")
+
+if __name__ == '__main__':
+    main()
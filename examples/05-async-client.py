@@ -0,0 +1,48 @@
+#!/bin/bash
+
+"""
+Uses the asyncio native AsyncWAMPClient to register a procedure, call it
+and iterate over the events of a subscription. Requires the `websockets`
+library for ws:// URLs. Rawsocket URLs (tcpip://, unix://) work without it.
+"""
+
+import swampyer
+
+import asyncio
+import sys
+import logging
+
+logging.basicConfig(stream=sys.stdout, level=1)
+
+async def hello(event, name):
+    await asyncio.sleep(0.1)
+    return "Hello {}".format(name)
+
+async def main():
+    async with swampyer.AsyncWAMPClient(
+                    url="ws://NEXUS_HOST:8282/ws",
+                    uri_base="com.example.wamp.api",
+                ) as client:
+
+        await client.register("hello_async", hello)
+        print(await client.call("hello_async", "world"))
+
+        # Subscriptions without a callback buffer their events
+        # so they can be consumed with `async for`
+        subscription = await client.subscribe("ticks")
+        await client.publish(
+                    "ticks",
+                    options={ 'acknowledge': True, 'exclude_me': False },
+                    args=[1]
+                )
+        async for event in client.events(subscription.subscription_id):
+            print(event.args)
+            break
+
+        print(client.stats())
+
+try:
+    asyncio.run(main())
+
+except swampyer.SwampyException as ex:
+    print("Whoops, something went wrong: {}".format(ex))
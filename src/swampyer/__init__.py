@@ -2,7 +2,10 @@ from .common import *
 from .messages import *
 from .utils import logger
 from .exceptions import *
+from .histogram import *
 from .transport import *
 from .queues import *
 from .client import *
 
+from .aiotransport import *
+from .aioclient import *
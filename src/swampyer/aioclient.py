@@ -0,0 +1,633 @@
+import time
+import asyncio
+import inspect
+import traceback
+
+from .common import *
+from .messages import *
+from .utils import logger
+from .exceptions import *
+from .aiotransport import get_async_transport
+from .client import agent_string
+
+class AsyncWAMPClient(object):
+    """ An asyncio native WAMP client. Shares the messages, serializers and
+        rawsocket framing with WAMPClient but does all of its work on the
+        running event loop rather than in threads.
+
+        Handlers for `register()` and `subscribe()` may be coroutine functions
+        or plain functions. Plain functions are called directly on the event
+        loop so they should not block.
+
+            client = await AsyncWAMPClient(url='ws://localhost:8080/ws').start()
+            result = await client.call('com.example.hello', 'world')
+    """
+    url = None
+    uri_base = None
+    realm = None
+    agent = None
+    authid = None
+    authmethods = None
+    timeout = None
+    max_payload_size: int = None
+
+    session_id = None
+    peer = None
+    transport = None
+
+    _subscriptions = None
+    _subscription_queues = None
+    _registered_calls = None
+    _requests_pending = None
+    _welcome = None
+    _reader_task = None
+    _tasks = None
+    _state = STATE_DISCONNECTED
+    _stats = None
+
+    def __init__(
+                self,
+                url='ws://NEXUS_HOST:8080',
+                realm='realm1',
+                agent=None,
+                uri_base='',
+                authmethods=None,
+                authid=None,
+                timeout=10,
+                serializers=None,
+                max_payload_size=50_000_000,
+                transport_options=None,
+                ):
+        self._state = STATE_DISCONNECTED
+        self.configure(
+            url = url,
+            uri_base = uri_base,
+            realm = realm,
+            agent = agent_string(agent),
+            timeout = timeout,
+            authid = authid,
+            authmethods = authmethods,
+            serializers = serializers,
+            max_payload_size = max_payload_size,
+            transport_options = transport_options,
+        )
+
+    def configure(self, **kwargs):
+        for k in ('url','uri_base','realm',
+                  'agent','timeout','authmethods', 'authid',
+                  'serializers', 'max_payload_size',
+                  'transport_options'):
+            if k in kwargs:
+                setattr(self,k,kwargs[k])
+
+    def get_full_uri(self,uri):
+        """ Returns the full URI with prefix attached
+        """
+        if self.uri_base:
+            return self.uri_base + '.' + uri
+        return uri
+
+    def is_connected(self):
+        """ returns a true value if the connection is currently active
+        """
+        return ( self._state == STATE_CONNECTED )
+
+    def stats(self):
+        """ Return the current stats object. Adds one parameter
+            `timestamp` which holds the current epoch time
+        """
+        stats = self._stats.copy()
+        stats['timestamp'] = time.time()
+        return stats
+
+    async def start(self):
+        """ Connects the transport, says hello and starts listening
+            for messages
+        """
+        await self.connect()
+        self._reader_task = asyncio.ensure_future(self.run())
+        await self.hello()
+        return self
+
+    async def connect(self):
+        self._state = STATE_CONNECTING
+        logger.debug("About to connect to {}".format(self.url))
+        options = dict(self.transport_options or {})
+        options.setdefault('serializers', self.serializers)
+        options.setdefault('user_agent', self.agent)
+        self.transport = get_async_transport(self.url, **options)
+        await self.transport.connect()
+
+        self._subscriptions = {}
+        self._subscription_queues = {}
+        self._registered_calls = {}
+        self._requests_pending = {}
+        self._tasks = set()
+        self._stats = {
+            'messages': 0,
+            'invocations': 0,
+            'calls': 0,
+            'events': 0,
+            'publications': 0,
+            'errors': 0,
+            'last_reset': time.time(),
+        }
+        self._state = STATE_WEBSOCKET_CONNECTED
+
+    async def hello(self, details=None):
+        """ Say hello to the server and wait for the welcome
+            message before proceeding
+        """
+        self._welcome = asyncio.get_running_loop().create_future()
+
+        if details is None:
+            details = {}
+        if self.authid:
+            details.setdefault('authid', self.authid)
+        details.setdefault('agent', self.agent)
+        details.setdefault('authmethods', self.authmethods or ['anonymous'])
+        details.setdefault('roles', {
+                                        'subscriber': {},
+                                        'publisher': {},
+                                        'caller': {},
+                                        'callee': {
+                                            'features': {
+                                                'progressive_call_results': True,
+                                            },
+                                        },
+                                    })
+        self._state = STATE_AUTHENTICATING
+        await self.send_message(HELLO(
+                                    realm = self.realm,
+                                    details = details
+                                ))
+
+        try:
+            message = await asyncio.wait_for(self._welcome, self.timeout)
+        except asyncio.TimeoutError:
+            raise ExWelcomeTimeout("Timed out waiting for WELCOME response")
+        except ExFatalError as ex:
+            raise ExAbort("Received abort when trying to connect: {}".format(
+                    str(ex)
+                  ))
+        if message == WAMP_ABORT:
+            raise ExAbort("Received abort when trying to connect: {}".format(
+                    message.details.get('message',
+                      message.reason)))
+        self.session_id = message.session_id
+        self.peer = message
+        self._state = STATE_CONNECTED
+
+    async def send_message(self, message):
+        """ Send a wamp message to the server. We don't wait
+            for a response here
+        """
+        if self._state == STATE_DISCONNECTED or not self.transport:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+        logger.debug("SND>: {}".format(message.dump()))
+        await self.transport.send_message(message, max_payload_size=self.max_payload_size)
+
+    async def send_and_await_response(self, request):
+        """ Sends out a request then awaits a response keyed by the
+            request_id
+        """
+        if self._state == STATE_DISCONNECTED:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+        future = asyncio.get_running_loop().create_future()
+        request_id = request.request_id
+        self._requests_pending[request_id] = future
+        try:
+            await self.send_message(request)
+            res = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise ExWAMPConnectionError("Did not receive a response!")
+        finally:
+            self._requests_pending.pop(request_id, None)
+        if res == WAMP_GOODBYE:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+        return res
+
+    def dispatch_to_awaiting(self, result):
+        """ Resolves the future waiting on the result
+        """
+        if self._state == STATE_AUTHENTICATING:
+            if result == WAMP_ABORT \
+               or result == WAMP_WELCOME \
+               or result == WAMP_GOODBYE:
+                if not self._welcome.done():
+                    self._welcome.set_result(result)
+            return
+
+        request_id = result.get('request_id')
+        future = self._requests_pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def call(self, uri, *args, **kwargs):
+        """ Sends a RPC request to the WAMP server
+        """
+        self._stats['calls'] += 1
+        message = await self.send_and_await_response(CALL(
+                      options={ 'disclose_me': True },
+                      procedure=self.get_full_uri(uri),
+                      args=args,
+                      kwargs=kwargs
+                    ))
+
+        if message == WAMP_RESULT:
+            return message.args[0]
+
+        if message == WAMP_ERROR:
+            if message.args:
+                err = message.args
+            else:
+                err = [message.error]
+            raise ExInvocationError(*err)
+
+        return message
+
+    async def publish(self, topic, options=None, args=None, kwargs=None):
+        """ Publishes a messages to the server. Only waits for the PUBLISHED
+            response if the `acknowledge` option is set (the default)
+        """
+        self._stats['publications'] += 1
+        if options is None:
+            options = {'acknowledge':True}
+        request = PUBLISH(
+                    options=options,
+                    topic=self.get_full_uri(topic),
+                    args=args or [],
+                    kwargs=kwargs or {}
+                  )
+        if options.get('acknowledge'):
+            return await self.send_and_await_response(request)
+        await self.send_message(request)
+        return None
+
+    async def register(self, uri, callback, details=None):
+        """ Puts a function on the bus. `callback` may be a coroutine
+            function or a plain function
+        """
+        result = await self.send_and_await_response(REGISTER(
+                      details=details or {},
+                      procedure=self.get_full_uri(uri)
+                  ))
+        if result == WAMP_REGISTERED:
+            self._registered_calls[result.registration_id] = [ uri, callback, details, None ]
+        elif result == WAMP_ERROR:
+            if result.args:
+                err = result.args
+            else:
+                err = [result.error]
+            raise ExInvocationError(*err)
+        return result
+
+    async def unregister(self, registration_id):
+        result = await self.send_and_await_response(UNREGISTER(registration_id=registration_id))
+        if result == WAMP_UNREGISTERED:
+            self._registered_calls.pop(registration_id, None)
+        elif result == WAMP_ERROR:
+            if result.args:
+                err = result.args
+            else:
+                err = [result.error]
+            raise ExInvocationError(*err)
+        return result
+
+    async def subscribe(self, topic, callback=None, options=None, queue_max=0):
+        """ Subscribe to a uri for events from a publisher. If no `callback`
+            is provided, the events are buffered (up to `queue_max` of them
+            if set) and can be retrieved with `events()`
+        """
+        result = await self.send_and_await_response(SUBSCRIBE(
+                                    options=options or {},
+                                    topic=self.get_full_uri(topic)
+                                ))
+        if result == WAMP_SUBSCRIBED:
+            subscription_id = result.subscription_id
+            self._subscriptions[subscription_id] = [topic, callback, options, None]
+            if not callback:
+                self._subscription_queues[subscription_id] = asyncio.Queue(queue_max)
+        return result
+
+    async def unsubscribe(self, subscription_id):
+        """ Unsubscribe an existing subscription
+        """
+        result = await self.send_and_await_response(UNSUBSCRIBE(subscription_id=subscription_id))
+        self._subscriptions.pop(subscription_id, None)
+        event_queue = self._subscription_queues.pop(subscription_id, None)
+        if event_queue is not None:
+            event_queue.put_nowait(None)
+        return result
+
+    async def events(self, subscription_id):
+        """ Async iterator over the events received for a subscription that
+            was created without a callback. Finishes once unsubscribed or
+            disconnected
+
+                subscription = await client.subscribe('com.example.topic')
+                async for event in client.events(subscription.subscription_id):
+                    print(event.args)
+        """
+        event_queue = self._subscription_queues.get(subscription_id)
+        if event_queue is None:
+            raise ExInvocationError("Subscription {} has no event queue".format(subscription_id))
+        while True:
+            event = await event_queue.get()
+            if event is None:
+                return
+            yield event
+
+    async def run_handler(self, handler, message):
+        """ Invokes a handler that may or may not be a coroutine function
+        """
+        result = handler(
+                    message,
+                    *(message.args),
+                    **(message.kwargs)
+                )
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def handle_invocation_run(self, handler, message):
+        try:
+            result = handler(
+                        message,
+                        *(message.args),
+                        **(message.kwargs)
+                    )
+
+            # Generators stream their chunks as progressive results when
+            # the caller asked for them. Otherwise the chunks are gathered up
+            if inspect.isgenerator(result) or inspect.isasyncgen(result):
+                if message.details.get('receive_progress'):
+                    await self.send_progress(message, result)
+                    return
+                if inspect.isasyncgen(result):
+                    result = [ chunk async for chunk in result ]
+                else:
+                    result = list(result)
+            elif inspect.isawaitable(result):
+                result = await result
+
+            await self.send_message(YIELD(
+                request_id = message.request_id,
+                options={},
+                args=[result]
+            ))
+        except Exception as ex:
+            exargs = ["Call failed: {}".format(ex)]
+            try:
+                exargs += list(ex.args)
+                message.serializer.dumps(exargs) # Just testing
+            except Exception:
+                exargs = exargs[:1]
+            try:
+                await self.send_message(ERROR(
+                    request_code = WAMP_INVOCATION,
+                    request_id = message.request_id,
+                    details = {},
+                    error = self.get_full_uri('error.invoke.failure'),
+                    args = exargs
+                ))
+            except Exception as ex:
+                logger.error("ERROR attempting to send error message: {}".format(ex))
+
+    async def send_progress(self, message, chunks):
+        """ Sends each chunk as a progressive result followed by
+            an empty final result
+        """
+        if inspect.isasyncgen(chunks):
+            async for chunk in chunks:
+                await self.send_message(YIELD(
+                    request_id = message.request_id,
+                    options={ 'progress': True },
+                    args=[chunk]
+                ))
+        else:
+            for chunk in chunks:
+                await self.send_message(YIELD(
+                    request_id = message.request_id,
+                    options={ 'progress': True },
+                    args=[chunk]
+                ))
+        await self.send_message(YIELD(
+            request_id = message.request_id,
+            options={},
+            args=[]
+        ))
+
+    def task_start(self, coroutine):
+        """ Runs `coroutine` in a task of its own. The event loop only keeps
+            weak references to its tasks so we hold on to them till they're
+            done, otherwise a running handler could be garbage collected
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def handle_event_run(self, handler, event):
+        try:
+            await self.run_handler(handler, event)
+        except Exception as ex:
+            logger.error("Subscription handler failed: {ex}\n{traceback}".format(
+                ex=ex,
+                traceback=traceback.format_exc(),
+            ))
+
+    async def handle_challenge(self, data):
+        """ Executed when the server requests additional
+            authentication
+        """
+        raise ExNotImplemented("Received Challenge but authentication not possible. Need to subclass 'handle_challenge'?")
+
+    async def handle_welcome(self, welcome):
+        self.dispatch_to_awaiting(welcome)
+
+    async def handle_abort(self, reason):
+        self.dispatch_to_awaiting(reason)
+        await self.close()
+
+    async def handle_goodbye(self, goodbye):
+        pass
+
+    async def handle_error(self, error):
+        self._stats['errors'] += 1
+        self.dispatch_to_awaiting(error)
+
+    async def handle_invocation(self, message):
+        self._stats['invocations'] += 1
+        reg_id = message.registration_id
+        if reg_id not in self._registered_calls:
+            await self.send_message(ERROR(
+                request_code = WAMP_INVOCATION,
+                request_id = message.request_id,
+                details = {},
+                error = self.get_full_uri('error.unknown.uri')
+            ))
+            return
+        handler = self._registered_calls[reg_id][REGISTERED_CALL_CALLBACK]
+        self.task_start(self.handle_invocation_run(handler, message))
+
+    async def handle_event(self, event):
+        self._stats['events'] += 1
+        subscription_id = event.subscription_id
+        if subscription_id not in self._subscriptions:
+            return
+        handler = self._subscriptions[subscription_id][SUBSCRIPTION_CALLBACK]
+        if handler:
+            self.task_start(self.handle_event_run(handler, event))
+            return
+
+        event_queue = self._subscription_queues.get(subscription_id)
+        try:
+            event_queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Event queue for subscription {} is full. Dropping event".format(subscription_id))
+
+    async def handle_unknown(self, message):
+        self.dispatch_to_awaiting(message)
+
+    async def run(self):
+        """ Reads and dispatches messages till the transport is closed
+        """
+        try:
+            while self.transport:
+                data = await self.transport.next()
+                if not data:
+                    continue
+                message = WampMessage.load(data)
+                self._stats['messages'] += 1
+                logger.debug(f"<RCV: {message.dump()}")
+                handler_function = getattr(self, "handle_"+message.code_name.lower(), None)
+                try:
+                    if handler_function:
+                        await handler_function(message)
+                    else:
+                        await self.handle_unknown(message)
+                except ExFatalError:
+                    raise
+                except Exception as ex:
+                    logger.error("ERROR in main loop when receiving: {ex}\n{traceback}".format(
+                        ex=ex,
+                        traceback=traceback.format_exc(),
+                    ))
+
+        except ExFatalError as ex:
+            if self._state == STATE_AUTHENTICATING and not self._welcome.done():
+                self._welcome.set_exception(ex)
+        except ExWAMPConnectionError as ex:
+            logger.debug("Transport Exception: {}".format(ex))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.disconnected()
+
+    def disconnected(self):
+        """ Cleans up the state once the transport is gone. Anything
+            awaiting a response gets a GOODBYE
+        """
+        self._state = STATE_DISCONNECTED
+        self.transport = None
+        for request_id, future in list(self._requests_pending.items()):
+            if not future.done():
+                future.set_result(GOODBYE(
+                          details={},
+                          reason="wamp.error.system_shutdown"
+                        ))
+        self._requests_pending = {}
+        if self._welcome is not None and not self._welcome.done():
+            self._welcome.set_exception(ExWAMPConnectionError("WAMP is currently disconnected!"))
+        for event_queue in self._subscription_queues.values():
+            try:
+                event_queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    async def close(self):
+        """ Say goodbye and close the transport
+        """
+        transport = self.transport
+        if not transport:
+            return
+        try:
+            if self._state == STATE_CONNECTED:
+                await self.send_message(GOODBYE(
+                      details={},
+                      reason="wamp.error.system_shutdown"
+                    ))
+        except Exception as ex:
+            logger.debug("Could not send Goodbye message because {}".format(ex))
+        try:
+            await transport.close()
+        except Exception as ex:
+            logger.debug("Could not close transport because: {}".format(ex))
+
+        # When the router aborts, we're called from within the reader task
+        # which can't wait on itself. It stops once the transport is gone
+        current_task = asyncio.current_task()
+        if self._reader_task is not None and self._reader_task is not current_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+        self._reader_task = None
+
+        # Handlers still running have no one left to answer to
+        for task in list(self._tasks or ()):
+            if task is not current_task:
+                task.cancel()
+        self.disconnected()
+
+    shutdown = close
+
+    async def __aenter__(self):
+        if self._state == STATE_DISCONNECTED:
+            await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+class AsyncWAMPClientTicket(AsyncWAMPClient):
+    username = None
+    password = None
+
+    def __init__(
+                self,
+                password=None,
+                username=None,
+                **kwargs
+                ):
+        if not kwargs.get('authmethods'):
+            kwargs['authmethods'] = ['ticket']
+        super(AsyncWAMPClientTicket,self).__init__(**kwargs)
+        self.configure(
+            password = password,
+            username = username,
+        )
+
+    def configure(self, **kwargs):
+        # Just alias username to make things "easier"
+        if 'username' in kwargs:
+            kwargs.setdefault('authid',kwargs['username'])
+
+        super(AsyncWAMPClientTicket,self).configure(**kwargs)
+        for k in ('password',):
+            if k in kwargs:
+                setattr(self,k,kwargs[k])
+
+    async def handle_challenge(self, data):
+        """ Executed when the server requests additional
+            authentication
+        """
+        if not isinstance(self.password, str):
+            raise ExFatalError("No password provided for authentication")
+
+        await self.send_message(AUTHENTICATE(
+            signature = self.password,
+            extra = {}
+        ))
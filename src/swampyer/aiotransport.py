@@ -0,0 +1,269 @@
+import re
+import os
+import ssl
+import asyncio
+
+HAS_ASYNC_WEBSOCKETS_LIBRARY = False
+if not os.getenv('SWAMPYER_DISABLE_ALT_WEBSOCKETS_LIBRARY'):
+    try:
+        import websockets.exceptions as wse
+        try:
+            from websockets.asyncio.client import connect as ws_connect
+            WEBSOCKETS_LEGACY = False
+
+        # websockets<13 only has what is now known as the legacy client
+        except ImportError:
+            from websockets.client import connect as ws_connect
+            WEBSOCKETS_LEGACY = True
+        HAS_ASYNC_WEBSOCKETS_LIBRARY = True
+    except:
+        pass
+
+from .common import *
+from .messages import *
+from .exceptions import *
+from .serializers import *
+from .transport import (
+    rawsocket_handshake,
+    rawsocket_handshake_parse,
+    rawsocket_frame,
+    rawsocket_header_parse,
+)
+
+ASYNC_TRANSPORT_REGISTRY = {}
+
+def register_async_transport(code):
+    def register(klass):
+        ASYNC_TRANSPORT_REGISTRY[code] = klass
+        return klass
+    return register
+
+
+class AsyncTransport(object):
+    """ The asyncio counterpart to transport.Transport. Methods that
+        touch the network are coroutines
+    """
+    def __init__(self, url, serializers=None, **options):
+        self.url = url
+        self.serializer = None
+        if not serializers:
+            serializers = available_serializers()
+        self.serializers = serializers
+        self.init(**options)
+
+    def init(self, **options):
+        pass
+
+    async def connect(self):
+        raise ExNotImplemented("connect is not implemented")
+
+    async def send(self, payload):
+        raise ExNotImplemented("send is not implemented")
+
+    async def send_message(self, message: WampMessage, max_payload_size: int):
+        """ Used by the client to send a message object. Serializes to
+            the negotiated format before sending it on.
+        """
+        payload = self.serializer.dumps(message.package())
+        if max_payload_size:
+            payload_length = len(payload)
+            if payload_length > max_payload_size:
+                raise ExMessageOversized(
+                            f"Message {message.debug_snippet()} size {payload_length} exceeds "
+                            f"maximum packet size of {max_payload_size} bytes"
+                        )
+        await self.send(payload)
+
+    async def close(self):
+        raise ExNotImplemented("close is not implemented")
+
+    async def next(self):
+        """ Returns the next deserialized message or None if the
+            frame did not hold one
+        """
+        raise ExNotImplemented("next is not implemented")
+
+
+class AsyncRawsocketTransport(AsyncTransport):
+    """ Rawsocket over asyncio streams. Shares the framing with
+        transport.RawsocketTransport
+    """
+    buffer_size = 0xf
+    server_buffer_size = 0
+    reader = None
+    writer = None
+
+    async def open_connection(self):
+        raise ExNotImplemented("open_connection is not implemented")
+
+    async def perform_handshake(self, serializer_code):
+        self.writer.write(rawsocket_handshake(serializer_code, self.buffer_size))
+        await self.writer.drain()
+        try:
+            server_handshake = await self.reader.readexactly(4)
+        except asyncio.IncompleteReadError as ex:
+            raise ExWAMPConnectionError("Server closed connection during handshake")
+        self.server_buffer_size = rawsocket_handshake_parse(server_handshake, serializer_code)
+        self.serializer = load_serializer(serializer_code)
+        return True
+
+    async def connect(self):
+        self.reader, self.writer = await self.open_connection()
+        for serializer_code in self.serializers:
+            if await self.perform_handshake(serializer_code):
+                break
+
+    async def send(self, payload, message_type=RAWSOCKET_MESSAGE_TYPE_REGULAR):
+        try:
+            self.writer.write(rawsocket_frame(payload, message_type))
+            await self.writer.drain()
+        except ConnectionError as ex:
+            raise ExWAMPConnectionError(ex)
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+    async def next(self):
+        try:
+            header = await self.reader.readexactly(4)
+            message_type, message_length = rawsocket_header_parse(header)
+            message_payload = await self.reader.readexactly(message_length)
+        except (asyncio.IncompleteReadError, ConnectionError) as ex:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+
+        # Pings and pongs aren't supported by crossbar (see the note
+        # in RawsocketTransport) so we only deal with regular messages
+        if message_type != RAWSOCKET_MESSAGE_TYPE_REGULAR:
+            return
+        if not message_payload:
+            return
+        return self.serializer.loads(message_payload)
+
+
+@register_async_transport('unix')
+class AsyncUnixsocketTransport(AsyncRawsocketTransport):
+    socket_path = None
+
+    def init(self, **options):
+        m = re.search(r'unix://(.*)',self.url)
+        if not m:
+            raise ExTransportParseError('Require unix://path syntax for UnixsocketConnections')
+        self.socket_path = m.group(1)
+
+    async def open_connection(self):
+        try:
+            return await asyncio.open_unix_connection(self.socket_path)
+        except OSError as ex:
+            raise ExWAMPConnectionError("Unix Socket '{}' could not be opened: {}".format(self.socket_path, ex))
+
+
+@register_async_transport('tcpip')
+class AsyncTcpipsocketTransport(AsyncRawsocketTransport):
+    host = None
+    port = None
+    ssl_context = None
+
+    def init(self, **options):
+        m = re.search(r'tcpips?://(.*?):(\d+)', self.url)
+        if not m:
+            raise ExTransportParseError(f'Require <{self.url}> tcpip://host:port syntax for Rawsocket Connection')
+        self.host = m.group(1)
+        self.port = int(m.group(2))
+
+    async def open_connection(self):
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+
+
+@register_async_transport('tcpips')
+class AsyncSecureTcpipsocketTransport(AsyncTcpipsocketTransport):
+    def init(self, **options):
+        super(AsyncSecureTcpipsocketTransport, self).init(**options)
+        self.ssl_context = options.get('ssl_context') or ssl.create_default_context()
+
+
+if HAS_ASYNC_WEBSOCKETS_LIBRARY:
+
+    @register_async_transport('ws')
+    @register_async_transport('wss')
+    class AsyncWebsocketTransport(AsyncTransport):
+        """ Websocket transport built on the asyncio client of the
+            `websockets` library
+        """
+        socket = None
+        ssl_context = None
+        user_agent = None
+
+        def init(self, **options):
+            self.subprotocols = []
+            for serializer_code in self.serializers:
+                self.subprotocols.append('wamp.2.{}'.format(serializer_code))
+
+            m = re.search(r'(ws|wss)://([\w\.]+)(:?:(\d+))?',self.url)
+            if not m:
+                raise ExTransportParseError('Require ws://path or wss:// syntax for Websocket')
+            self.protocol = m.group(1).lower()
+
+            if self.protocol == 'wss':
+                self.ssl_context = options.get('ssl_context') or ssl.create_default_context()
+            self.user_agent = options.get('user_agent')
+
+        async def connect(self):
+            headers = {}
+            if self.user_agent:
+                headers['user-agent'] = self.user_agent
+
+            connect_options = dict(
+                subprotocols = self.subprotocols,
+                max_size = 2**32,
+            )
+            if self.ssl_context:
+                connect_options['ssl'] = self.ssl_context
+            if WEBSOCKETS_LEGACY:
+                connect_options['extra_headers'] = headers
+            else:
+                connect_options['additional_headers'] = headers
+
+            try:
+                self.socket = await ws_connect(self.url, **connect_options)
+            except OSError as ex:
+                raise ExWAMPConnectionError(ex)
+
+            serializer_code = self.socket.subprotocol[len('wamp.2.'):]
+            self.serializer = load_serializer(serializer_code)
+
+        async def send(self, payload):
+            try:
+                await self.socket.send(payload)
+            except wse.ConnectionClosed as ex:
+                raise ExWAMPConnectionError(ex)
+
+        async def close(self):
+            if self.socket:
+                await self.socket.close()
+
+        async def next(self):
+            try:
+                data = await self.socket.recv()
+            except wse.ConnectionClosedOK:
+                raise ExWAMPConnectionError("WAMP is currently disconnected!")
+            except wse.ConnectionClosedError as ex:
+                if ex.code == 1002:
+                    raise ExFatalError(*ex.args)
+                raise ExWAMPConnectionError(*ex.args)
+            return self.serializer.loads(data)
+
+
+def get_async_transport(url, **options):
+    ( protocol, junk ) = url.lower().split(':',1)
+    if not protocol:
+        raise ExWAMPConnectionError("Unknown transport protocol for URL: '{}'".format(protocol))
+
+    if protocol not in ASYNC_TRANSPORT_REGISTRY:
+        raise ExWAMPConnectionError("Async transport protocol '{}' not known".format(protocol))
+
+    return ASYNC_TRANSPORT_REGISTRY[protocol](url, **options)
@@ -7,31 +7,90 @@ import time
 import ctypes
 import getpass
 import random
+import itertools
 import pathlib
 import platform
 import threading
 import traceback
 import socket
+import asyncio
+import inspect
+import collections
+import concurrent.futures
 
 from .common import *
 from .messages import *
-from .utils import logger
+from .utils import logger, TimerScheduler
+from .histogram import LatencyHistogram
 from .exceptions import *
 from .transport import get_transport
 #from .serializers import *
-from .queues import ConcurrencyQueue, ConcurrencyRunner
+from .queues import ConcurrencyQueue, ConcurrencyRunner, ByteBudget, \
+                        InlineConcurrencyQueue, shared_queue_get, shared_queue_start
 
 import queue
 
+CLIENT_IDS = itertools.count(1)
+
+# Messages that go to the bulk dispatch lane when `dispatch_lanes` is on.
+# INTERRUPTs have to follow the INVOCATION they're about
+DISPATCH_BULK_CODES = frozenset(( WAMP_EVENT, WAMP_INVOCATION, WAMP_INTERRUPT ))
+
+def agent_string(agent=None):
+    """ Returns the agent string used in the WAMP hellos with the
+        placeholders filled in
+    """
+    if agent is None:
+        agent = "python-swampyer-{swampyer_version}-{platform}-{python_implementation}{python_version} {local_user}@{local_host}:{local_path}"
+    return agent.format(
+               platform = platform.platform(),
+               python_version = platform.python_version(),
+               python_implementation = platform.python_implementation(),
+               swampyer_version = version('swampyer'),
+               local_user = getpass.getuser(),
+               local_host = socket.gethostname(),
+               local_path = pathlib.Path(sys.argv[0]).resolve(),
+            )
+
 class WampInvokeWrapper(ConcurrencyRunner):
     """ Used to put invoke requests on a separate thread
         so we can make WAMP requests while in a WAMP request
     """
-    def __init__(self,handler,message,client):
+    def __init__(self,handler,message,client,options=None,uri=None):
         super(WampInvokeWrapper,self).__init__(handler,message)
         self.client = client
 
+        # The details the procedure was registered with
+        self.options = options or {}
+        self.uri = uri
+        self.payload_size = getattr(message, 'frame_size', 0)
+        self.budget = client._byte_budget
+        self.owner = client.client_name
+
+        # Handlers that run for a long time can check `event.cancelled`
+        # to find out if the caller has given up on them
+        message.cancelled = False
+
+    def cancel(self):
+        self.message.cancelled = True
+        super(WampInvokeWrapper,self).cancel()
+
+    def finished(self, runner_stats):
+        if self.uri:
+            self.client.procedure_stats_record(self.uri, runner_stats)
+
+    def invocation_done(self):
+        """ Called once the final response is about to be sent. Returns
+            a true value if the response should be sent, which is not the
+            case if the invocation was interrupted
+        """
+        self.client._invocations.pop(self.message.request_id, None)
+        return not self.cancelled
+
     def handle_error(self, ex):
+        if not self.invocation_done():
+            return
+
         error_uri = self.client.get_full_uri('error.invoke.failure')
         req_id = self.message.request_id
 
@@ -57,9 +116,45 @@ class WampInvokeWrapper(ConcurrencyRunner):
             logger.error("ERROR attempting to send error message: {}".format(ex))
 
 
+    def handle_result(self, result):
+        if not self.invocation_done():
+            return
+        self.client.send_message(YIELD(
+            request_id = self.message.request_id,
+            options={},
+            args=[result]
+        ))
+
+    def receive_progress(self):
+        """ Returns a true value if the caller asked for progressive results
+        """
+        return self.message.details.get('receive_progress')
+
+    def handle_progress(self, chunk):
+        """ Sends one chunk of a generator handler's output as a
+            progressive result
+        """
+        if self.cancelled:
+            return
+        self.client.send_message(YIELD(
+            request_id = self.message.request_id,
+            options={ 'progress': True },
+            args=[chunk]
+        ))
+
+    def handle_progress_end(self):
+        """ Sends the final, empty, result that closes off a progressive call
+        """
+        if not self.invocation_done():
+            return
+        self.client.send_message(YIELD(
+            request_id = self.message.request_id,
+            options={},
+            args=[]
+        ))
+
     def work(self):
         message = self.message
-        req_id = message.request_id
 
         try:
             result = self.handler(
@@ -67,22 +162,69 @@ class WampInvokeWrapper(ConcurrencyRunner):
                 *(message.args),
                 **(message.kwargs)
             )
-            self.client.send_message(YIELD(
-                request_id = req_id,
-                options={},
-                args=[result]
-            ))
+
+            # Generator handlers stream their chunks as progressive results
+            # if the caller can take them, otherwise the chunks are gathered
+            # up and sent as one result
+            if inspect.isgenerator(result):
+                if not self.receive_progress():
+                    result = list(result)
+                else:
+                    for chunk in result:
+                        if self.cancelled:
+                            break
+                        self.handle_progress(chunk)
+                    self.handle_progress_end()
+                    return
+
+            self.handle_result(result)
+        except Exception as ex:
+            self.handle_error(ex)
+
+    async def work_async(self):
+        message = self.message
+
+        try:
+            result = self.handler(
+                message,
+                *(message.args),
+                **(message.kwargs)
+            )
+
+            if inspect.isasyncgen(result):
+                if not self.receive_progress():
+                    result = [ chunk async for chunk in result ]
+                else:
+                    async for chunk in result:
+                        if self.cancelled:
+                            break
+                        self.handle_progress(chunk)
+                    self.handle_progress_end()
+                    return
+            else:
+                result = await result
+
+            self.handle_result(result)
         except Exception as ex:
             self.handle_error(ex)
 
+    def event_loop(self):
+        return self.client.event_loop()
+
 class WampSubscriptionWrapper(ConcurrencyRunner):
     """ Used to put invoke requests on a separate thread
         so we can make WAMP requests while in a WAMP request
     """
-    def __init__(self,handler,message,client):
+    def __init__(self,handler,message,client,options=None):
         super(WampSubscriptionWrapper,self).__init__(handler, message)
         self.client = client
 
+        # The options the topic was subscribed with
+        self.options = options or {}
+        self.payload_size = getattr(message, 'frame_size', 0)
+        self.budget = client._byte_budget
+        self.owner = client.client_name
+
         # Alias message to event for the sake of clarity
         self.event = message
 
@@ -94,6 +236,509 @@ class WampSubscriptionWrapper(ConcurrencyRunner):
             **(event.kwargs)
         )
 
+    async def work_async(self):
+        event = self.event
+        try:
+            await self.handler(
+                event,
+                *(event.args),
+                **(event.kwargs)
+            )
+
+        # There's no one to report the error back to. Since it's not
+        # running in its own thread, it would otherwise vanish silently
+        except Exception as ex:
+            logger.error("Subscription handler failed: {ex}\n{traceback}".format(
+                ex=ex,
+                traceback=traceback.format_exc(),
+            ))
+
+    def event_loop(self):
+        return self.client.event_loop()
+
+class WampSubscriptionBatchWrapper(WampSubscriptionWrapper):
+    """ Runs a subscription handler once for a list of events. The
+        last event stands in as the runner's message so that queues
+        scheduling on the event details still work
+    """
+    def __init__(self,handler,events,client,options=None):
+        super(WampSubscriptionBatchWrapper,self).__init__(handler,events[-1],client,options)
+        self.events = events
+        self.payload_size = sum( getattr(event, 'frame_size', 0) for event in events )
+
+    def work(self):
+        self.handler(self.events)
+
+    async def work_async(self):
+        try:
+            await self.handler(self.events)
+        except Exception as ex:
+            logger.error("Subscription handler failed: {ex}\n{traceback}".format(
+                ex=ex,
+                traceback=traceback.format_exc(),
+            ))
+
+class SubscriptionBatch(object):
+    """ Accumulates the events of a subscription made with `batch_size`
+        or `batch_window`. The batch is handed to `dispatch` once it holds
+        `batch_size` events or `batch_window` milliseconds after its first
+        event arrived, whichever happens first. `dispatch` is called with
+        the events and whether the batch was flushed from the scheduler's
+        thread, which must not be held up by the handler.
+
+        Batches are dispatched in the order they were taken, one at a
+        time, even when the reader and the scheduler flush at once
+    """
+    def __init__(self, batch_size, batch_window, dispatch, scheduler):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.dispatch = dispatch
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.dispatch_lock = threading.Lock()
+        self.events = []
+        self.ready = collections.deque()
+        self.timer = None
+        self.reset()
+
+    def reset(self):
+        self._stats = {
+            'events': 0,
+            'batches': 0,
+            'flushed_size': 0,
+            'flushed_window': 0,
+            'batch_size_max': 0,
+        }
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+            if not self.batch_size or len(self.events) < self.batch_size:
+                if self.timer is None and self.batch_window:
+                    self.timer = self.scheduler().call_later(
+                                      self.batch_window / 1000.0,
+                                      self.flush,
+                                      'flushed_window',
+                                      True
+                                  )
+                return
+            self.take('flushed_size')
+        self.dispatch_ready(False)
+
+    def flush(self, reason=None, scheduled=False):
+        """ Dispatches whatever has accumulated so far
+        """
+        with self.lock:
+            if not self.events:
+                return
+            self.take(reason)
+        self.dispatch_ready(scheduled)
+
+    def take(self, reason):
+        """ Moves the accumulated events onto the batches ready to be
+            dispatched
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        events = self.events
+        self.events = []
+        self.ready.append(events)
+
+        self._stats['events'] += len(events)
+        self._stats['batches'] += 1
+        if reason:
+            self._stats[reason] += 1
+        if len(events) > self._stats['batch_size_max']:
+            self._stats['batch_size_max'] = len(events)
+
+    def dispatch_ready(self, scheduled):
+        """ Dispatches the batches that are ready, oldest first. If another
+            thread is already dispatching it takes care of ours as well so
+            the scheduler's thread never waits on a handler
+        """
+        while self.dispatch_lock.acquire(blocking=False):
+            try:
+                while True:
+                    with self.lock:
+                        if not self.ready:
+                            break
+                        events = self.ready.popleft()
+                    self.dispatch(events, scheduled)
+            finally:
+                self.dispatch_lock.release()
+
+            # A batch may have been made ready after we last looked but
+            # before the lock was released, in which case it's still ours
+            with self.lock:
+                if not self.ready:
+                    return
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = self._stats.copy()
+            stats['pending'] = len(self.events)
+            stats['batch_size_avg'] = 0
+            if stats['batches']:
+                stats['batch_size_avg'] = stats['events'] / stats['batches']
+            if reset:
+                self.reset()
+        return stats
+
+class DispatchLane(threading.Thread):
+    """ Hands the messages read from the transport to `dispatch` in the
+        order they arrived. Messages `put()` on the lane are handled by
+        its own thread so the reader can get on with the next frame while
+        `handle()` runs them right away in the calling thread instead.
+
+        Keeps track of how many messages are waiting (`depth`), how long
+        they waited since they were read and how long handling them took
+    """
+    def __init__(self, lane_name, dispatch, dispatched=None):
+        super(DispatchLane, self).__init__()
+        self.daemon = True
+        self.lane_name = lane_name
+        self.dispatch = dispatch
+        self.dispatched = dispatched
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.depth = 0
+        self.reset()
+
+    def reset(self):
+        self._stats = {
+            'messages': 0,
+            'errors': 0,
+            'depth_max': 0,
+            'last_reset': time.time(),
+        }
+        self.histograms = {
+            'wait': LatencyHistogram(),
+            'run': LatencyHistogram(),
+        }
+
+    def put(self, message, received=None):
+        """ Queues up the message for the lane's thread. `received` is
+            when it was read, on the monotonic clock
+        """
+        if received is None:
+            received = time.monotonic()
+        with self.lock:
+            self.depth += 1
+            if self.depth > self._stats['depth_max']:
+                self._stats['depth_max'] = self.depth
+        self.queue.put(( message, received ))
+
+    def handle(self, message, received=None):
+        """ Dispatches the message in the current thread and returns
+            what `dispatch` returned
+        """
+        started = time.monotonic()
+        if received is None:
+            received = started
+        try:
+            return self.dispatch(message)
+        except Exception:
+            with self.lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            ended = time.monotonic()
+            with self.lock:
+                self._stats['messages'] += 1
+                self.histograms['wait'].record(started - received)
+                self.histograms['run'].record(ended - started)
+
+    def backlog_count(self):
+        return self.depth
+
+    def shutdown(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            message, received = item
+            try:
+                self.handle(message, received)
+            except Exception as ex:
+                logger.error("ERROR in {} dispatch lane: {ex}\n{traceback}".format(
+                    self.lane_name,
+                    ex=ex,
+                    traceback=traceback.format_exc(),
+                ))
+            with self.lock:
+                self.depth -= 1
+            if self.dispatched:
+                self.dispatched()
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = self._stats.copy()
+            stats['depth'] = self.depth
+            stats['latency'] = {
+                name: histogram.snapshot()
+                for name, histogram in self.histograms.items()
+            }
+            if reset:
+                self.reset()
+                self._stats['depth_max'] = self.depth
+        return stats
+
+class FrameDecoder(threading.Thread):
+    """ Decodes the frames read by the client. Frames of `threshold` bytes
+        or more are decoded on a pool of `workers` threads so the reader
+        can carry on reading while they're worked on. Smaller frames are
+        decoded right away in the reader thread.
+
+        Messages are delivered in the order their frames were read. Frames
+        that arrive while a large one is still being decoded are held back
+        and delivered by the decoder's own thread once it's their turn.
+        Decode times are recorded per message type.
+
+        `decode` is called with the frame and the `source` it was `put()`
+        with. The client passes the transport the frame was read from so
+        frames still held back after a reconnect aren't decoded with the
+        new connection's serializer
+    """
+    def __init__(self, decode, deliver, threshold, workers=2, delivered=None):
+        super(FrameDecoder, self).__init__()
+        self.daemon = True
+        self.decode_frame = decode
+        self.deliver = deliver
+        self.delivered = delivered
+        self.threshold = threshold
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                            max_workers=workers,
+                            thread_name_prefix='swampyer-decode',
+                        )
+        self.pending = collections.deque()
+        self.ready = threading.Condition()
+        self.lock = threading.Lock()
+        self.active = True
+        self.reset()
+
+    def reset(self):
+        self._stats = {
+            'frames': 0,
+            'offloaded': 0,
+            'held': 0,
+            'errors': 0,
+            'pending_max': 0,
+            'last_reset': time.time(),
+        }
+        self.histograms = {}
+
+    def decode(self, frame, source=None):
+        """ Decodes the frame and records how long it took under the
+            type of the message
+        """
+        start = time.monotonic()
+        message = self.decode_frame(frame, source)
+        duration = time.monotonic() - start
+
+        code_name = message.code_name if message is not None else 'UNKNOWN'
+        with self.lock:
+            histogram = self.histograms.get(code_name)
+            if histogram is None:
+                histogram = self.histograms[code_name] = LatencyHistogram()
+            histogram.record(duration)
+        return message
+
+    def put(self, frame, received=None, source=None):
+        """ Takes a frame from the reader. If it could be delivered right
+            away, returns what `deliver` returned, otherwise True
+        """
+        offload = len(frame) >= self.threshold
+        with self.ready:
+            held = bool(self.pending)
+        with self.lock:
+            self._stats['frames'] += 1
+
+        if not offload and not held:
+            return self.deliver(self.decode(frame, source), received)
+
+        if offload:
+            future = self.executor.submit(self.decode, frame, source)
+            with self.lock:
+                self._stats['offloaded'] += 1
+
+        # Small frames are still decoded here, they just have to wait
+        # for the ones in front of them before they can be delivered
+        else:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(self.decode(frame, source))
+            except Exception as ex:
+                future.set_exception(ex)
+            with self.lock:
+                self._stats['held'] += 1
+
+        with self.ready:
+            self.pending.append(( future, received ))
+            pending_count = len(self.pending)
+            self.ready.notify()
+
+        # All the stats are kept under `lock` whichever thread updates them
+        with self.lock:
+            if pending_count > self._stats['pending_max']:
+                self._stats['pending_max'] = pending_count
+        return True
+
+    def backlog_count(self):
+        return len(self.pending)
+
+    def shutdown(self):
+        with self.ready:
+            self.active = False
+            self.ready.notify()
+        self.executor.shutdown(wait=False)
+
+    def run(self):
+        while True:
+            with self.ready:
+                while self.active and not self.pending:
+                    self.ready.wait()
+                if not self.active:
+                    break
+                future, received = self.pending[0]
+
+            try:
+                self.deliver(future.result(), received)
+            except Exception as ex:
+                with self.lock:
+                    self._stats['errors'] += 1
+                logger.error("ERROR delivering decoded frame: {ex}\n{traceback}".format(
+                    ex=ex,
+                    traceback=traceback.format_exc(),
+                ))
+
+            # Only now can the reader deliver frames itself again
+            with self.ready:
+                self.pending.popleft()
+            if self.delivered:
+                self.delivered()
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = self._stats.copy()
+            stats['pending'] = len(self.pending)
+            stats['decode'] = {
+                code_name: histogram.snapshot()
+                for code_name, histogram in self.histograms.items()
+            }
+            if reset:
+                self.reset()
+                self._stats['pending_max'] = len(self.pending)
+        return stats
+
+
+
+CallResult = collections.namedtuple('CallResult', ['index', 'uri', 'result', 'error'])
+CallResult.__doc__ = """ The outcome of one call made by `WAMPClient.call_many()`. `index` is
+    the position of the request in the batch. On failure `result` is None
+    and `error` holds the exception
+"""
+
+class CallOptions(object):
+    """ Per call settings. Passed to `call()`, `call_async()`,
+        `call_stream()` or in the kwargs of a `call_many()` request as
+        the `options` keyword argument.
+
+        - timeout: seconds to wait for the result. Also sent to the router
+            as the WAMP `timeout` option (in milliseconds) so that it can
+            give up on the call as well. Defaults to the client `timeout`
+        - cancel_mode: the CANCEL mode used when the call is abandoned.
+            One of 'skip', 'kill' or 'killnowait'
+        - Any other keyword arguments are added to the CALL options
+    """
+    def __init__(self, timeout=None, cancel_mode='killnowait', **options):
+        self.timeout = timeout
+        self.cancel_mode = cancel_mode
+        self.options = options
+
+    def message_options(self):
+        """ Returns the options to add to the CALL message
+        """
+        options = dict(self.options)
+        if self.timeout:
+            options['timeout'] = int(self.timeout * 1000)
+        return options
+
+class PendingRequest(object):
+    """ An entry in the pending request table. Holds the future the
+        caller is waiting on and an optional resolver that turns the
+        response message into the future's result
+    """
+    __slots__ = ('future', 'resolver')
+
+    def __init__(self, resolver=None):
+        self.future = concurrent.futures.Future()
+        self.resolver = resolver
+
+    def resolve(self, message):
+        """ Settles the future with the response. Responses to requests
+            whose future was cancelled are dropped
+        """
+        if self.future.done():
+            return
+
+        # We didn't ask for progressive results so only the final
+        # result is of interest
+        if message == WAMP_RESULT and message.details.get('progress'):
+            return
+
+        try:
+            if self.resolver:
+                self.future.set_result(self.resolver(message))
+            else:
+                self.future.set_result(message)
+        except concurrent.futures.InvalidStateError:
+            pass
+        except Exception as ex:
+            try:
+                self.future.set_exception(ex)
+            except concurrent.futures.InvalidStateError:
+                pass
+
+
+class PendingStream(object):
+    """ An entry in the pending request table for a call made with
+        `receive_progress`. Progressive results are buffered in a bounded
+        queue. The reader thread never waits on the consumer: once the
+        buffer is full the stream fails and `cancel` is called to send
+        a CANCEL for the call
+    """
+    __slots__ = ('queue', 'cancel', 'closed', 'error')
+
+    def __init__(self, buffer_max, cancel=None):
+        self.queue = queue.Queue(buffer_max or 0)
+        self.cancel = cancel
+        self.closed = False
+        self.error = None
+
+    def resolve(self, message):
+        if self.closed:
+            return
+
+        try:
+            self.queue.put_nowait(message)
+            return
+        except queue.Full:
+            self.closed = True
+
+        # Never hold up a disconnect waiting on the consumer
+        if message == WAMP_GOODBYE:
+            self.error = ExWAMPConnectionError("WAMP is currently disconnected!")
+            return
+
+        self.error = ExStreamOverflow(
+                          "Stream buffer of {} results overflowed".format(self.queue.maxsize)
+                      )
+        if self.cancel:
+            self.cancel()
 
 
 class WAMPClient(threading.Thread):
@@ -111,6 +756,35 @@ class WAMPClient(threading.Thread):
     ping_interval = 3
 
     max_payload_size: int = None
+    stream_buffer_max = 100
+
+    # Backpressure: once `backpressure_high` jobs are waiting across the
+    # concurrency queues, the read loop stops reading from the transport
+    # until they're down to `backpressure_low`, letting TCP flow control
+    # hold back the router. 0 turns it off
+    backpressure_high = 0
+    backpressure_low = None
+    backpressure_pause_max = 5
+
+    # The same again but in payload bytes held by waiting and running jobs
+    backpressure_bytes_high = 0
+    backpressure_bytes_low = None
+
+    # Limit on the payload bytes held by the jobs in all the concurrency
+    # queues put together. 0 means no limit. Individual queues can be
+    # limited with `bytes_max` in their `concurrency_configs`
+    bytes_max = 0
+
+    # With dispatch lanes the EVENTs and INVOCATIONs are handled by a thread
+    # of their own so that the responses to our requests don't get stuck
+    # behind a flood of them. See `message_dispatch`
+    dispatch_lanes = False
+
+    # Frames of `decode_threshold` bytes or more are deserialized on a pool
+    # of `decode_workers` threads rather than in the read loop. 0 keeps all
+    # the decoding in the read loop. See FrameDecoder
+    decode_threshold = 0
+    decode_workers = 2
 
     auto_reconnect = True
 
@@ -123,7 +797,12 @@ class WAMPClient(threading.Thread):
     concurrency_configs = None
     concurrency_strict_naming = False
 
+    # Identifies the client's jobs in the stats of queues shared with
+    # other clients
+    client_name = None
+
     _subscriptions = None
+    _subscription_batches = None
     _registered_calls = None
     _request_loop_notify_restart = None
     _requests_pending = None
@@ -131,14 +810,32 @@ class WAMPClient(threading.Thread):
     _request_shutdown = False
     _state = STATE_DISCONNECTED
     _concurrency_queues = None
+    _concurrency_queues_provided = None
 
     _stats = None
+    _stats_lock = None
+    _procedure_stats = None
 
     _last_ping_time = None
     _last_pong_time = None
     _heartbeat_thread = None
     _stop_heartbeat = False
 
+    _event_loop = None
+    _event_loop_lock = None
+
+    _invocations = None
+    _scheduler = None
+    _scheduler_lock = None
+
+    _backpressure = None
+    _backpressure_paused = False
+
+    _byte_budget = None
+
+    _dispatch_lanes = None
+    _frame_decoder = None
+
     def __init__(
                 self,
                 url='ws://NEXUS_HOST:8080',
@@ -155,6 +852,16 @@ class WAMPClient(threading.Thread):
                 sslopt=None,
                 sockopt=None,
                 max_payload_size=50_000_000,
+                stream_buffer_max=100,
+                backpressure_high=0,
+                backpressure_low=None,
+                backpressure_pause_max=5,
+                backpressure_bytes_high=0,
+                backpressure_bytes_low=None,
+                bytes_max=0,
+                dispatch_lanes=False,
+                decode_threshold=0,
+                decode_workers=2,
                 serializers=None,
                 concurrency_max=None,
                 concurrency_queue_max=None,
@@ -162,26 +869,30 @@ class WAMPClient(threading.Thread):
                 concurrency_configs=None,
                 concurrency_strict_naming=True,
                 concurrency_queues=None,
+                client_name=None,
                 ):
 
         self._state = STATE_DISCONNECTED
 
         # Set up the agent string used in the WAMP hellos
-        if agent is None:
-            agent = "python-swampyer-{swampyer_version}-{platform}-{python_implementation}{python_version} {local_user}@{local_host}:{local_path}"
-        agent = agent.format(
-                   platform = platform.platform(),
-                   python_version = platform.python_version(),
-                   python_implementation = platform.python_implementation(),
-                   swampyer_version = version('swampyer'),
-                   local_user = getpass.getuser(),
-                   local_host = socket.gethostname(),
-                   local_path = pathlib.Path(sys.argv[0]).resolve(),
-                )
+        agent = agent_string(agent)
 
         super(WAMPClient,self).__init__()
         self.daemon = True
         self._request_loop_notify_restart = threading.Condition()
+        self._event_loop_lock = threading.Lock()
+        self._scheduler_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._backpressure = threading.Condition()
+        self._byte_budget = ByteBudget()
+
+        # Queues handed to us are owned by someone else, likely shared
+        # with other clients
+        self._concurrency_queues_provided = dict(concurrency_queues or {})
+        for concurrency_queue in self._concurrency_queues_provided.values():
+            concurrency_queue.shared = True
+        if client_name is None:
+            client_name = 'client-{}'.format(next(CLIENT_IDS))
         if auto_reconnect == True:
             auto_reconnect = 1
         self.configure(
@@ -200,11 +911,22 @@ class WAMPClient(threading.Thread):
             ping_interval = ping_interval,
             serializers = serializers,
             max_payload_size = max_payload_size,
+            stream_buffer_max = stream_buffer_max,
+            backpressure_high = backpressure_high,
+            backpressure_low = backpressure_low,
+            backpressure_pause_max = backpressure_pause_max,
+            backpressure_bytes_high = backpressure_bytes_high,
+            backpressure_bytes_low = backpressure_bytes_low,
+            bytes_max = bytes_max,
+            dispatch_lanes = dispatch_lanes,
+            decode_threshold = decode_threshold,
+            decode_workers = decode_workers,
             concurrency_max = concurrency_max,
             concurrency_queue_max = concurrency_queue_max,
             concurrency_class = concurrency_class,
             concurrency_configs = concurrency_configs,
             concurrency_strict_naming = concurrency_strict_naming,
+            client_name = client_name,
         )
 
     def get_full_uri(self,uri):
@@ -261,7 +983,14 @@ class WAMPClient(threading.Thread):
         logger.debug("Connected to {}".format(self.url))
         if not soft_reset:
             self._subscriptions    = {}
+            self._subscription_batches = {}
             self._registered_calls = {}
+
+            # Other clients may still be using the shared queues so only
+            # our own jobs get dropped from them
+            for concurrency_queue in (self._concurrency_queues or {}).values():
+                if concurrency_queue.shared:
+                    self.concurrency_queue_detach(concurrency_queue)
             self._concurrency_queues = {}
             self._stats = None
 
@@ -275,14 +1004,24 @@ class WAMPClient(threading.Thread):
                 'errors': 0,
                 'last_reset': time.time(),
                 'reconnections': 0,
+                'backpressure_pauses': 0,
+                'backpressure_timeouts': 0,
+                'backpressure_duration': 0,
             }
+            self._procedure_stats = {}
 
             
         # Setup the invoke/subscribe concurrency handlers
         for concurrency_queue in self._concurrency_queues.values():
-            concurrency_queue.reset()
+            if concurrency_queue.shared:
+                concurrency_queue.put_owner_reset(self.client_name)
+            else:
+                concurrency_queue.reset()
 
         self._requests_pending = {}
+        self._invocations = {}
+        self.dispatch_lanes_start()
+        self.frame_decoder_start()
         self._state = STATE_WEBSOCKET_CONNECTED
 
 
@@ -318,19 +1057,93 @@ class WAMPClient(threading.Thread):
             thread.start()
             self.heartbeat_thread = thread
 
-    def stats(self):
+    def event_loop(self):
+        """ Returns the asyncio event loop that `async def` handlers for
+            registrations and subscriptions are run on. The loop is shared
+            by all the handlers and is started on its own thread the first
+            time it's required
+        """
+        with self._event_loop_lock:
+            if self._event_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self.event_loop_run, args=(loop,))
+                thread.daemon = True
+                thread.start()
+                self._event_loop = loop
+        return self._event_loop
+
+    def event_loop_run(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def stats(self, reset=False):
         """ Return the current stats object. Just a simple counter based
             report on what the client has been up to. Adds one parameter
             `timestamp` which holds the current epoch time
+
+            `procedures` holds latency percentiles for each registered
+            URI. If `reset` is true the counters and histograms, including
+            those of the queues, start over after the snapshot is taken
         """
-        stats = self._stats.copy()
+        with self._stats_lock:
+            stats = self._stats.copy()
+            procedures = {}
+            for uri, histograms in self._procedure_stats.items():
+                procedures[uri] = {
+                    name: histogram.snapshot()
+                    for name, histogram in histograms.items()
+                }
+            if reset:
+                for k in self._stats:
+                    self._stats[k] = 0
+                self._stats['last_reset'] = time.time()
+                self._procedure_stats = {}
+
         stats['timestamp'] = time.time()
+        stats['procedures'] = procedures
+        stats['backpressure_paused'] = self._backpressure_paused
+        stats['bytes'] = self._byte_budget.stats(reset=reset)
+        stats['lanes'] = {
+            lane_name: lane.stats(reset=reset)
+            for lane_name, lane in list((self._dispatch_lanes or {}).items())
+        }
+        stats['decoder'] = None
+        if self._frame_decoder is not None:
+            stats['decoder'] = self._frame_decoder.stats(reset=reset)
         queue_stats = {}
-        for queue_name, concurrency_queue in self._concurrency_queues.items():
-            queue_stats[queue_name] = concurrency_queue.stats()
+        for queue_name, concurrency_queue in list(self._concurrency_queues.items()):
+            if reset:
+                queue_stats[queue_name] = concurrency_queue.stats(reset=True)
+            else:
+                queue_stats[queue_name] = concurrency_queue.stats()
         stats['queues'] = queue_stats
+
+        batch_stats = {}
+        for subscription_id, batch in list(self._subscription_batches.items()):
+            topic = self._subscriptions.get(subscription_id, [subscription_id])[SUBSCRIPTION_TOPIC]
+            batch_stats[topic] = batch.stats(reset=reset)
+        stats['batches'] = batch_stats
         return stats
 
+    def procedure_stats_record(self, uri, runner_stats):
+        """ Adds the timings of a completed invocation of `uri` to its
+            histograms
+        """
+        with self._stats_lock:
+            histograms = self._procedure_stats.get(uri)
+            if histograms is None:
+                histograms = self._procedure_stats[uri] = {
+                    'wait': LatencyHistogram(),
+                    'run': LatencyHistogram(),
+                    'total': LatencyHistogram(),
+                }
+            histograms['wait'].record(runner_stats['wait_duration'])
+            histograms['run'].record(runner_stats['run_duration'])
+            histograms['total'].record(runner_stats['total_duration'])
+
     def is_disconnected(self):
         """ returns a true value if the connection is currently dead
         """
@@ -347,16 +1160,30 @@ class WAMPClient(threading.Thread):
                   'serializers', 'auto_reconnect', 'sslopt', 'sockopt',
                   'loop_timeout', 'heartbeat_timeout', 'ping_interval',
                   'max_payload_size',
+                  'stream_buffer_max',
+                  'backpressure_high',
+                  'backpressure_low',
+                  'backpressure_pause_max',
+                  'backpressure_bytes_high',
+                  'backpressure_bytes_low',
+                  'bytes_max',
+                  'dispatch_lanes',
+                  'decode_threshold',
+                  'decode_workers',
                   'concurrency_class',
                   'concurrency_max',
                   'concurrency_queue_max',
                   'concurrency_configs',
-                  'concurrency_strict_naming'
+                  'concurrency_strict_naming',
+                  'client_name',
                   ):
 
             if k in kwargs:
                 setattr(self,k,kwargs[k])
 
+        if 'bytes_max' in kwargs and self._byte_budget is not None:
+            self._byte_budget.bytes_max = kwargs['bytes_max'] or 0
+
     def concurrency_config_get(self, queue_name):
         """ Returns the normalized config for a particular queue
             if available
@@ -371,6 +1198,10 @@ class WAMPClient(threading.Thread):
                 _class: class to use when creating this queue.
                         When required the _class will be invoked with
                         _class( queue_name, **normalized_config )
+
+            _shared: True or a name to use a queue shared with the other
+                        clients in the process. The first client to ask
+                        for it creates it with its config
             }
 
         """
@@ -401,20 +1232,51 @@ class WAMPClient(threading.Thread):
         queue_config = configs.get(queue_name,{})
         config.update(queue_config)
 
+        # The 'inline' queue runs handlers in the reader thread unless
+        # it's been configured to be something else
+        if queue_name == 'inline' and '_class' not in queue_config:
+            config['_class'] = InlineConcurrencyQueue
+
         return config
 
     def concurrency_queue_create(self, queue_name):
-        """ Creates a new ConcurrencyQueue instance
+        """ Creates a new ConcurrencyQueue instance. Queues passed in
+            through `concurrency_queues` or marked `_shared` in their
+            config are looked up instead
         """
+        if queue_name in self._concurrency_queues_provided:
+            concurrency_queue = self._concurrency_queues_provided[queue_name]
+            shared_queue_start(concurrency_queue)
+            return concurrency_queue
+
         concurrency_config = self.concurrency_config_get(queue_name)
+        shared = concurrency_config.pop('_shared', None)
+        if shared:
+            if shared is True:
+                shared = queue_name
+            concurrency_queue = shared_queue_get(shared, **concurrency_config)
+            shared_queue_start(concurrency_queue)
+            return concurrency_queue
+
         klass = concurrency_config['_class']
         concurrency_queue = klass(queue_name, **concurrency_config)
         return concurrency_queue
 
+    def concurrency_queue_detach(self, concurrency_queue):
+        """ Stops using a shared queue. Our waiting jobs are dropped
+        """
+        concurrency_queue.put_owner_reset(self.client_name)
+        try:
+            concurrency_queue.drain_callbacks.remove(self.backpressure_notify)
+        except ValueError:
+            pass
+
     def concurrency_queue_allowed(self, queue_name):
         """ Returns a true value if the concurrency queue is allowed
         """
-        if queue_name in ('default', 'unlimited'):
+        if queue_name in ('default', 'unlimited', 'inline'):
+            return True
+        if queue_name in self._concurrency_queues_provided:
             return True
         if self.concurrency_configs and queue_name in self.concurrency_configs:
             return True
@@ -441,6 +1303,10 @@ class WAMPClient(threading.Thread):
             subscription into a queue that runs immediately regardless of the
             current default concurrency limit globally set.
 
+            If the `queue_name` is `inline`, the handler is run straight away
+            in the client's reader thread (see InlineConcurrencyQueue). Only
+            meant for quick handlers that never wait on the router.
+
             If the `queue_name` has not been defined explicitly by the user
             at instantiation, it will silently create one but use the system
             default queue size
@@ -449,17 +1315,112 @@ class WAMPClient(threading.Thread):
         if not self.concurrency_queue_allowed(queue_name):
             raise ExNotImplemented("{} queue has not been defined!".format(queue_name))
 
-        if queue_name not in self._concurrency_queues:
-            new_queue = self.concurrency_queue_create(queue_name)
-            self._concurrency_queues[queue_name] = new_queue
-        concurrency_queue = self._concurrency_queues[queue_name]
-
-        # Just in case, let's start the queue thread
-        if not concurrency_queue.is_alive():
+        # Shared queues may have been shut down by someone else, in which
+        # case we go back to the registry for a fresh one
+        concurrency_queue = self._concurrency_queues.get(queue_name)
+        if concurrency_queue is not None \
+                and concurrency_queue.shared \
+                and not concurrency_queue.active:
+            concurrency_queue = None
+
+        if concurrency_queue is None:
+            concurrency_queue = self.concurrency_queue_create(queue_name)
+            if self.backpressure_notify not in concurrency_queue.drain_callbacks:
+                concurrency_queue.drain_callbacks.append(self.backpressure_notify)
+            self._concurrency_queues[queue_name] = concurrency_queue
+
+        # Just in case, let's start the queue thread. Shared queues are
+        # started through the registry since other clients may be at it too
+        if concurrency_queue.shared:
+            shared_queue_start(concurrency_queue)
+        elif not concurrency_queue.is_alive():
             concurrency_queue.start()
 
         return concurrency_queue
 
+    def backlog_count(self):
+        """ Returns the number of jobs waiting across all the concurrency
+            queues
+        """
+        count = 0
+        for concurrency_queue in list((self._concurrency_queues or {}).values()):
+            count += concurrency_queue.backlog_count()
+
+        # Messages that haven't made it to a queue yet count as well
+        for lane in list((self._dispatch_lanes or {}).values()):
+            count += lane.backlog_count()
+        if self._frame_decoder is not None:
+            count += self._frame_decoder.backlog_count()
+        return count
+
+    def backpressure_engaged(self):
+        """ Returns a true value if reading from the transport should
+            stop for now
+        """
+        if self.backpressure_high and self.backlog_count() >= self.backpressure_high:
+            return True
+        if self.backpressure_bytes_high and self._byte_budget.current >= self.backpressure_bytes_high:
+            return True
+        return False
+
+    def backpressure_released(self):
+        if self.backpressure_high:
+            low = self.backpressure_low
+            if low is None:
+                low = self.backpressure_high // 2
+            if self.backlog_count() > low:
+                return False
+        if self.backpressure_bytes_high:
+            low = self.backpressure_bytes_low
+            if low is None:
+                low = self.backpressure_bytes_high // 2
+            if self._byte_budget.current > low:
+                return False
+        return True
+
+    def backpressure_notify(self, concurrency_queue=None):
+        """ Invoked by the concurrency queues after they've started
+            waiting jobs. Wakes up the read loop if it's paused
+        """
+        if not self._backpressure_paused:
+            return
+        with self._backpressure:
+            self._backpressure.notify_all()
+
+    def backpressure_wait(self):
+        """ Blocks the read loop while the concurrency queues are
+            saturated. Gives up after `backpressure_pause_max` seconds so
+            that handlers waiting on responses from the router can't
+            deadlock the client
+        """
+        if not self.backpressure_engaged():
+            return
+
+        start = time.monotonic()
+        self._backpressure_paused = True
+        self._stats['backpressure_pauses'] += 1
+        try:
+            with self._backpressure:
+                released = self._backpressure.wait_for(
+                                self.backpressure_released,
+                                self.backpressure_pause_max or None
+                            )
+        finally:
+            self._backpressure_paused = False
+            paused = time.monotonic() - start
+            self._stats['backpressure_duration'] += paused
+
+            # We weren't reading so the pongs weren't either. That's not
+            # the transport's fault
+            if self._last_pong_time:
+                self._last_pong_time += paused
+
+        if not released:
+            self._stats['backpressure_timeouts'] += 1
+            logger.warning("Reading resumed after backpressure pause of {:.1f}s with {} jobs waiting".format(
+                paused, self.backlog_count()
+            ))
+
     def concurrency_queue_run(self, runner, queue_name=None ):
         """ Puts a single runnable into the concurrency queue based upon
             the name of the queue. If no queue_name is provided, defaults
@@ -508,9 +1469,16 @@ class WAMPClient(threading.Thread):
             self._registered_calls = to_register
             raise
 
+        # Batches belong to the old subscription ids. Hand over what they
+        # have collected before the subscriptions are made again
+        for batch in self._subscription_batches.values():
+            batch.flush()
+
         to_subscribe = self._subscriptions
+        to_batch = self._subscription_batches
         try:
             self._subscriptions = {}
+            self._subscription_batches = {}
             for args in to_subscribe.values():
                 self.subscribe(*args)
 
@@ -519,6 +1487,7 @@ class WAMPClient(threading.Thread):
         # we can try again to get the full list subscribed
         except Exception as ex:
             self._subscriptions = to_subscribe
+            self._subscription_batches = to_batch
             raise ex
 
     def handle_leave(self):
@@ -542,8 +1511,20 @@ class WAMPClient(threading.Thread):
         details.setdefault('roles', {
                                         'subscriber': {},
                                         'publisher': {},
-                                        'caller': {},
-                                        'callee': {},
+                                        'caller': {
+                                            'features': {
+                                                'progressive_call_results': True,
+                                                'call_canceling': True,
+                                                'call_timeout': True,
+                                            },
+                                        },
+                                        'callee': {
+                                            'features': {
+                                                'progressive_call_results': True,
+                                                'call_canceling': True,
+                                                'call_timeout': True,
+                                            },
+                                        },
                                     })
         self._state = STATE_AUTHENTICATING
         self.send_message(HELLO(
@@ -574,24 +1555,267 @@ class WAMPClient(threading.Thread):
         self.handle_join(message)
 
     def call(self, uri, *args, **kwargs ):
-        """ Sends a RPC request to the WAMP server
+        """ Sends a RPC request to the WAMP server. A CallOptions instance
+            passed as the `options` keyword argument is not sent to the
+            callee but used to configure the call.
+
+                client.call('com.example.report', 2024, options=CallOptions(timeout=30))
+
+            If no response arrives within the timeout, a CANCEL is sent
+            and ExCallTimeout is raised
+        """
+        request, call_options = self.call_request(uri, args, kwargs)
+        future = self.send_request(request)
+        timeout = call_options.timeout or self.timeout
+        try:
+            message = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.call_cancel(request.request_id, call_options.cancel_mode)
+            raise ExCallTimeout("Did not receive a response!")
+        return self.call_result(message)
+
+    def call_async(self, uri, *args, **kwargs ):
+        """ Sends a RPC request to the WAMP server without blocking. Returns
+            a concurrent.futures.Future that resolves to the result of the
+            call or raises the error the callee returned.
+
+                futures = [ client.call_async('com.example.hello', i) for i in range(100) ]
+                results = [ future.result() for future in futures ]
+
+            Takes the same CallOptions as `call()`. If there's no response
+            within the timeout, the future fails with ExCallTimeout. Calling
+            `future.cancel()` drops the call and sends a CANCEL to the router
+        """
+        request, call_options = self.call_request(uri, args, kwargs)
+        request_id = request.request_id
+        future = self.send_request(request, self.call_result)
+
+        timer = None
+        timeout = call_options.timeout or self.timeout
+        if timeout:
+            timer = self.scheduler().call_later(
+                        timeout,
+                        self.call_expire,
+                        request_id,
+                        call_options.cancel_mode
+                    )
+
+        def call_done(future):
+            if timer:
+                timer.cancel()
+            if future.cancelled():
+                self.call_cancel(request_id, call_options.cancel_mode)
+        future.add_done_callback(call_done)
+
+        return future
+
+    def call_cancel(self, request_id, mode='killnowait'):
+        """ Gives up on a call that is still pending. Sends a CANCEL to the
+            router which will pass an INTERRUPT on to the callee. Returns
+            the pending request entry or None if the call had already
+            completed
+        """
+        pending = self._requests_pending.pop(request_id, None)
+        if pending is None:
+            return None
+        try:
+            self.send_message(CANCEL(
+                request_id = request_id,
+                options = { 'mode': mode },
+            ))
+        except Exception as ex:
+            logger.debug("Could not send cancel for {} because {}".format(request_id, ex))
+        return pending
+
+    def call_expire(self, request_id, mode='killnowait'):
+        """ Invoked by the scheduler when a call made with `call_async()`
+            has timed out
+        """
+        pending = self.call_cancel(request_id, mode)
+        if pending is None:
+            return
+        try:
+            pending.future.set_exception(ExCallTimeout("Did not receive a response!"))
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def scheduler(self):
+        """ Returns the TimerScheduler used for call timeouts. Created
+            on first use
+        """
+        with self._scheduler_lock:
+            if self._scheduler is None:
+                self._scheduler = TimerScheduler()
+            return self._scheduler
+
+    def call_many(self, requests, window=10, ordered=False):
+        """ Pipelines a batch of RPC requests, keeping up to `window` calls
+            in flight at any time. Each request is a uri or a tuple of
+            (uri, args) or (uri, args, kwargs).
+
+            This is a generator that yields a CallResult for each request,
+            in completion order or, if `ordered` is set, in the order the
+            requests were given. Failed calls are reported through the
+            `error` field and do not stop the batch.
+
+                requests = [ ('com.example.device.status', [device]) for device in devices ]
+                for res in client.call_many(requests, window=50):
+                    if res.error:
+                        print(res.index, res.error)
+
+            Each call that does not get a response within the client's
+            `timeout` (or that of a CallOptions passed in the request's
+            kwargs) is reported as failed with ExCallTimeout
+        """
+        if window < 1:
+            raise ValueError("window must be at least 1")
+
+        requests = enumerate(requests)
+        exhausted = False
+        in_flight = {}
+        completed = {}
+        next_index = 0
+
+        try:
+            while True:
+                # Top up the window. When returning results in order, the ones
+                # that are waiting on an earlier call count against the window
+                # as well so the buffer stays bounded
+                while not exhausted and len(in_flight) + len(completed) < window:
+                    try:
+                        index, request = next(requests)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if isinstance(request, str):
+                        request = [request]
+                    uri = request[0]
+                    args = request[1] if len(request) > 1 else []
+                    kwargs = request[2] if len(request) > 2 else {}
+                    try:
+                        future = self.call_async(uri, *args, **(kwargs or {}))
+                        in_flight[future] = (index, uri)
+                    except Exception as ex:
+                        completed[index] = CallResult(index, uri, None, ex)
+
+                if not in_flight and not completed:
+                    return
+
+                if in_flight:
+                    done, not_done = concurrent.futures.wait(
+                                            in_flight,
+                                            return_when=concurrent.futures.FIRST_COMPLETED
+                                        )
+                    for future in done:
+                        index, uri = in_flight.pop(future)
+                        try:
+                            completed[index] = CallResult(index, uri, future.result(), None)
+                        except Exception as ex:
+                            completed[index] = CallResult(index, uri, None, ex)
+
+                if ordered:
+                    while next_index in completed:
+                        yield completed.pop(next_index)
+                        next_index += 1
+                else:
+                    for index in list(completed):
+                        yield completed.pop(index)
+
+        # If the caller stops iterating, the responses that are still
+        # outstanding will be dropped when they arrive
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def call_stream(self, uri, *args, **kwargs ):
+        """ Sends a RPC request asking for progressive results. This is a
+            generator that yields the first argument of each progressive
+            RESULT as it arrives followed by that of the final RESULT, if the
+            final RESULT carries one.
+
+                for row in client.call_stream('com.example.export', 'table'):
+                    write(row)
+
+            At most `stream_buffer_max` results are buffered. If a result
+            arrives while the buffer is full, the stream fails with
+            ExStreamOverflow once the buffered results have been handed out
+            and the call is cancelled. The reader thread doesn't wait for
+            the consumer so other calls aren't held up by a slow stream.
+
+            ExCallTimeout is raised if no result arrives within `timeout`.
+            A CallOptions `timeout` also bounds the wait for each result
+            rather than the whole call so it isn't passed on to the router.
+            Streams that fail or are closed early send a CANCEL to the
+            router
+        """
+        request, call_options = self.call_request(uri, args, kwargs)
+        request.options['receive_progress'] = True
+        request.options.pop('timeout', None)
+        timeout = call_options.timeout or self.timeout
+
+        request_id = request.request_id
+        stream = PendingStream(
+                      self.stream_buffer_max,
+                      lambda: self.call_cancel(request_id, call_options.cancel_mode),
+                  )
+        self._requests_pending[request_id] = stream
+        try:
+            self.send_message(request)
+            while True:
+                # Once the stream has failed, hand out what was buffered
+                # before the failure then raise
+                try:
+                    if stream.error:
+                        message = stream.queue.get_nowait()
+                    else:
+                        message = stream.queue.get(timeout=timeout)
+                except queue.Empty:
+                    raise stream.error or ExCallTimeout("Did not receive a response!")
+
+                if message == WAMP_RESULT:
+                    if message.args:
+                        yield message.args[0]
+                    if not message.details.get('progress'):
+                        return
+                else:
+                    self.call_result(message)
+                    return
+
+        finally:
+            stream.closed = True
+            self.call_cancel(request_id, call_options.cancel_mode)
+
+    def call_request(self, uri, args, kwargs):
+        """ Builds the CALL message for `call()` and friends. Returns
+            the message along with the CallOptions for the call
         """
         if self._state == STATE_DISCONNECTED:
             raise ExWAMPConnectionError("WAMP is currently disconnected!")
 
+        call_options = kwargs.get('options')
+        if isinstance(call_options, CallOptions):
+            kwargs = dict(kwargs)
+            del kwargs['options']
+        else:
+            call_options = CallOptions()
+
         self._stats['calls'] += 1
 
         options = {
             'disclose_me': True
         }
-        uri = self.get_full_uri(uri)
-        message = self.send_and_await_response(CALL(
-                      options=options,
-                      procedure=uri,
-                      args=args,
-                      kwargs=kwargs
-                    ))
-
+        options.update(call_options.message_options())
+        return CALL(
+                  options=options,
+                  procedure=self.get_full_uri(uri),
+                  args=args,
+                  kwargs=kwargs
+                ), call_options
+
+    def call_result(self, message):
+        """ Converts the response to a CALL into the value returned
+            to the caller
+        """
         if message == WAMP_RESULT:
             return message.args[0]
 
@@ -602,6 +1826,9 @@ class WAMPClient(threading.Thread):
                 err = [message.error]
             raise ExInvocationError(*err)
 
+        if message == WAMP_GOODBYE:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+
         return message
 
     def receive_message(self, data):
@@ -609,8 +1836,101 @@ class WAMPClient(threading.Thread):
             it into a WampMessage
         """
         message = WampMessage.load(data)
+
+        # Remember how big the message was on the wire. Good enough as an
+        # estimate of the memory it takes up once decoded
+        if message is not None and self.transport:
+            message.frame_size = self.transport.last_frame_size
+        return message
+
+    def frame_decode(self, frame, transport=None):
+        """ Turns a frame from `transport.next_frame()` into a WampMessage.
+            Called by the decode workers for large frames
+        """
+        transport = transport or self.transport
+        if not transport:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+        message = self.receive_message(transport.decode(frame))
+        if message is not None:
+            message.frame_size = len(frame)
         return message
 
+    def message_deliver(self, message, received=None):
+        """ Takes a message that has just been read (and decoded) and
+            passes it on to `message_dispatch`. With a FrameDecoder this
+            runs in both the reader and the decoder threads
+        """
+        with self._stats_lock:
+            self._stats['messages'] += 1
+        if not message:
+            logger.debug("<RCV: ErrorNone")
+        else:
+            logger.debug(f"<RCV: {message.dump()}")
+        return self.message_dispatch(message, received)
+
+    def message_handle(self, message):
+        """ Hands the message to the matching handle_XXX method. Returns
+            a false value if it had to go to handle_unknown
+        """
+        try:
+            code_name = message.code_name.lower()
+            handler_name = "handle_"+code_name
+            handler_function = getattr(self, handler_name)
+            handler_function(message)
+            return True
+
+        # Attribute error is not an error. In this case, we're probably calling
+        # something like handle_published() or any of the optional handle_XXX
+        # functionality. We can define as we go and if there is nothing defined
+        # it should go to handle_unknown which is perfectly normal behaviour
+        except AttributeError as ex:
+            self.handle_unknown(message)
+            return False
+
+    def message_dispatch(self, message, received=None):
+        """ Called by the read loop with each message. Without dispatch
+            lanes it's handled right away. With them, EVENTs, INVOCATIONs
+            and INTERRUPTs go to the 'bulk' lane's thread while everything
+            else, the responses our requests are waiting on in particular,
+            is still handled right away on the 'control' lane
+        """
+        lanes = self._dispatch_lanes
+        if not lanes or message is None:
+            return self.message_handle(message)
+        if message.code in DISPATCH_BULK_CODES:
+            lanes['bulk'].put(message, received)
+            return True
+        return lanes['control'].handle(message, received)
+
+    def dispatch_lanes_start(self):
+        """ Sets up the dispatch lanes if `dispatch_lanes` is on. They
+            carry on across reconnects
+        """
+        if not self.dispatch_lanes or self._dispatch_lanes:
+            return
+        control = DispatchLane('control', self.message_handle)
+        bulk = DispatchLane('bulk', self.message_handle, self.backpressure_notify)
+        bulk.start()
+        self._dispatch_lanes = {
+            'control': control,
+            'bulk': bulk,
+        }
+
+    def frame_decoder_start(self):
+        """ Sets up the FrameDecoder if `decode_threshold` is set. It
+            carries on across reconnects
+        """
+        if not self.decode_threshold or self._frame_decoder:
+            return
+        self._frame_decoder = FrameDecoder(
+                                  self.frame_decode,
+                                  self.message_deliver,
+                                  self.decode_threshold,
+                                  self.decode_workers,
+                                  self.backpressure_notify,
+                              )
+        self._frame_decoder.start()
+
     def send_message(self,message):
         """ Send awamp message to the server. We don't wait
             for a response here. Just fire out a message
@@ -622,19 +1942,33 @@ class WAMPClient(threading.Thread):
         logger.debug("SND>: {}".format(message.dump()))
         self.transport.send_message(message, max_payload_size=self.max_payload_size)
 
-    def send_and_await_response(self,request):
-        """ Used by most things. Sends out a request then awaits a response
-            keyed by the request_id
+    def send_request(self, request, resolver=None):
+        """ Sends out a request and returns a concurrent.futures.Future
+            that gets resolved when the response keyed by the request_id
+            arrives. If provided, `resolver` is called with the response
+            message to produce the future's result
         """
         if self._state == STATE_DISCONNECTED:
             raise ExWAMPConnectionError("WAMP is currently disconnected!")
-        wait_queue = queue.Queue()
+        pending = PendingRequest(resolver)
         request_id = request.request_id
-        self._requests_pending[request_id] = wait_queue;
-        self.send_message(request)
+        self._requests_pending[request_id] = pending
         try:
-            res = wait_queue.get(block=True,timeout=self.timeout)
-        except queue.Empty as ex:
+            self.send_message(request)
+        except Exception:
+            self._requests_pending.pop(request_id, None)
+            raise
+        return pending.future
+
+    def send_and_await_response(self,request):
+        """ Used by most things. Sends out a request then awaits a response
+            keyed by the request_id
+        """
+        future = self.send_request(request)
+        try:
+            res = future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError as ex:
+            self._requests_pending.pop(request.request_id, None)
             raise ExWAMPConnectionError("Did not receive a response!")
         if isinstance(res, GOODBYE):
             raise ExWAMPConnectionError("WAMP is currently disconnected!")
@@ -657,9 +1991,6 @@ class WAMPClient(threading.Thread):
 
         try:
             request_id = result.request_id
-            if request_id in self._requests_pending:
-                self._requests_pending[request_id].put(result)
-            del self._requests_pending[request_id]
         except:
             raise ExWAMPConnectionError(
                         "Response does not have a request id. Do not know who to send data to. Data: {} ".format(
@@ -667,6 +1998,15 @@ class WAMPClient(threading.Thread):
                             )
                         )
 
+        # Progressive results leave the request pending till the
+        # final result arrives
+        if result == WAMP_RESULT and result.details.get('progress'):
+            pending = self._requests_pending.get(request_id)
+        else:
+            pending = self._requests_pending.pop(request_id, None)
+        if pending is not None:
+            pending.resolve(result)
+
     def handle_welcome(self, welcome):
         """ Hey cool, we were told we can access the server!
         """
@@ -714,11 +2054,15 @@ class WAMPClient(threading.Thread):
         reg_id = message.registration_id
         if reg_id in self._registered_calls:
             handler = self._registered_calls[reg_id][REGISTERED_CALL_CALLBACK]
+            details = self._registered_calls[reg_id][REGISTERED_CALL_DETAILS]
             queue_name = self._registered_calls[reg_id][REGISTERED_CALL_QUEUE_NAME]
-            runner = WampInvokeWrapper(handler,message,self)
+            uri = self._registered_calls[reg_id][REGISTERED_CALL_URI]
+            runner = WampInvokeWrapper(handler,message,self,details,uri)
+            self._invocations[req_id] = ( runner, queue_name )
             try:
                 self.concurrency_queue_run(runner,queue_name)
             except Exception as ex:
+                self._invocations.pop(req_id, None)
                 error_uri = self.get_full_uri('error.invoke.failed')
                 self.send_message(ERROR(
                     request_code = WAMP_INVOCATION,
@@ -736,19 +2080,55 @@ class WAMPClient(threading.Thread):
                 error = error_uri
             ))
 
+    def handle_interrupt(self, message):
+        """ The caller has given up on an invocation. The runner gets
+            marked as cancelled, taken off the waitlist if it's still
+            waiting, and anything it sends from now on is dropped
+        """
+        invocation = self._invocations.pop(message.request_id, None)
+        if invocation is None:
+            return
+
+        runner, queue_name = invocation
+        runner.cancel()
+        try:
+            self.concurrency_queue_get(queue_name or 'default').put_cancel(runner)
+        except Exception as ex:
+            logger.warning("Could not cancel invocation {} because {}".format(message.request_id, ex))
+
+        # With 'killnowait' the router has already answered the caller
+        if message.options.get('mode') == 'killnowait':
+            return
+
+        self.send_message(ERROR(
+            request_code = WAMP_INVOCATION,
+            request_id = message.request_id,
+            details = {},
+            error = 'wamp.error.canceled',
+        ))
+
     def handle_event(self, event):
         """ Send the event to the subclass or simply reject
         """
         self._stats['events'] += 1
         subscription_id = event.subscription_id
-        if subscription_id in self._subscriptions:
+        batch = self._subscription_batches.get(subscription_id)
+        if batch is not None:
+            batch.add(event)
+        elif subscription_id in self._subscriptions:
             handler = self._subscriptions[subscription_id][SUBSCRIPTION_CALLBACK]
+            options = self._subscriptions[subscription_id][SUBSCRIPTION_QUEUE_OPTIONS]
             queue_name = self._subscriptions[subscription_id][SUBSCRIPTION_QUEUE_NAME]
-            runner = WampSubscriptionWrapper(handler,event,self)
+            conflate = self._subscriptions[subscription_id][SUBSCRIPTION_CONFLATE]
+            conflate_key = self._subscriptions[subscription_id][SUBSCRIPTION_CONFLATE_KEY]
+            runner = WampSubscriptionWrapper(handler,event,self,options)
 
             # Since this is a subscription event, we will merely dispose
             # the error right now. 
             try:
+                if conflate or conflate_key:
+                    key = conflate_key(event) if conflate_key else None
+                    runner.conflation_key = ( subscription_id, key )
                 self.concurrency_queue_run(runner, queue_name)
             except Exception as ex:
                 logger.warning(
@@ -764,8 +2144,47 @@ class WAMPClient(threading.Thread):
         """
         self.dispatch_to_awaiting(message)
 
-    def subscribe(self,topic,callback=None,options=None,concurrency_queue=None):
+    def subscription_batch_run(self, handler, events, options=None, queue_name=None,
+                                     scheduled=False):
+        """ Sends a batch of events of a batched subscription to the
+            handler via the concurrency queue. Batches flushed by the
+            `batch_window` timer are `scheduled`. Those must not run in the
+            scheduler's thread so an 'inline' queue gives them a thread of
+            their own
+        """
+        runner = WampSubscriptionBatchWrapper(handler, events, self, options)
+        try:
+            concurrency_queue = self.concurrency_queue_get(queue_name or 'default')
+            if scheduled and isinstance(concurrency_queue, InlineConcurrencyQueue):
+                concurrency_queue.put_threaded(runner)
+            else:
+                concurrency_queue.put(runner)
+        except Exception as ex:
+            logger.warning(
+                "Subscription batch of {} events failed because {ex}".format(
+                  len(events),
+                  ex = str(ex)
+                )
+            )
+
+    def subscribe(self,topic,callback=None,options=None,concurrency_queue=None,
+                        batch_size=None,batch_window=None,
+                        conflate=False,conflate_key=None):
         """ Subscribe to a uri for events from a publisher
+
+            With `batch_size` (number of events) and/or `batch_window`
+            (milliseconds) the events are collected and `callback` is
+            invoked with a list of EVENT messages, once the batch is full
+            or once the window after the first event of the batch has
+            passed. Each message has the usual `args` and `kwargs`
+
+            With `conflate` only the most recent event that is waiting in
+            the concurrency queue is kept, older ones are dropped and
+            counted as `superseded` in the queue stats. `conflate_key`
+            is called with the EVENT message and returns the key that
+            events are conflated by (eg. a device id) so the latest event
+            for each key is kept. Only events that have to wait for the
+            queue are affected
         """
         # If a concurrency queue is requested, check the queue if required
         if concurrency_queue and not self.concurrency_queue_allowed(concurrency_queue):
@@ -780,13 +2199,32 @@ class WAMPClient(threading.Thread):
             if not callback:
                 def callback(_):
                     return None
-            self._subscriptions[result.subscription_id] = [topic, callback, options,  concurrency_queue]
+            self._subscriptions[result.subscription_id] = [
+                topic, callback, options,  concurrency_queue, batch_size, batch_window,
+                conflate, conflate_key
+            ]
+            if batch_size or batch_window:
+                self._subscription_batches[result.subscription_id] = SubscriptionBatch(
+                    batch_size,
+                    batch_window,
+                    lambda events, scheduled: self.subscription_batch_run(
+                                        callback, events, options, concurrency_queue,
+                                        scheduled
+                                    ),
+                    self.scheduler,
+                )
         return result
 
     def unsubscribe(self, subscription_id):
         """ Unsubscribe an existing subscription
         """
         result = self.send_and_await_response(UNSUBSCRIBE(subscription_id=subscription_id))
+
+        # Don't lose the events that were already received
+        batch = self._subscription_batches.pop(subscription_id, None)
+        if batch is not None:
+            batch.flush()
+
         try:
             del self._subscriptions[subscription_id]
         except IndexError:
@@ -798,29 +2236,49 @@ class WAMPClient(threading.Thread):
     def publish(self,topic,options=None,args=None,kwargs=None):
         """ Publishes a messages to the server
         """
-        self._stats['publications'] += 1
-        topic = self.get_full_uri(topic)
-        if options is None:
-            options = {'acknowledge':True}
-        if options.get('acknowledge'):
-            request = PUBLISH(
-                        options=options or {},
-                        topic=topic,
-                        args=args or [],
-                        kwargs=kwargs or {}
-                      )
+        request = self.publish_request(topic, options, args, kwargs)
+        if request.options.get('acknowledge'):
             result = self.send_and_await_response(request)
             return result
         else:
-            request = PUBLISH(
-                        options=options or {},
-                        topic=topic,
-                        args=args or [],
-                        kwargs=kwargs or {}
-                      )
             self.send_message(request)
             return None
 
+    def publish_async(self,topic,options=None,args=None,kwargs=None):
+        """ Publishes a messages to the server without blocking. Returns
+            a concurrent.futures.Future that resolves to the PUBLISHED (or
+            ERROR) response. Unacknowledged publications return a future
+            that has already resolved to None
+        """
+        request = self.publish_request(topic, options, args, kwargs)
+        if request.options.get('acknowledge'):
+            return self.send_request(request, self.publish_result)
+        self.send_message(request)
+        future = concurrent.futures.Future()
+        future.set_result(None)
+        return future
+
+    def publish_request(self,topic,options,args,kwargs):
+        """ Builds the PUBLISH message for `publish()` and `publish_async()`
+        """
+        self._stats['publications'] += 1
+        if options is None:
+            options = {'acknowledge':True}
+        return PUBLISH(
+                    options=options,
+                    topic=self.get_full_uri(topic),
+                    args=args or [],
+                    kwargs=kwargs or {}
+                  )
+
+    def publish_result(self, message):
+        """ Converts the response to an acknowledged PUBLISH into the
+            value returned to the publisher
+        """
+        if message == WAMP_GOODBYE:
+            raise ExWAMPConnectionError("WAMP is currently disconnected!")
+        return message
+
     def disconnect(self):
         """ Disconnect from the transport and pause the process
             till we reconnect
@@ -855,16 +2313,23 @@ class WAMPClient(threading.Thread):
         # Send a message to all queues that we have disconnected
         # Without this, any requests that are awaiting a response
         # will block until timeout needlessly
-        for request_id, request_queue in self._requests_pending.items():
-            request_queue.put(GOODBYE(
-                          details={},
-                          reason="wamp.error.system_shutdown"
-                        ))
-        self._requests_pending = {}
+        self.abort_pending_requests()
         self._last_ping_time = None
         self._last_pong_time = None
         self.handle_disconnect()
 
+    def abort_pending_requests(self):
+        """ Resolves everything in the pending request table with a
+            GOODBYE so nobody waits on a response that will never come
+        """
+        requests_pending = self._requests_pending or {}
+        self._requests_pending = {}
+        for request_id, pending in requests_pending.items():
+            pending.resolve(GOODBYE(
+                          details={},
+                          reason="wamp.error.system_shutdown"
+                        ))
+
     def shutdown(self):
         """ Request the system to shutdown the main loop and shutdown the system
             This is a one-way trip! Reconnecting requires a new connection
@@ -875,9 +2340,33 @@ class WAMPClient(threading.Thread):
         # Shutdown any responses pending
         if self._concurrency_queues:
             for concurrency_queue in self._concurrency_queues.values():
-                concurrency_queue.active = False
+                if concurrency_queue.shared:
+                    self.concurrency_queue_detach(concurrency_queue)
+                else:
+                    concurrency_queue.shutdown()
             self._concurrency_queues = None
 
+        # Stop the dispatch threads
+        if self._dispatch_lanes:
+            for lane in self._dispatch_lanes.values():
+                lane.shutdown()
+            self._dispatch_lanes = None
+        if self._frame_decoder is not None:
+            self._frame_decoder.shutdown()
+            self._frame_decoder = None
+
+        # Stop the timers
+        with self._scheduler_lock:
+            if self._scheduler is not None:
+                self._scheduler.shutdown()
+                self._scheduler = None
+
+        # Stop the loop that runs any coroutine handlers
+        with self._event_loop_lock:
+            if self._event_loop is not None:
+                self._event_loop.call_soon_threadsafe(self._event_loop.stop)
+                self._event_loop = None
+
         # Trigger an exception in the reading thread so we can stop the
         # read loop faster
         try:
@@ -937,7 +2426,12 @@ class WAMPClient(threading.Thread):
         """ Puts a function on the bus.
 
             - uri: ustring URI to put on the bus
-            - callback: method invoked to respond to any calls made to URI
+            - callback: method invoked to respond to any calls made to URI.
+                May also be an `async def` function in which case it gets run
+                on the client's shared event loop (see `event_loop`). Generators
+                and async generators send each chunk they yield as a progressive
+                result when the caller asked for them and a list of all the
+                chunks otherwise
             - details: dict of options
             - concurrency_queue: string. By default a queue for each registration is used
                 The maximum sizes of the concurrency queues are set the session attribute
@@ -1015,12 +2509,23 @@ class WAMPClient(threading.Thread):
                                   self.heartbeat_timeout
                               )
 
-                # Okay, we think we're okay so let's try and read some data
-                data = self.transport.next()
+                # Hold off on reading more while the queues catch up
+                if self._state == STATE_CONNECTED:
+                    self.backpressure_wait()
+
+                # Okay, we think we're okay so let's try and read some data.
+                # The decoder wants the frames before they're deserialized
+                transport = self.transport
+                if self._frame_decoder is not None:
+                    data = transport.next_frame()
+                else:
+                    data = transport.next()
                 if not data: continue
+                received = time.monotonic()
 
             except ExShutdown:
                 self._state = STATE_DISCONNECTED
+                self.abort_pending_requests()
                 return
             except ExFatalError as ex:
                 if self._state == STATE_AUTHENTICATING:
@@ -1057,29 +2562,15 @@ class WAMPClient(threading.Thread):
 
             try:
                 logger.debug("<RCV: {}".format(data))
-                message = self.receive_message(data)
-                self._stats['messages'] += 1
-                if not message:
-                    logger.debug("<RCV: ErrorNone")
+                if self._frame_decoder is not None:
+                    handled = self._frame_decoder.put(data, received, transport)
                 else:
-                    logger.debug(f"<RCV: {message.dump()}")
-                try:
-                    code_name = message.code_name.lower()
-                    handler_name = "handle_"+code_name
-                    handler_function = getattr(self, handler_name)
-                    handler_function(message)
+                    handled = self.message_deliver(self.receive_message(data), received)
 
+                if handled:
                     # Reset the counter
                     consecutive_error_count = 0
 
-                # Attribute error is not an error. In this case, we're probably calling
-                # something like handle_published() or any of the optional handle_XXX
-                # functionality. We can define as we go and if there is nothing defined
-                # it should go to handle_unknown which is perfectly normal behaviour
-                # So: this should not have a "consecutive_error_count += 1"
-                except AttributeError as ex:
-                    self.handle_unknown(message)
-
             except ExFatalError as ex:
                 if self._state == STATE_AUTHENTICATING:
                     self._welcome_queue.put(ex)
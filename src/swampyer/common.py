@@ -13,6 +13,10 @@ SUBSCRIPTION_TOPIC = 0
 SUBSCRIPTION_CALLBACK = 1
 SUBSCRIPTION_QUEUE_OPTIONS = 2
 SUBSCRIPTION_QUEUE_NAME= 3
+SUBSCRIPTION_BATCH_SIZE = 4
+SUBSCRIPTION_BATCH_WINDOW = 5
+SUBSCRIPTION_CONFLATE = 6
+SUBSCRIPTION_CONFLATE_KEY = 7
 
 TRANSPORT_REGISTRY = {}
 
@@ -36,6 +40,10 @@ RAWSOCKET_MESSAGE_TYPE_PONG = 2
 EV_INIT = 1
 EV_EXIT = 2
 EV_MAX_UPDATED = 3
+EV_SHUTDOWN = 4
+EV_CANCEL = 5
+EV_WAKEUP = 6
+EV_OWNER_RESET = 7
 
 
 try:
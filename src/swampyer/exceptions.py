@@ -20,6 +20,12 @@ class ExMessageCorrupt(SwampyException):
 class ExWAMPConnectionError(SwampyException):
     pass
 
+class ExStreamOverflow(ExWAMPConnectionError):
+    pass
+
+class ExCallTimeout(ExWAMPConnectionError):
+    pass
+
 class ExNotImplemented(SwampyException, NotImplementedError):
     pass
 
@@ -35,5 +41,11 @@ class ExShutdown(SwampyException):
 class ExWaitlistFull(SwampyException):
     pass
 
+class ExDeadlineExpired(SwampyException):
+    pass
+
+class ExBudgetExceeded(SwampyException):
+    pass
+
 # Support for deprecated WAMPConnectionError class
 WAMPConnectionError = ExWAMPConnectionError
@@ -0,0 +1,92 @@
+import math
+
+__all__ = [ 'LatencyHistogram' ]
+
+class LatencyHistogram(object):
+    """ A fixed size histogram of durations in seconds with logarithmic
+        buckets, much like an HDR histogram. Each bucket covers
+        `2**(1/precision)` times the range of the previous one so with the
+        default precision of 8 a percentile is off by at most ~9%. Values
+        below `value_min` go into the first bucket and values above
+        `value_max` into the last. Memory is bounded by the bucket count
+        regardless of how many values get recorded
+    """
+    def __init__(self, value_min=1e-6, value_max=3600, precision=8):
+        self.value_min = value_min
+        self.value_max = value_max
+        self.precision = precision
+        self.bucket_count = self.bucket_index(value_max) + 1
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * self.bucket_count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket_index(self, value):
+        """ Returns the index of the bucket `value` belongs in
+        """
+        if value <= self.value_min:
+            return 0
+        return int(math.log2(value / self.value_min) * self.precision)
+
+    def bucket_value(self, index):
+        """ Returns the upper bound of the bucket at `index`
+        """
+        return self.value_min * 2 ** ((index + 1) / self.precision)
+
+    def record(self, value):
+        index = self.bucket_index(value)
+        if index >= self.bucket_count:
+            index = self.bucket_count - 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Adds the values recorded by another histogram with the same
+            bucket layout to this one
+        """
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and ( self.min is None or other.min < self.min ):
+            self.min = other.min
+        if other.max is not None and ( self.max is None or other.max > self.max ):
+            self.max = other.max
+
+    def percentile(self, percentile):
+        """ Returns the value below which `percentile` percent of the
+            recorded values fall. Returns 0 if nothing has been recorded
+        """
+        if not self.count:
+            return 0
+        rank = math.ceil(self.count * percentile / 100.0) or 1
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                # The bucket bounds can't be tighter than what was seen
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+
+    def snapshot(self):
+        """ Returns a dict summarizing the recorded values
+        """
+        return {
+            'count': self.count,
+            'min': self.min or 0,
+            'max': self.max or 0,
+            'avg': self.count and self.total / self.count,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
@@ -34,6 +34,7 @@ MESSAGE_TYPES = dict(
 
     CALL         = [ CODE('code',48), ID('request_id'), DICT('options'), URI('procedure'),
                       LIST('args',**OPT), DICT('kwargs',**OPT) ],
+    CANCEL       = [ CODE('code',49), ID('request_id'), DICT('options') ],
     RESULT       = [ CODE('code',50), ID('request_id'), DICT('details'),
                       LIST('args',**OPT), DICT('kwargs',**OPT) ],
 
@@ -45,6 +46,7 @@ MESSAGE_TYPES = dict(
     INVOCATION   = [ CODE('code',68), ID('request_id'), ID('registration_id'), DICT('details'),
                       LIST('args',**OPT), DICT('kwargs',**OPT) ],
 
+    INTERRUPT    = [ CODE('code',69), ID('request_id'), DICT('options') ],
     YIELD        = [ CODE('code',70), ID('request_id'), DICT('options'),
                       LIST('args',**OPT), DICT('kwargs',**OPT) ],
 )
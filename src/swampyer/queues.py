@@ -1,15 +1,62 @@
+import os
+import math
 import time
+import asyncio
+import inspect
+import traceback
 import threading
+import heapq
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+import concurrent.futures.process
 
 import queue
 
 from .common import *
+from .messages import WampMessage, WAMP_EVENT
 from .exceptions import *
-from .utils import logger
+from .utils import logger, TimerScheduler
+from .histogram import LatencyHistogram
 
 ID_TRACKER = 0
 
+# Queues shared by all the clients in the process. See `shared_queue_get`
+SHARED_QUEUES = {}
+SHARED_QUEUES_LOCK = threading.Lock()
+
 class ConcurrencyRunner(threading.Thread):
+
+    # Registration details or subscription options the runner was
+    # created for. Queues may use these to decide how to schedule it
+    options = None
+
+    # Set by `cancel()`. Runners that haven't started yet never will
+    # and running ones are expected to check it if they can stop early
+    cancelled = False
+
+    # The concurrent.futures.Future of a runner whose work happens
+    # somewhere other than its own thread (eg. on the event loop)
+    future = None
+
+    # Jobs with the same conflation key replace each other on the
+    # waitlist so that only the latest one gets run. None opts out
+    conflation_key = None
+
+    # Approximate number of bytes the job's payload takes up. Counted
+    # against the byte budgets while the job is waiting or running
+    payload_size = 0
+    budgeted = False
+
+    # The ByteBudget the payload is counted against on top of the queue's
+    # own limit. Falls back to the queue's `budget`
+    budget = None
+
+    # Name of whoever submitted the job, usually the client. Queues shared
+    # between clients report and reset their jobs per owner
+    owner = None
+
     def __init__(self, handler, message):
         global ID_TRACKER
         super(ConcurrencyRunner, self).__init__()
@@ -18,9 +65,15 @@ class ConcurrencyRunner(threading.Thread):
         self.daemon = True
         self.handler = handler
         self.message = message
+        # The *_time attributes are epoch timestamps for reporting. Durations
+        # are measured with the matching *_clock values which come from
+        # the monotonic clock so they can't be thrown off by clock changes
         self.created_time = time.time()
+        self.created_clock = time.monotonic()
         self.started_time = None
+        self.started_clock = None
         self.ended_time = None
+        self.ended_clock = None
 
     def start(self, queue):
         """ We provide the Runner the queue to throw events against
@@ -28,8 +81,86 @@ class ConcurrencyRunner(threading.Thread):
             to have to do so at invocation
         """
         self._queue = queue
+        if self.is_coroutine():
+            self.start_coroutine()
+            return
         super(ConcurrencyRunner,self).start()
 
+    def execute(self, queue):
+        """ Like `start` but runs the runner in the current thread rather
+            than spinning up a new one. Used by queues that manage their
+            own pool of worker threads
+        """
+        self._queue = queue
+        if self.is_coroutine():
+            self.start_coroutine()
+            return
+        self.run()
+
+    def is_coroutine(self):
+        """ Returns a true value if the handler is an `async def` function
+            (or async generator) that should be run on the event loop
+            rather than a thread
+        """
+        return inspect.iscoroutinefunction(self.handler) \
+                or inspect.isasyncgenfunction(self.handler)
+
+    def event_loop(self):
+        """ Returns the asyncio event loop that coroutine handlers are
+            run upon
+        """
+        raise ExNotImplemented("event_loop is not implemented")
+
+    def start_coroutine(self):
+        """ Schedules `run_async` on the event loop. The runner holds on to
+            its slot in the queue until the coroutine completes but doesn't
+            hold on to a thread while it awaits
+        """
+        self._claim_lock = threading.Lock()
+        self._claimed = False
+        self.future = asyncio.run_coroutine_threadsafe(
+                          self.run_async(),
+                          self.event_loop()
+                      )
+        self.future.add_done_callback(self.coroutine_done)
+
+    def coroutine_claim(self):
+        """ Returns True to whichever of `run_async` and `coroutine_done`
+            gets to the runner first. That one is then responsible for
+            posting the exit to the queue
+        """
+        with self._claim_lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+    def coroutine_done(self, future):
+        """ Invoked when the coroutine's future is done. If it was cancelled
+            before `run_async` took its first step the `finally` in there
+            never runs, so the slot is given back from here instead
+        """
+        if future.cancelled() and self.coroutine_claim():
+            self.mark_ended()
+            self._queue.put_exit(self)
+
+    def cancel(self):
+        """ Marks the runner as cancelled. Coroutines are cancelled on the
+            event loop. Threads can't be stopped from the outside so
+            handlers running in one have to check `cancelled` themselves
+        """
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def mark_started(self):
+        self.started_time = time.time()
+        self.started_clock = time.monotonic()
+
+    def mark_ended(self):
+        self.ended_time = time.time()
+        self.ended_clock = time.monotonic()
+
     def stats(self):
 
         runner_stats = {
@@ -38,22 +169,30 @@ class ConcurrencyRunner(threading.Thread):
             'ended_time': self.ended_time,
             'wait_duration': 0,
             'run_duration': 0,
+            'total_duration': 0,
         }
 
         # If started time is available, we can calculate
         # how long the runner had to wait before being allowed to execute
         # the invocation handler
-        if self.started_time:
-            runner_stats['waited_duration'] = self.started_time - self.created_time
+        if self.started_clock is not None:
+            runner_stats['wait_duration'] = self.started_clock - self.created_clock
 
         # If the ended time is available, we can calculate how long
         # the runner had to wait till it had results to send back to the
         # user
-        if self.ended_time:
-            runner_stats['run_duration'] = self.ended_time - self.started_time
+        if self.ended_clock is not None and self.started_clock is not None:
+            runner_stats['run_duration'] = self.ended_clock - self.started_clock
+            runner_stats['total_duration'] = self.ended_clock - self.created_clock
 
         return runner_stats
 
+    def finished(self, runner_stats):
+        """ Called by the queue once the runner has exited with the
+            result of `stats()`
+        """
+        pass
+
     def work(self):
         """ Override this function!
         """
@@ -64,15 +203,42 @@ class ConcurrencyRunner(threading.Thread):
         """
         pass
 
+    def handle_result(self, result):
+        """ Triggered with the return value of the handler when it has
+            been run somewhere other than in `work`, such as in another
+            process
+        """
+        pass
+
+    def work_async(self):
+        """ Override this function to support coroutine handlers. Should
+            be an `async def`
+        """
+        raise NotImplementedError("The 'work_async' function must be overriden!")
+
     def run(self):
         """ This wraps the run so that we can catch when the
             thread finishes
         """
         try:
-            self.started_time = time.time()
-            self.work()
+            self.mark_started()
+            if not self.cancelled:
+                self.work()
+        finally:
+            self.mark_ended()
+            self._queue.put_exit(self)
+
+    async def run_async(self):
+        """ The coroutine equivalent of `run`
+        """
+        if not self.coroutine_claim():
+            return
+        try:
+            self.mark_started()
+            if not self.cancelled:
+                await self.work_async()
         finally:
-            self.ended_time = time.time()
+            self.mark_ended()
             self._queue.put_exit(self)
 
 class ConcurrencyEvent(object):
@@ -81,6 +247,9 @@ class ConcurrencyEvent(object):
         self.runner = runner
         self.id = runner and runner.concurrency_id
 
+        # Set by the queue when the job arrives. See `job_deadline`
+        self.deadline = None
+
     def handle_error(self, ex):
         """ handle_error is only relevant if there's a runner associated
         """
@@ -94,17 +263,77 @@ class ConcurrencyEvent(object):
 
     __getitem__ = __getattr__
 
+class ByteBudget(object):
+    """ Keeps count of the payload bytes held by jobs across several
+        queues. `bytes_max` of 0 means the bytes are counted but never
+        turned away
+    """
+    def __init__(self, bytes_max=0):
+        self.bytes_max = bytes_max
+        self.lock = threading.Lock()
+        self.current = 0
+        self.reset()
+
+    def reset(self):
+        self.peak = self.current
+        self.rejected = 0
+
+    def acquire(self, size):
+        """ Returns True if `size` bytes fit in the budget and takes them
+        """
+        with self.lock:
+            if self.bytes_max and self.current + size > self.bytes_max:
+                self.rejected += 1
+                return False
+            self.current += size
+            if self.current > self.peak:
+                self.peak = self.current
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.current = max(0, self.current - size)
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = {
+                'bytes': self.current,
+                'bytes_peak': self.peak,
+                'bytes_max': self.bytes_max,
+                'bytes_rejected': self.rejected,
+            }
+            if reset:
+                self.reset()
+        return stats
+
 class ConcurrencyQueue(threading.Thread):
+
+    # A ByteBudget shared with other queues for jobs that don't bring
+    # their own
+    budget = None
+
+    # True for queues that are used by more than one client. These are
+    # never reset or shut down by a client, the client's jobs are just
+    # taken off them
+    shared = False
+
     def __init__(self,
                 queue_name=None,
                 concurrency_max=0,
                 queue_max=0,
                 loop_timeout=0.1,
+                max_wait=0,
+                bytes_max=0,
                 _class=None,
                 **kwargs
                 ):
         super(ConcurrencyQueue,self).__init__()
-        self.queue = queue.Queue()
+        self.queue = queue.SimpleQueue()
+
+        # Called with the queue each time it has tried to start waiting
+        # jobs. Lets the clients know when the waitlists shrink
+        self.drain_callbacks = []
+
         self.reset()
         self.queue_name = queue_name
         self.active = True
@@ -112,7 +341,9 @@ class ConcurrencyQueue(threading.Thread):
         self.configure(
             concurrency_max = concurrency_max,
             queue_max = queue_max,
-            loop_timeout = loop_timeout
+            loop_timeout = loop_timeout,
+            max_wait = max_wait,
+            bytes_max = bytes_max,
         )
         self.init(**kwargs)
 
@@ -120,16 +351,26 @@ class ConcurrencyQueue(threading.Thread):
         pass
 
     def configure(self, **kwargs):
-        for k in ( 'concurrency_max', 'loop_timeout', 'queue_max' ):
+        """ Updates the queue limits. Note that `loop_timeout` is only kept
+            for backwards compatibility. The queue loop now blocks until
+            there's an event to handle and gets woken up by `shutdown`
+
+            `max_wait` is the number of seconds a job may sit on the waitlist
+            before it's no longer worth running. 0 means jobs only expire
+            if the INVOCATION carries a `timeout`
+
+            `bytes_max` limits the payload bytes of the jobs that are waiting
+            or running. Jobs that don't fit are turned away. 0 for no limit
+        """
+        for k in ( 'concurrency_max', 'loop_timeout', 'queue_max', 'max_wait', 'bytes_max' ):
+            if k not in kwargs:
+                continue
+
+            setattr(self,k,kwargs[k])
             if k == 'concurrency_max':
-                concurrency_max = kwargs[k]
-                self.concurrency_max = concurrency_max
                 event = ConcurrencyEvent(EV_MAX_UPDATED)
                 self.queue.put(event)
 
-            elif k in kwargs:
-                setattr(self,k,kwargs[k])
-
     def reset(self):
         """ When we need to expunge all the queues. This may happen
             when we're forced to reconnect
@@ -137,11 +378,13 @@ class ConcurrencyQueue(threading.Thread):
         while not self.queue.empty():
             try:
                 event = self.queue.get(False)
-            except Empty:
-                continue
-            self.queue.task_done()
+            except queue.Empty:
+                break
         self.active_threads = {}
-        self.waiting = []
+        self.waiting = collections.deque()
+        self.conflated = {}
+        self.bytes_current = 0
+        self.bytes_peak = 0
         self._stats = {
             'messages': 0,
             'run': 0,
@@ -150,6 +393,10 @@ class ConcurrencyQueue(threading.Thread):
             'waiting': 0,
             'waitlist_max': 0,
             'rejected': 0,
+            'cancelled': 0,
+            'shed': 0,
+            'superseded': 0,
+            'bytes_rejected': 0,
             'errors': 0,
             'wait_duration': 0,
             'run_duration': 0,
@@ -158,11 +405,47 @@ class ConcurrencyQueue(threading.Thread):
             'duration_datapoints': 0,
             'last_reset': time.time(),
         }
+        self._owner_stats = {}
+        self.shed_histogram = LatencyHistogram()
+        self.histograms = {
+            'wait': LatencyHistogram(),
+            'run': LatencyHistogram(),
+            'total': LatencyHistogram(),
+        }
 
-    def stats(self):
+    def stats(self, reset=False):
         """ Return the current stats object. Just a simple counter based
             report on what the client has been up to. Adds one parameter
             `timestamp` which holds the current epoch time
+
+            If `reset` is true the counters and histograms start over once
+            the snapshot has been taken so that each call reports on the
+            window since the previous one (see `last_reset`)
+        """
+        stats = self.stats_snapshot()
+        if reset:
+            self.stats_reset()
+        return stats
+
+    def stats_reset(self):
+        """ Zeroes the counters and histograms without touching the
+            running or waiting jobs
+        """
+        for k in self._stats:
+            self._stats[k] = 0
+        self._stats['last_reset'] = time.time()
+        self.bytes_peak = self.bytes_current
+        for owner_stats in list(self._owner_stats.values()):
+            owner_stats['messages'] = 0
+            owner_stats['run'] = 0
+            owner_stats['rejected'] = 0
+        self.shed_histogram.reset()
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def stats_snapshot(self):
+        """ Returns the stats dict. Subclasses that report more should
+            extend this rather than `stats`
         """
         stats = self._stats.copy()
         stats['timestamp'] = time.time()
@@ -173,6 +456,20 @@ class ConcurrencyQueue(threading.Thread):
 
         stats['running'] = self.active_count()
         stats['waiting'] = self.waitlist_count()
+        stats['shed_wait'] = self.shed_histogram.snapshot()
+        stats['bytes'] = self.bytes_current
+        stats['bytes_peak'] = self.bytes_peak
+        stats['owners'] = {
+            owner: owner_stats.copy()
+            for owner, owner_stats in list(self._owner_stats.items())
+        }
+
+        # wait: time on the waitlist, run: time in the handler and
+        # total: the two together, all in seconds
+        stats['latency'] = {
+            name: histogram.snapshot()
+            for name, histogram in self.histograms.items()
+        }
 
         return stats
 
@@ -188,6 +485,29 @@ class ConcurrencyQueue(threading.Thread):
         event = ConcurrencyEvent(EV_EXIT,runner)
         self.queue.put(event)
 
+    def put_owner_reset(self, owner):
+        """ Notify the concurrency loop that the jobs of `owner` that are
+            still waiting should be dropped. Used instead of `reset` when
+            a client reconnects or goes away on a shared queue
+        """
+        event = ConcurrencyEvent(EV_OWNER_RESET)
+        event.owner = owner
+        self.queue.put(event)
+
+    def put_cancel(self, runner):
+        """ Notify the concurrency loop that a job has been cancelled. If
+            it's still on the waitlist it gets dropped from it
+        """
+        event = ConcurrencyEvent(EV_CANCEL,runner)
+        self.queue.put(event)
+
+    def shutdown(self):
+        """ Ask the concurrency loop to stop. The loop is woken up
+            immediately rather than on its next poll
+        """
+        self.active = False
+        self.queue.put(ConcurrencyEvent(EV_SHUTDOWN))
+
     def active_count(self):
         """ Returns the number of active threads
         """
@@ -198,6 +518,42 @@ class ConcurrencyQueue(threading.Thread):
         """
         return len(self.waiting)
 
+    def backlog_count(self):
+        """ Returns the number of waiting jobs plus the events that the
+            queue thread hasn't got to yet
+        """
+        return self.waitlist_count() + self.queue.qsize()
+
+    def waitlist_push(self, event):
+        """ Adds an event to the waitlist. Override this along with
+            `waitlist_pop` and `waitlist_count` to change the order in
+            which waiting jobs get run
+        """
+        self.waiting.append(event)
+
+    def waitlist_pop(self):
+        """ Removes and returns the next event that should be run from
+            the waitlist. Returns None if nothing can be run
+        """
+        if not self.waiting:
+            return None
+        return self.waiting.popleft()
+
+    def waitlist_events(self):
+        """ Returns a list of the waiting events in no particular order
+        """
+        return list(self.waiting)
+
+    def waitlist_remove(self, runner):
+        """ Removes the event for `runner` from the waitlist. Returns the
+            event or None if the runner wasn't waiting
+        """
+        for event in self.waiting:
+            if event.runner is runner:
+                self.waiting.remove(event)
+                return event
+        return None
+
     def queue_full(self):
         """ Returns True if there is a max concurrency value for the
             queue and it happens to have been reached
@@ -219,21 +575,55 @@ class ConcurrencyQueue(threading.Thread):
         """ Returns a true value if both the active and the waiting
             queue are empty
         """
-        if len(self.active_threads) or len(self.waiting):
+        if self.active_count() or self.waitlist_count():
             return False
         return True
 
     def transfer(self, current_queue):
         """ This takes an existing queue and transfers the queue data over
-            to this instance. Typically used when replacing classes
+            to this instance. Typically used when replacing classes so the
+            waiting jobs are moved across one by one with the waitlist
+            hooks rather than by taking over the other queue's waitlist.
+            Should be called before this queue is started
         """
-        current_queue.active = False
-        self.waiting = current_queue.waiting
+        current_queue.shutdown()
+        if current_queue.is_alive() and current_queue is not threading.current_thread():
+            current_queue.join()
+
+        events = sorted(
+                    current_queue.waitlist_events(),
+                    key=lambda event: event.created_clock
+                )
+        for event in events:
+            self.job_prepare(event)
+            self.waitlist_push(event)
+            self.owner_count(event.runner, 'waiting')
+            if event.runner.conflation_key is not None:
+                self.conflated[event.runner.conflation_key] = event
+            if event.runner.budgeted:
+                self.bytes_current += event.runner.payload_size
+        self.bytes_peak = max(self.bytes_peak, self.bytes_current)
 
     def work_start(self, event):
         self._stats['run'] += 1
-        event.start(self)
+        self.owner_count(event.runner, 'run')
+        self.owner_count(event.runner, 'running')
         self.active_threads[event.id] = event
+        try:
+            self.runner_start(event)
+
+        # If the runner never got going, it's not going to tell us that
+        # it has finished either so release its slot here
+        except Exception:
+            self.active_threads.pop(event.id, None)
+            self.owner_count(event.runner, 'running', -1)
+            raise
+
+    def runner_start(self, event):
+        """ Launches the runner associated with the event. By default
+            every runner gets its own freshly started thread
+        """
+        event.start(self)
 
     def job_should_wait(self, event):
         return self.queue_full()
@@ -241,6 +631,138 @@ class ConcurrencyQueue(threading.Thread):
     def job_should_reject(self, event):
         return self.waitlist_full()
 
+    def job_deadline(self, event):
+        """ Returns the time (on the monotonic clock) after which the job
+            is no longer worth starting or None if it can wait indefinitely. Derived from the
+            `timeout` (in milliseconds) the caller set on the INVOCATION
+            and the queue's `max_wait`, whichever comes first
+        """
+        deadline = None
+        if self.max_wait:
+            deadline = event.created_clock + self.max_wait
+
+        message = event.runner.message
+        details = message and message.get('details')
+        timeout = isinstance(details, dict) and details.get('timeout')
+        if timeout:
+            caller_deadline = event.created_clock + timeout / 1000.0
+            if deadline is None or caller_deadline < deadline:
+                deadline = caller_deadline
+
+        return deadline
+
+    def job_expired(self, event, now=None):
+        """ Returns True if the job has gone past its deadline
+        """
+        deadline = event.deadline
+        if deadline is None:
+            return False
+        return ( now or time.monotonic() ) > deadline
+
+    def job_shed(self, event):
+        """ Called instead of `work_start` for a job that was taken off
+            the waitlist after its deadline. The runner gets told through
+            `handle_error` so that the caller gets an ERROR back
+        """
+        now = time.monotonic()
+        wait_duration = now - event.created_clock
+        self.bytes_release(event.runner)
+        self._stats['shed'] += 1
+        self.shed_histogram.record(wait_duration)
+        event.runner.handle_error(ExDeadlineExpired(
+            "Queue {} dropped the job after it waited {:.3f}s, {:.3f}s past its deadline".format(
+                self.queue_name, wait_duration, now - event.deadline
+            )))
+
+    def owner_count(self, runner, key, delta=1):
+        """ Updates the per owner stats of the job
+        """
+        owner = runner.owner
+        if owner is None:
+            return
+        owner_stats = self._owner_stats.get(owner)
+        if owner_stats is None:
+            owner_stats = self._owner_stats[owner] = {
+                'messages': 0,
+                'run': 0,
+                'rejected': 0,
+                'running': 0,
+                'waiting': 0,
+            }
+        owner_stats[key] += delta
+
+    def bytes_acquire(self, event):
+        """ Counts the job's payload against the queue's `bytes_max` and
+            the shared budget. Raises ExBudgetExceeded if it doesn't fit
+        """
+        runner = event.runner
+        size = runner.payload_size
+        if not size:
+            return
+
+        if self.bytes_max and self.bytes_current + size > self.bytes_max:
+            self._stats['bytes_rejected'] += 1
+            self.owner_count(runner, 'rejected')
+            raise ExBudgetExceeded("Queue {} byte budget of {} exceeded by job of {} bytes".format(
+                self.queue_name, self.bytes_max, size
+            ))
+
+        budget = runner.budget
+        if budget is None:
+            budget = runner.budget = self.budget
+        if budget is not None and not budget.acquire(size):
+            self._stats['bytes_rejected'] += 1
+            self.owner_count(runner, 'rejected')
+            raise ExBudgetExceeded("Byte budget of {} exceeded by job of {} bytes in queue {}".format(
+                budget.bytes_max, size, self.queue_name
+            ))
+
+        runner.budgeted = True
+        self.bytes_current += size
+        if self.bytes_current > self.bytes_peak:
+            self.bytes_peak = self.bytes_current
+
+    def bytes_release(self, runner):
+        """ Gives back the bytes held by a job that has finished or left
+            the waitlist
+        """
+        if not runner.budgeted:
+            return
+        runner.budgeted = False
+        size = runner.payload_size
+        self.bytes_current = max(0, self.bytes_current - size)
+        if runner.budget is not None:
+            runner.budget.release(size)
+
+    def job_conflate(self, event):
+        """ If a job with the same conflation key is already waiting, the
+            new runner takes its place on the waitlist and True is
+            returned. The job that was waiting is dropped without being run
+        """
+        key = event.runner.conflation_key
+        if key is None:
+            return False
+
+        waiting = self.conflated.get(key)
+        if waiting is None:
+            return False
+
+        self.bytes_release(waiting.runner)
+        self.owner_count(waiting.runner, 'waiting', -1)
+        self.owner_count(event.runner, 'waiting')
+        waiting.runner = event.runner
+        waiting.id = event.id
+        waiting.deadline = event.deadline
+        self._stats['superseded'] += 1
+        return True
+
+    def conflation_release(self, event):
+        """ Forgets about a job that left the waitlist
+        """
+        key = event.runner.conflation_key
+        if key is not None and self.conflated.get(key) is event:
+            del self.conflated[key]
+
     def job_queued(self, event):
         """ Called when an event comes in that exceeds our current queue
             limit
@@ -254,35 +776,133 @@ class ConcurrencyQueue(threading.Thread):
         """
         pass
 
+    def job_prepare(self, event):
+        """ Works out what the queue needs to know about a job before it
+            gets scheduled. Also used for jobs taken over by `transfer`
+        """
+        event.deadline = self.job_deadline(event)
+
     def queue_init(self, event):
         """ Triggered when a request for a new job is received by the queue
         """
-        # If there is a limit
-        #  If limit reached, queue for future invocation
-        #  If limit not reached, start the runner
-        if self.job_should_wait(event):
-
-            # If we have hit the limit for maximum queues, we will throw
-            # an error
-            if self.job_should_reject(event):
-                self._stats['rejected'] += 1
-                self.job_reject(event)
-                raise ExWaitlistFull("Queue {} waitlist full".format(self.queue_name))
-
-            self._stats['waited'] += 1
-            self.waiting.append(event)
-            if len(self.waiting) > self._stats['waitlist_max']:
-                self._stats['waitlist_max'] = len(self.waiting)
-            self.job_queued(event)
-            return
+        self.job_prepare(event)
+        self.owner_count(event.runner, 'messages')
+
+        # Jobs that would take up more memory than we can spare are
+        # turned away. For INVOCATIONs the caller gets an ERROR, EVENTs
+        # are dropped
+        self.bytes_acquire(event)
+        try:
+            # If there is a limit
+            #  If limit reached, queue for future invocation
+            #  If limit not reached, start the runner
+            if self.job_should_wait(event):
+
+                # Latest value wins. The waiting job just gets a newer runner
+                # so this doesn't take up any more room on the waitlist
+                if self.job_conflate(event):
+                    return
+
+                # If we have hit the limit for maximum queues, we will throw
+                # an error
+                if self.job_should_reject(event):
+                    self._stats['rejected'] += 1
+                    self.owner_count(event.runner, 'rejected')
+                    self.job_reject(event)
+                    raise ExWaitlistFull("Queue {} waitlist full".format(self.queue_name))
 
-        self.work_start(event)
+                self._stats['waited'] += 1
+                self.waitlist_push(event)
+                self.owner_count(event.runner, 'waiting')
+                if event.runner.conflation_key is not None:
+                    self.conflated[event.runner.conflation_key] = event
+                waitlist_count = self.waitlist_count()
+                if waitlist_count > self._stats['waitlist_max']:
+                    self._stats['waitlist_max'] = waitlist_count
+                self.job_queued(event)
+                return
+
+            self.work_start(event)
+        except Exception:
+            self.bytes_release(event.runner)
+            raise
 
     def queue_exit(self, event):
         """ Triggered when a running job completes
         """
         if event.id in self.active_threads:
             del self.active_threads[event.id]
+            self.owner_count(event.runner, 'running', -1)
+        self.bytes_release(event.runner)
+
+        # Add to stats how things went
+        event_stats = event.stats()
+        self._stats['wait_duration'] += event_stats['wait_duration']
+        self._stats['run_duration'] += event_stats['run_duration']
+        self._stats['duration_datapoints'] += 1
+        self.histograms['wait'].record(event_stats['wait_duration'])
+        self.histograms['run'].record(event_stats['run_duration'])
+        self.histograms['total'].record(event_stats['total_duration'])
+
+        try:
+            event.runner.finished(event_stats)
+        except Exception as ex:
+            logger.warning(f"Recording runner stats failed: {ex}")
+
+    def queue_cancel(self, event):
+        """ Triggered when a job has been cancelled. Jobs that are
+            still waiting are taken off the waitlist so they don't
+            take up a slot later
+        """
+        self._stats['cancelled'] += 1
+        removed = self.waitlist_remove(event.runner)
+        if removed is not None:
+            self.conflation_release(removed)
+            self.bytes_release(removed.runner)
+            self.owner_count(removed.runner, 'waiting', -1)
+
+    def queue_owner_reset(self, owner):
+        """ Drops the waiting jobs of `owner`. Its running jobs are left
+            to finish
+        """
+        for waiting in self.waitlist_events():
+            if waiting.runner.owner != owner:
+                continue
+            removed = self.waitlist_remove(waiting.runner)
+            if removed is None:
+                continue
+            self.conflation_release(removed)
+            self.bytes_release(removed.runner)
+
+        owner_stats = self._owner_stats.get(owner)
+        if owner_stats is not None:
+            if owner_stats['running']:
+                owner_stats['waiting'] = 0
+            else:
+                del self._owner_stats[owner]
+
+    def queue_drain(self):
+        """ Starts as many of the waiting jobs as the concurrency limits
+            allow
+        """
+        while self.waitlist_count():
+            if self.queue_full():
+                break
+            waiting = self.waitlist_pop()
+            if waiting is None:
+                break
+            self.conflation_release(waiting)
+            self.owner_count(waiting.runner, 'waiting', -1)
+
+            # Don't spend capacity on jobs nobody is waiting on anymore
+            if self.job_expired(waiting):
+                self.job_shed(waiting)
+                continue
+
+            self.work_start(waiting)
+
+        for drain_callback in self.drain_callbacks:
+            drain_callback(self)
 
     def queue_event(self, event):
         """ Triggered whenever an event is received on the event queue. Probably not
@@ -294,48 +914,1338 @@ class ConcurrencyQueue(threading.Thread):
             self.queue_init(event)
             return
 
+        if event.type == EV_CANCEL:
+            self.queue_cancel(event)
+            return
+
+        if event.type == EV_OWNER_RESET:
+            self.queue_owner_reset(event.owner)
+            return
+
         # And captured an exit event.
         if event.type == EV_EXIT:
             self.queue_exit(event)
 
-        # If the max concurrent has been updated or something
-        # has finished running. Rescan the pending items to
-        # see if we need to start any additional items
-        if event.type in ( EV_EXIT, EV_MAX_UPDATED ):
-
-            # Add to stats how things went
-            event_stats = event.stats()
-            self._stats['wait_duration'] += event_stats['wait_duration']
-            self._stats['run_duration'] += event_stats['run_duration']
-            self._stats['duration_datapoints'] += 1
-
-            while self.waiting:
-                if self.queue_full():
-                    break
-                waiting = self.waiting.pop(0)
-                self.active_threads[waiting.id] = waiting
-                self.work_start(waiting)
+        # If the max concurrent has been updated, something
+        # has finished running or a timer went off. Rescan the
+        # pending items to see if we need to start any additional items
+        if event.type in ( EV_EXIT, EV_MAX_UPDATED, EV_WAKEUP ):
+            self.queue_drain()
 
     def run(self):
+        # We block until there's something to do. Shutdown requests
+        # arrive as an EV_SHUTDOWN event so an idle queue never has
+        # to wake up to check on self.active
         while self.active:
+            event = self.queue.get()
+            if event.type == EV_SHUTDOWN:
+                break
             try:
-                event = self.queue.get(timeout=self.loop_timeout)
-                try:
-                    self._stats['messages'] += 1
-                    self.queue_event(event)
+                self._stats['messages'] += 1
+                self.queue_event(event)
 
-                # Got an exception in the queueing, we need to pass
-                # it on.
+            # Got an exception in the queueing, we need to pass
+            # it on.
+            except Exception as ex:
+                try:
+                    self._stats['errors'] += 1
+                    event.handle_error(ex)
                 except Exception as ex:
-                    try:
-                        self._stats['errors'] += 1
-                        event.handle_error(ex)
-                    except Exception as ex:
-                        logger.warning(f"Exception handler failed: {ex}")
-
-            # If queue is empty, it's a timeout. We use the
-            # opportunity to check if we've been requsested to drop
-            # out of the loop
+                    logger.warning(f"Exception handler failed: {ex}")
+
+def shared_queue_start(concurrency_queue):
+    """ Starts the queue thread unless it has been already. Several
+        clients may try this at the same time
+    """
+    with SHARED_QUEUES_LOCK:
+        if concurrency_queue.ident is None:
+            concurrency_queue.start()
+
+def shared_queue_get(queue_name, _class=None, **config):
+    """ Returns the process wide queue called `queue_name`, creating it
+        with `_class(queue_name, **config)` the first time around. Every
+        client that asks for the same name gets the same queue so they
+        share its limits and workers. A queue that has been shut down is
+        replaced with a new one as it can't be started again
+    """
+    with SHARED_QUEUES_LOCK:
+        concurrency_queue = SHARED_QUEUES.get(queue_name)
+        if concurrency_queue is None or not concurrency_queue.active:
+            klass = _class or ConcurrencyQueue
+            concurrency_queue = klass(queue_name, **config)
+            concurrency_queue.shared = True
+            SHARED_QUEUES[queue_name] = concurrency_queue
+        return concurrency_queue
+
+def shared_queue_remove(queue_name):
+    """ Takes the queue out of the registry and shuts it down. Clients
+        still holding on to it should be shut down first
+    """
+    with SHARED_QUEUES_LOCK:
+        concurrency_queue = SHARED_QUEUES.pop(queue_name, None)
+    if concurrency_queue is not None:
+        concurrency_queue.shutdown()
+    return concurrency_queue
+
+
+STACK_SIZE_LOCK = threading.Lock()
+
+class ConcurrencyWorker(threading.Thread):
+    """ A long lived thread owned by a ConcurrencyWorkerPool. Pulls jobs
+        off the pool's job queue and executes them until it's been idle
+        long enough to be reaped or the pool gets shutdown
+    """
+    def __init__(self, pool):
+        super(ConcurrencyWorker, self).__init__()
+        self.daemon = True
+        self.pool = pool
+
+    def run(self):
+        pool = self.pool
+        while True:
+            try:
+                job = pool.jobs.get(timeout=pool.idle_timeout or None)
             except queue.Empty:
+                if pool.worker_reap(self):
+                    return
+                continue
+
+            # None is the sentinel used to tell us the pool is going away
+            if job is None:
+                pool.worker_exit(self)
+                return
+
+            pool.worker_busy()
+            try:
+                job()
+            except Exception as ex:
+                logger.warning(f"Worker job failed: {ex}")
+            pool.worker_idle()
+
+class ConcurrencyWorkerPool(object):
+    """ Keeps a set of pre-spawned threads around so that jobs don't have
+        to pay for thread creation and teardown.
+
+        - workers_min: number of workers that are spawned up front and are
+            never reaped
+        - workers_max: upper bound on the number of workers. 0 means no limit.
+            Generally the queue's `concurrency_max` already bounds how many
+            jobs are handed over at once
+        - idle_timeout: seconds a worker above `workers_min` may sit idle
+            before it is reaped. 0 means workers are never reaped
+        - stack_size: stack size in bytes for the worker threads. 0 uses
+            the interpreter default
+    """
+    def __init__(self,
+                workers_min=0,
+                workers_max=0,
+                idle_timeout=60,
+                stack_size=0,
+                ):
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.workers = set()
+        self.workers_min = workers_min
+        self.workers_max = workers_max
+        self.idle_timeout = idle_timeout
+        self.stack_size = stack_size
+
+        # `idle` is the number of workers blocked waiting on a job and
+        # `pending` is the number of jobs that no worker has picked up yet
+        self.idle = 0
+        self.pending = 0
+        self._stats = {
+            'spawned': 0,
+            'reaped': 0,
+        }
+
+        with self.lock:
+            for i in range(workers_min):
+                self.worker_spawn()
+
+    def worker_spawn(self):
+        """ Creates and starts a new worker. Must be called with
+            self.lock held
+        """
+        worker = ConcurrencyWorker(self)
+
+        # threading.stack_size is process wide and only takes effect
+        # for threads started after it is set so we restore the
+        # previous value as soon as the worker is running
+        with STACK_SIZE_LOCK:
+            previous_stack_size = None
+            if self.stack_size:
+                previous_stack_size = threading.stack_size(self.stack_size)
+            try:
+                worker.start()
+            finally:
+                if previous_stack_size is not None:
+                    threading.stack_size(previous_stack_size)
+
+        self.workers.add(worker)
+        self.idle += 1
+        self._stats['spawned'] += 1
+        return worker
+
+    def worker_busy(self):
+        """ Called by a worker when it has picked up a job
+        """
+        with self.lock:
+            self.idle -= 1
+            self.pending -= 1
+
+    def worker_idle(self):
+        """ Called by a worker when it has finished its job and is about
+            to wait for the next one
+        """
+        with self.lock:
+            self.idle += 1
+
+    def worker_reap(self, worker):
+        """ Called by a worker that has been idle for `idle_timeout`. Returns
+            a true value if the worker should exit
+        """
+        with self.lock:
+            if len(self.workers) <= self.workers_min:
+                return False
+
+            # Jobs may have been queued against our idle slot in the
+            # meantime. Stick around if that's the case
+            if self.pending >= self.idle:
+                return False
+
+            self.workers.discard(worker)
+            self.idle -= 1
+            self._stats['reaped'] += 1
+            return True
+
+    def worker_exit(self, worker):
+        with self.lock:
+            self.workers.discard(worker)
+            self.idle -= 1
+
+    def submit(self, job):
+        """ Hands `job`, a callable, over to the pool. Spawns a new worker
+            if there are no idle workers to take the job
+        """
+        with self.lock:
+            self.pending += 1
+            if self.pending > self.idle:
+                if not self.workers_max or len(self.workers) < self.workers_max:
+                    self.worker_spawn()
+        self.jobs.put(job)
+
+    def shutdown(self):
+        """ Ask all the workers to exit once they've finished what
+            they're currently doing
+        """
+        with self.lock:
+            worker_count = len(self.workers)
+            self.workers_min = 0
+        for i in range(worker_count):
+            self.jobs.put(None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': len(self.workers),
+                'workers_idle': self.idle,
+                'workers_spawned': self._stats['spawned'],
+                'workers_reaped': self._stats['reaped'],
+            }
+
+class PooledConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that runs the jobs on a pool of long lived
+        worker threads rather than creating a new thread per job. Select
+        it via `concurrency_class` or the `_class` key of a queue in
+        `concurrency_configs`. Additional configuration keys:
+
+        - workers_min: workers spawned up front. Defaults to `concurrency_max`
+        - workers_max: maximum number of workers. Defaults to no limit beyond
+            `concurrency_max`
+        - idle_timeout: seconds before idle workers above `workers_min`
+            are reaped
+        - stack_size: worker thread stack size in bytes
+    """
+    def __init__(self,
+                queue_name=None,
+                workers_min=None,
+                workers_max=0,
+                idle_timeout=60,
+                stack_size=0,
+                **kwargs
+                ):
+        if workers_min is None:
+            workers_min = kwargs.get('concurrency_max') or 0
+        self.pool = ConcurrencyWorkerPool(
+                        workers_min=workers_min,
+                        workers_max=workers_max,
+                        idle_timeout=idle_timeout,
+                        stack_size=stack_size,
+                    )
+        super(PooledConcurrencyQueue, self).__init__(queue_name, **kwargs)
+
+    def runner_start(self, event):
+        runner = event.runner
+
+        # Coroutines are run on the event loop so there's no point in
+        # tying up a worker to schedule them
+        if runner.is_coroutine():
+            event.start(self)
+            return
+
+        self.pool.submit(lambda: runner.execute(self))
+
+    def stats_snapshot(self):
+        stats = super(PooledConcurrencyQueue, self).stats_snapshot()
+        stats.update(self.pool.stats())
+        return stats
+
+    def run(self):
+        try:
+            super(PooledConcurrencyQueue, self).run()
+        finally:
+            self.pool.shutdown()
+
+class PriorityConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue where waiting jobs are run in order of priority
+        rather than first come, first served. Lower values run first.
+
+        The priority of a job is taken from (in order of preference):
+
+        - priority_callable: if provided, invoked with the INVOCATION or
+            EVENT `details`. A return value of None falls through
+        - the `priority_key` entry of the `details` passed to `register()`
+            or the `options` passed to `subscribe()`
+        - priority_default
+
+        Setting `aging` to a number of seconds makes waiting jobs gain
+        one level of priority for every `aging` seconds they've been
+        waiting so that low priority work can't be starved forever
+    """
+
+    def init(self,
+            priority_default=0,
+            priority_key='priority',
+            priority_callable=None,
+            aging=0,
+            **kwargs):
+        self.priority_default = priority_default
+        self.priority_key = priority_key
+        self.priority_callable = priority_callable
+        self.aging = aging
+
+    def reset(self):
+        super(PriorityConcurrencyQueue, self).reset()
+        self.waiting = []
+        self.waiting_sequence = itertools.count()
+        self._priority_stats = {}
+
+    def stats_reset(self):
+        super(PriorityConcurrencyQueue, self).stats_reset()
+        for priority_stats in list(self._priority_stats.values()):
+            priority_stats['run'] = 0
+            priority_stats['wait_duration'] = 0
+            priority_stats['wait_duration_max'] = 0
+
+    def job_priority(self, event):
+        """ Returns the priority for the job
+        """
+        runner = event.runner
+        message = runner.message
+
+        if self.priority_callable:
+            details = message and message.get('details') or {}
+            priority = self.priority_callable(details)
+            if priority is not None:
+                return priority
+
+        options = runner.options or {}
+        priority = options.get(self.priority_key)
+        if priority is not None:
+            return priority
+
+        return self.priority_default
+
+    def priority_stats(self, priority):
+        if priority not in self._priority_stats:
+            self._priority_stats[priority] = {
+                'run': 0,
+                'waiting': 0,
+                'wait_duration': 0,
+                'wait_duration_max': 0,
+            }
+        return self._priority_stats[priority]
+
+    def job_prepare(self, event):
+        event.priority = self.job_priority(event)
+        super(PriorityConcurrencyQueue, self).job_prepare(event)
+
+    def waitlist_push(self, event):
+        # Since every job ages at the same rate, aging can be folded into
+        # a static sort key: each level of priority is worth `aging`
+        # seconds of waiting
+        if self.aging:
+            sort_key = event.created_clock + event.priority * self.aging
+        else:
+            sort_key = event.priority
+        heapq.heappush(self.waiting, (sort_key, next(self.waiting_sequence), event))
+        self.priority_stats(event.priority)['waiting'] += 1
+
+    def waitlist_pop(self):
+        if not self.waiting:
+            return None
+        sort_key, sequence, event = heapq.heappop(self.waiting)
+        self.priority_stats(event.priority)['waiting'] -= 1
+        return event
+
+    def waitlist_events(self):
+        return [ event for sort_key, sequence, event in self.waiting ]
+
+    def waitlist_remove(self, runner):
+        for i, ( sort_key, sequence, event ) in enumerate(self.waiting):
+            if event.runner is runner:
+                self.waiting[i] = self.waiting[-1]
+                self.waiting.pop()
+                heapq.heapify(self.waiting)
+                self.priority_stats(event.priority)['waiting'] -= 1
+                return event
+        return None
+
+    def work_start(self, event):
+        priority_stats = self.priority_stats(event.priority)
+        wait_duration = time.monotonic() - event.created_clock
+        priority_stats['run'] += 1
+        priority_stats['wait_duration'] += wait_duration
+        if wait_duration > priority_stats['wait_duration_max']:
+            priority_stats['wait_duration_max'] = wait_duration
+        super(PriorityConcurrencyQueue, self).work_start(event)
+
+    def stats_snapshot(self):
+        stats = super(PriorityConcurrencyQueue, self).stats_snapshot()
+        priorities = {}
+        for priority, priority_stats in list(self._priority_stats.items()):
+            priority_stats = priority_stats.copy()
+            priority_stats['wait_duration_avg'] = 0
+            if priority_stats['run']:
+                priority_stats['wait_duration_avg'] = priority_stats['wait_duration'] / priority_stats['run']
+            priorities[priority] = priority_stats
+        stats['priorities'] = priorities
+        return stats
+
+class FairLane(object):
+    """ The waiting jobs of a single caller in a FairConcurrencyQueue
+    """
+    __slots__ = ('events', 'deficit')
+
+    def __init__(self):
+        self.events = collections.deque()
+        self.deficit = 0
+
+class FairConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that keeps a separate waitlist for each caller
+        and serves them with deficit round robin so that one busy caller
+        can't starve the others.
+
+        - fair_key: how callers are told apart. Either the name of an
+            INVOCATION/EVENT `details` entry or a callable invoked with the
+            `details`. By default the `caller_authid` is used, falling back
+            to the `caller` session id. Both are only present when the caller
+            discloses itself, which `WAMPClient.call()` does
+        - weights: dict of caller key to weight. A caller with weight 2 gets
+            twice as many jobs started as one with weight 1 while both
+            have jobs waiting. Weights must be positive
+        - weight_default: weight of callers not found in `weights`
+        - caller_queue_max: maximum number of jobs a single caller may have
+            waiting. 0 means no limit beyond the queue wide `queue_max`
+    """
+
+    def init(self,
+            fair_key=None,
+            weights=None,
+            weight_default=1,
+            caller_queue_max=0,
+            **kwargs):
+        weights = weights or {}
+        for caller, weight in weights.items():
+            if weight <= 0:
+                raise ValueError("Weight of caller '{}' must be positive".format(caller))
+        if weight_default <= 0:
+            raise ValueError("weight_default must be positive")
+        self.fair_key = fair_key
+        self.weights = weights
+        self.weight_default = weight_default
+        self.caller_queue_max = caller_queue_max
+
+    def reset(self):
+        super(FairConcurrencyQueue, self).reset()
+        self.waiting = collections.deque()
+        self.lanes = {}
+        self.waiting_count = 0
+        self._caller_stats = {}
+
+    def stats_reset(self):
+        super(FairConcurrencyQueue, self).stats_reset()
+        for caller_stats in list(self._caller_stats.values()):
+            for k in caller_stats:
+                caller_stats[k] = 0
+
+    def job_caller(self, event):
+        """ Returns the key of the caller the job belongs to
+        """
+        message = event.runner.message
+        details = message and message.get('details')
+        if not isinstance(details, dict):
+            details = {}
+
+        if callable(self.fair_key):
+            return self.fair_key(details)
+        if self.fair_key:
+            return details.get(self.fair_key)
+        return details.get('caller_authid', details.get('caller'))
+
+    def caller_weight(self, caller):
+        return self.weights.get(caller, self.weight_default)
+
+    def caller_stats(self, caller):
+        if caller not in self._caller_stats:
+            self._caller_stats[caller] = {
+                'run': 0,
+                'rejected': 0,
+                'wait_duration': 0,
+                'wait_duration_max': 0,
+            }
+        return self._caller_stats[caller]
+
+    def waitlist_count(self):
+        return self.waiting_count
+
+    def job_prepare(self, event):
+        event.caller = self.job_caller(event)
+        super(FairConcurrencyQueue, self).job_prepare(event)
+
+    def job_should_reject(self, event):
+        if self.caller_queue_max:
+            lane = self.lanes.get(event.caller)
+            if lane and len(lane.events) >= self.caller_queue_max:
+                return True
+        return super(FairConcurrencyQueue, self).job_should_reject(event)
+
+    def job_reject(self, event):
+        self.caller_stats(event.caller)['rejected'] += 1
+
+    def waitlist_push(self, event):
+        # `waiting` holds the callers that have jobs waiting in the
+        # order they will be served
+        lane = self.lanes.get(event.caller)
+        if lane is None:
+            lane = self.lanes[event.caller] = FairLane()
+            self.waiting.append(event.caller)
+        lane.events.append(event)
+        self.waiting_count += 1
+
+    def waitlist_pop(self):
+        while self.waiting:
+            caller = self.waiting[0]
+            lane = self.lanes[caller]
+
+            # A caller at the head of the line with no deficit left
+            # is starting a new turn
+            if lane.deficit < 1:
+                lane.deficit += self.caller_weight(caller)
+                if lane.deficit < 1:
+                    self.waiting.rotate(-1)
+                    continue
+
+            event = lane.events.popleft()
+            lane.deficit -= 1
+            self.waiting_count -= 1
+
+            # Callers with nothing left waiting drop out of the rotation
+            # and those that used up their turn go to the back of the line
+            if not lane.events:
+                self.waiting.popleft()
+                del self.lanes[caller]
+            elif lane.deficit < 1:
+                self.waiting.rotate(-1)
+            return event
+        return None
+
+    def waitlist_events(self):
+        return [ event for lane in self.lanes.values() for event in lane.events ]
+
+    def waitlist_remove(self, runner):
+        for caller, lane in list(self.lanes.items()):
+            for event in lane.events:
+                if event.runner is not runner:
+                    continue
+                lane.events.remove(event)
+                self.waiting_count -= 1
+                if not lane.events:
+                    self.waiting.remove(caller)
+                    del self.lanes[caller]
+                return event
+        return None
+
+    def work_start(self, event):
+        caller_stats = self.caller_stats(event.caller)
+        wait_duration = time.monotonic() - event.created_clock
+        caller_stats['run'] += 1
+        caller_stats['wait_duration'] += wait_duration
+        if wait_duration > caller_stats['wait_duration_max']:
+            caller_stats['wait_duration_max'] = wait_duration
+        super(FairConcurrencyQueue, self).work_start(event)
+
+    def stats_snapshot(self):
+        stats = super(FairConcurrencyQueue, self).stats_snapshot()
+        callers = {}
+        for caller, caller_stats in list(self._caller_stats.items()):
+            caller_stats = caller_stats.copy()
+            lane = self.lanes.get(caller)
+            caller_stats['waiting'] = lane and len(lane.events) or 0
+            caller_stats['wait_duration_avg'] = 0
+            if caller_stats['run']:
+                caller_stats['wait_duration_avg'] = caller_stats['wait_duration'] / caller_stats['run']
+            callers[caller] = caller_stats
+        stats['callers'] = callers
+        return stats
+
+class RateLimitedConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that also limits how often jobs get started
+        using a token bucket. Each job takes a token and tokens are added
+        back at `rate` per second up to `burst`. Jobs that arrive when
+        the bucket is empty wait on the waitlist and are started by a
+        timer once a token is available so nothing polls. `concurrency_max`
+        and `queue_max` still apply as usual so jobs that can't fit on
+        the waitlist are rejected with ExWaitlistFull.
+
+        - rate: tokens added per second. Must be greater than 0
+        - burst: size of the bucket. Defaults to `rate` (or 1 if that's
+            smaller) so up to a second's worth of jobs can start at once.
+            Must be at least 1 as every job needs a whole token
+    """
+
+    def init(self, rate=1, burst=None, **kwargs):
+        if burst is None:
+            burst = max(1, rate)
+        self.rate_check(rate, burst)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = self.burst
+        self.tokens_updated = time.monotonic()
+        self.scheduler = None
+        self.wakeup_timer = None
+
+    def rate_check(self, rate, burst):
+        """ Raises ValueError if the bucket could never hand out a token
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+
+    def configure(self, **kwargs):
+        if 'rate' in kwargs or 'burst' in kwargs:
+            self.rate_check(
+                kwargs.get('rate', self.rate),
+                kwargs.get('burst', self.burst),
+            )
+        super(RateLimitedConcurrencyQueue, self).configure(**kwargs)
+        if 'rate' in kwargs or 'burst' in kwargs:
+            self.tokens_refill()
+            for k in ( 'rate', 'burst' ):
+                if k in kwargs:
+                    setattr(self, k, kwargs[k])
+            self.tokens = min(self.tokens, self.burst)
+            self.queue.put(ConcurrencyEvent(EV_WAKEUP))
+
+    def tokens_available(self, now=None):
+        """ Returns the number of tokens in the bucket
+        """
+        elapsed = ( now or time.monotonic() ) - self.tokens_updated
+        return min(self.burst, self.tokens + elapsed * self.rate)
+
+    def tokens_refill(self):
+        now = time.monotonic()
+        self.tokens = self.tokens_available(now)
+        self.tokens_updated = now
+
+    def queue_full(self):
+        """ Also reports the queue as full while the bucket is empty
+        """
+        if super(RateLimitedConcurrencyQueue, self).queue_full():
+            return True
+        self.tokens_refill()
+        return self.tokens < 1
+
+    def job_should_wait(self, event):
+        # New jobs don't get to take a token ahead of the ones
+        # that are already waiting for one
+        if self.waitlist_count():
+            return True
+        return self.queue_full()
+
+    def work_start(self, event):
+        self.tokens -= 1
+        super(RateLimitedConcurrencyQueue, self).work_start(event)
+
+    def wakeup_schedule(self):
+        """ Makes sure the queue gets woken up when the next token is
+            available if there are jobs waiting on one. If the queue is at
+            its concurrency limit a finishing job will wake it instead
+        """
+        if self.wakeup_timer is not None:
+            return
+        if not self.waitlist_count():
+            return
+        if super(RateLimitedConcurrencyQueue, self).queue_full():
+            return
+        if self.scheduler is None:
+            self.scheduler = TimerScheduler()
+        delay = max(0, ( 1 - self.tokens_available() ) / self.rate)
+        self.wakeup_timer = self.scheduler.call_later(
+                                delay,
+                                self.queue.put,
+                                ConcurrencyEvent(EV_WAKEUP)
+                            )
+
+    def queue_init(self, event):
+        super(RateLimitedConcurrencyQueue, self).queue_init(event)
+        self.wakeup_schedule()
+
+    def queue_drain(self):
+        super(RateLimitedConcurrencyQueue, self).queue_drain()
+        self.wakeup_schedule()
+
+    def queue_event(self, event):
+        if event.type == EV_WAKEUP and self.wakeup_timer is not None:
+            self.wakeup_timer.cancel()
+            self.wakeup_timer = None
+        super(RateLimitedConcurrencyQueue, self).queue_event(event)
+
+    def stats_snapshot(self):
+        stats = super(RateLimitedConcurrencyQueue, self).stats_snapshot()
+        stats['tokens'] = self.tokens_available()
+        stats['rate'] = self.rate
+        stats['burst'] = self.burst
+        return stats
+
+    def run(self):
+        try:
+            super(RateLimitedConcurrencyQueue, self).run()
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.shutdown()
+
+class AdaptiveConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that tunes its own `concurrency_max` based on
+        how long jobs take to run. Every `adaptive_window` completed jobs
+        the average run time of the window is compared with a
+        baseline and the limit is adjusted through `configure()`, the same
+        path a manual change takes.
+
+        - adaptive_min / adaptive_max: bounds for the limit
+        - adaptive_algorithm: one of
+            'gradient': the limit is scaled by how far the recent run time
+                has drifted from the baseline, plus some headroom
+                to probe for more capacity while jobs are waiting
+            'aimd': the limit goes up by one after a window where jobs were
+                waiting on it and is multiplied by `adaptive_backoff` when
+                the recent run time goes above `adaptive_tolerance` times
+                the baseline
+        - adaptive_window: number of completed jobs per adjustment
+        - adaptive_tolerance: how much slower than usual jobs may run before
+            the limit is brought down
+        - adaptive_backoff: factor the 'aimd' limit is multiplied by on
+            a decrease
+        - adaptive_history: number of adjustments kept for `stats()`
+
+        The limit only changes after windows where it was actually holding
+        jobs back (or all the slots were taken) so an idle queue neither
+        drifts up to `adaptive_max` nor loses slots to a noisy window. If
+        `concurrency_max` is not set it starts at `adaptive_min`
+    """
+
+    def init(self,
+            adaptive_min=1,
+            adaptive_max=100,
+            adaptive_algorithm='gradient',
+            adaptive_window=20,
+            adaptive_tolerance=1.5,
+            adaptive_backoff=0.9,
+            adaptive_history=50,
+            **kwargs):
+        if adaptive_algorithm not in ( 'gradient', 'aimd' ):
+            raise ValueError("Unknown adaptive_algorithm '{}'".format(adaptive_algorithm))
+        self.adaptive_min = adaptive_min
+        self.adaptive_max = adaptive_max
+        self.adaptive_algorithm = adaptive_algorithm
+        self.adaptive_window = adaptive_window
+        self.adaptive_tolerance = adaptive_tolerance
+        self.adaptive_backoff = adaptive_backoff
+        self.adaptive_history = collections.deque(maxlen=adaptive_history)
+
+        self.adaptive_samples = []
+        self.adaptive_saturated = False
+        self.adaptive_baseline = None
+        self.adaptive_limit = min(max(self.concurrency_max or adaptive_min, adaptive_min), adaptive_max)
+        self.configure(concurrency_max=int(self.adaptive_limit))
+
+    def configure(self, **kwargs):
+        super(AdaptiveConcurrencyQueue, self).configure(**kwargs)
+
+        # A limit set by hand becomes the new starting point
+        limit = kwargs.get('concurrency_max')
+        if limit is not None and hasattr(self, 'adaptive_limit') \
+                and int(self.adaptive_limit) != limit:
+            self.adaptive_limit = limit
+
+    def job_queued(self, event):
+        self.adaptive_saturated = True
+
+    def work_start(self, event):
+        super(AdaptiveConcurrencyQueue, self).work_start(event)
+        if self.queue_full():
+            self.adaptive_saturated = True
+
+    def queue_exit(self, event):
+        super(AdaptiveConcurrencyQueue, self).queue_exit(event)
+        if event.ended_clock is None or event.started_clock is None:
+            return
+        self.adaptive_samples.append(event.ended_clock - event.started_clock)
+        if len(self.adaptive_samples) >= self.adaptive_window:
+            self.adaptive_update()
+
+    def adaptive_update(self):
+        """ Works out the new limit from the run times of the last window
+        """
+        short = sum(self.adaptive_samples) / len(self.adaptive_samples)
+        saturated = self.adaptive_saturated or self.waitlist_count() > 0
+        self.adaptive_samples = []
+        self.adaptive_saturated = False
+
+        # The baseline is the quickest window we've seen and stands for how
+        # long jobs take when nothing is overloaded. It creeps up a little
+        # every window so that a service that became slower for good gets
+        # a new baseline eventually
+        if self.adaptive_baseline is None or short < self.adaptive_baseline:
+            self.adaptive_baseline = short
+        else:
+            self.adaptive_baseline *= 1.01
+        baseline = self.adaptive_baseline
+
+        # While the queue runs below its limit the limit isn't what decides
+        # how busy the backend is, so a slow window (often just noise on
+        # a quiet queue) is no reason to take a slot away
+        limit = self.adaptive_limit
+        if not saturated:
+            pass
+        elif self.adaptive_algorithm == 'gradient':
+            gradient = 1.0
+            if short > 0:
+                gradient = max(0.5, min(1.0, self.adaptive_tolerance * baseline / short))
+            headroom = math.sqrt(limit)
+            limit = limit * 0.8 + ( limit * gradient + headroom ) * 0.2
+        else:
+            if short > baseline * self.adaptive_tolerance:
+                limit = limit * self.adaptive_backoff
+            else:
+                limit = limit + 1
+
+        limit = min(max(limit, self.adaptive_min), self.adaptive_max)
+        self.adaptive_limit = limit
+        self.adaptive_history.append({
+            'timestamp': time.time(),
+            'limit': int(limit),
+            'run_duration': short,
+            'run_duration_baseline': baseline,
+            'saturated': saturated,
+        })
+
+        if int(limit) != self.concurrency_max:
+            self.configure(concurrency_max=int(limit))
+
+    def stats_snapshot(self):
+        stats = super(AdaptiveConcurrencyQueue, self).stats_snapshot()
+        stats['concurrency_max'] = self.concurrency_max
+        stats['adaptive'] = {
+            'algorithm': self.adaptive_algorithm,
+            'limit': self.adaptive_limit,
+            'min': self.adaptive_min,
+            'max': self.adaptive_max,
+            'run_duration_baseline': self.adaptive_baseline,
+            'history': list(self.adaptive_history),
+        }
+        return stats
+
+class ShardLane(object):
+    """ The jobs of a single shard in a ShardedConcurrencyQueue
+    """
+    __slots__ = ('events', 'running', 'ready', 'run', 'waitlist_max')
+
+    def __init__(self):
+        self.events = collections.deque()
+        self.running = False
+        self.ready = False
+        self.run = 0
+        self.waitlist_max = 0
+
+class ShardedConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that keeps jobs in order per key while running
+        jobs for different keys in parallel. The key of each job is
+        hashed into one of `shards` lanes. A lane runs one job at a time,
+        in the order they arrived, while the lanes run alongside each
+        other up to `concurrency_max` (0 for no limit beyond `shards`).
+
+        - shards: number of lanes
+        - shard_key: where the key comes from. An int picks a positional
+            argument of the INVOCATION/EVENT, a string names a keyword
+            argument, falling back to a `details` entry, and a callable is
+            invoked with the message itself. Defaults to the first
+            positional argument. Jobs without a key all go to the same lane
+    """
+
+    def init(self, shards=16, shard_key=0, **kwargs):
+        self.shards = shards
+        self.shard_key = shard_key
+
+    def reset(self):
+        super(ShardedConcurrencyQueue, self).reset()
+        self.lanes = {}
+        self.ready = collections.deque()
+        self.waiting_count = 0
+
+    def stats_reset(self):
+        super(ShardedConcurrencyQueue, self).stats_reset()
+        for lane in list(self.lanes.values()):
+            lane.run = 0
+            lane.waitlist_max = 0
+
+    def job_shard_key(self, event):
+        """ Returns the key the job is sharded by
+        """
+        message = event.runner.message
+        if callable(self.shard_key):
+            return self.shard_key(message)
+        if message is None:
+            return None
+
+        if isinstance(self.shard_key, int):
+            args = message.get('args') or []
+            if len(args) > self.shard_key:
+                return args[self.shard_key]
+            return None
+
+        kwargs = message.get('kwargs') or {}
+        if self.shard_key in kwargs:
+            return kwargs[self.shard_key]
+        details = message.get('details')
+        if isinstance(details, dict):
+            return details.get(self.shard_key)
+        return None
+
+    def job_shard(self, event):
+        """ Returns the index of the lane the job belongs in
+        """
+        key = self.job_shard_key(event)
+        try:
+            key_hash = hash(key)
+        except TypeError:
+            key_hash = hash(repr(key))
+        return key_hash % self.shards
+
+    def lane_get(self, shard):
+        lane = self.lanes.get(shard)
+        if lane is None:
+            lane = self.lanes[shard] = ShardLane()
+        return lane
+
+    def lane_ready(self, shard, lane):
+        if not lane.ready:
+            lane.ready = True
+            self.ready.append(shard)
+
+    def waitlist_count(self):
+        return self.waiting_count
+
+    def job_prepare(self, event):
+        event.shard = self.job_shard(event)
+        super(ShardedConcurrencyQueue, self).job_prepare(event)
+
+    def job_should_wait(self, event):
+        # Anything already waiting in the lane has to go first
+        lane = self.lane_get(event.shard)
+        if lane.running or lane.events:
+            return True
+        return self.queue_full()
+
+    def waitlist_push(self, event):
+        lane = self.lane_get(event.shard)
+        lane.events.append(event)
+        self.waiting_count += 1
+        if len(lane.events) > lane.waitlist_max:
+            lane.waitlist_max = len(lane.events)
+        if not lane.running:
+            self.lane_ready(event.shard, lane)
+
+    def waitlist_pop(self):
+        while self.ready:
+            shard = self.ready.popleft()
+            lane = self.lanes[shard]
+            lane.ready = False
+            if lane.running or not lane.events:
+                continue
+            event = lane.events.popleft()
+            self.waiting_count -= 1
+
+            # If the job doesn't get started after all (eg. it expired)
+            # the lane needs to be looked at again
+            if lane.events:
+                self.lane_ready(shard, lane)
+            return event
+        return None
+
+    def waitlist_events(self):
+        return [ event for lane in self.lanes.values() for event in lane.events ]
+
+    def waitlist_remove(self, runner):
+        for lane in list(self.lanes.values()):
+            for event in lane.events:
+                if event.runner is not runner:
+                    continue
+                lane.events.remove(event)
+                self.waiting_count -= 1
+                return event
+        return None
+
+    def work_start(self, event):
+        lane = self.lane_get(event.shard)
+        lane.running = True
+        lane.run += 1
+        try:
+            super(ShardedConcurrencyQueue, self).work_start(event)
+        except Exception:
+            lane.running = False
+            if lane.events:
+                self.lane_ready(event.shard, lane)
+            raise
+
+    def queue_exit(self, event):
+        started = self.active_threads.get(event.id)
+        super(ShardedConcurrencyQueue, self).queue_exit(event)
+        if started is None:
+            return
+        lane = self.lane_get(started.shard)
+        lane.running = False
+        if lane.events:
+            self.lane_ready(started.shard, lane)
+
+    def stats_snapshot(self):
+        stats = super(ShardedConcurrencyQueue, self).stats_snapshot()
+        lanes = {}
+        for shard, lane in list(self.lanes.items()):
+            lanes[shard] = {
+                'waiting': len(lane.events),
+                'running': lane.running,
+                'run': lane.run,
+                'waitlist_max': lane.waitlist_max,
+            }
+        stats['shards'] = self.shards
+        stats['lanes'] = lanes
+        return stats
+
+class InlineConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that runs the handlers right away in the thread
+        that submits them. For the client that's the reader thread (or the
+        bulk dispatch lane with `dispatch_lanes`) so there's no thread
+        handoff at all, which makes a big difference for handlers that only
+        take microseconds. The client uses it for the 'inline' queue.
+
+        While a handler runs nothing else is read from the transport so
+        handlers must be quick and must never wait on the router (eg. by
+        calling `call()`), that would deadlock the client. There's no
+        waitlist, `concurrency_max` and `queue_max` don't apply.
+
+        - slow_threshold: seconds a handler may take before it's counted
+            as `slow` in `stats()` and reported in the log
+        - slow_log_interval: minimum seconds between log warnings about
+            the same handler
+    """
+
+    def init(self, slow_threshold=0.01, slow_log_interval=60, **kwargs):
+        self.lock = threading.Lock()
+        self.slow_threshold = slow_threshold
+        self.slow_log_interval = slow_log_interval
+
+    def reset(self):
+        super(InlineConcurrencyQueue, self).reset()
+        self._stats['slow'] = 0
+        self.slow_handlers = {}
+
+    def stats_reset(self):
+        super(InlineConcurrencyQueue, self).stats_reset()
+        self.slow_handlers = {}
+
+    def put(self, runner):
+        self.job_run(runner, runner.execute)
+
+    def put_threaded(self, runner):
+        """ Like `put` but the runner gets a thread of its own. For jobs
+            submitted from threads that mustn't be held up by the handler,
+            such as the client's TimerScheduler
+        """
+        self.job_run(runner, runner.start)
+
+    def job_run(self, runner, launch):
+        """ Does the bookkeeping for a new job then runs it with `launch`
+        """
+        event = ConcurrencyEvent(EV_INIT, runner)
+        try:
+            with self.lock:
+                self._stats['messages'] += 1
+                self.owner_count(runner, 'messages')
+                self.bytes_acquire(event)
+                self._stats['run'] += 1
+                self.owner_count(runner, 'run')
+                self.owner_count(runner, 'running')
+                self.active_threads[event.id] = event
+        except Exception as ex:
+            self.job_error(event, ex)
+            return
+
+        # Coroutines are scheduled on the event loop and report back
+        # through `put_exit` when done like any other
+        try:
+            launch(self)
+
+        # Subscription handlers have no one to report their errors to
+        # and there's no thread to print them either so they get logged
+        except Exception as ex:
+            logger.error("Inline job {name} on queue {queue_name} failed: {ex}\n{traceback}".format(
+                name=self.job_name(event),
+                queue_name=self.queue_name,
+                ex=ex,
+                traceback=traceback.format_exc(),
+            ))
+
+            # If the runner never got going it won't tell us it's done
+            if runner.started_clock is None:
+                self.put_exit(runner)
+            self.job_error(event, ex)
+
+    def job_error(self, event, ex):
+        """ Counts the failed job and lets its runner know
+        """
+        with self.lock:
+            self._stats['errors'] += 1
+        try:
+            event.handle_error(ex)
+        except Exception as ex:
+            logger.warning(f"Exception handler failed: {ex}")
+
+    def put_exit(self, runner):
+        event = ConcurrencyEvent(EV_EXIT, runner)
+        with self.lock:
+            self.queue_exit(event)
+        self.job_slow_check(event)
+
+    def put_cancel(self, runner):
+        # Nothing ever waits so all there is to do is count it
+        with self.lock:
+            self._stats['cancelled'] += 1
+
+    def job_name(self, event):
+        """ Returns the name slow handlers are reported under
+        """
+        uri = getattr(event.runner, 'uri', None)
+        if uri:
+            return uri
+        handler = event.runner.handler
+        return getattr(handler, '__qualname__', None) or repr(handler)
+
+    def job_slow_check(self, event):
+        """ Records handlers that held up the thread for longer than
+            `slow_threshold`
+        """
+        if not self.slow_threshold:
+            return
+        if event.ended_clock is None or event.started_clock is None:
+            return
+        run_duration = event.ended_clock - event.started_clock
+        if run_duration < self.slow_threshold:
+            return
+
+        # Coroutines give the thread back while they await and runners
+        # from `put_threaded` don't hold up anyone else's thread
+        if event.runner.is_coroutine() or event.runner.ident is not None:
+            return
+
+        name = self.job_name(event)
+        now = time.monotonic()
+        with self.lock:
+            self._stats['slow'] += 1
+            slow = self.slow_handlers.get(name)
+            if slow is None:
+                slow = self.slow_handlers[name] = {
+                    'count': 0,
+                    'run_duration_max': 0,
+                    'logged': None,
+                }
+            slow['count'] += 1
+            slow['run_duration_max'] = max(slow['run_duration_max'], run_duration)
+            if slow['logged'] is not None \
+                    and now - slow['logged'] < self.slow_log_interval:
+                return
+            slow['logged'] = now
+
+        logger.warning(f"Inline handler {name} on queue {self.queue_name} took "
+                       f"{run_duration*1000:.1f}ms, over the {self.slow_threshold*1000:.1f}ms "
+                       f"limit ({slow['count']} times so far). Slow handlers hold up the "
+                       f"reader thread and belong on a threaded queue")
+
+    def stats_snapshot(self):
+        with self.lock:
+            stats = super(InlineConcurrencyQueue, self).stats_snapshot()
+            stats['slow_handlers'] = {
+                name: {
+                    'count': slow['count'],
+                    'run_duration_max': slow['run_duration_max'],
+                }
+                for name, slow in self.slow_handlers.items()
+            }
+        return stats
+
+    def run(self):
+        # Jobs never go through the event queue so there's nothing to
+        # do but wait for the shutdown
+        while self.active:
+            event = self.queue.get()
+            if event.type == EV_SHUTDOWN:
+                break
+
+def process_pool_invoke(handler, data):
+    """ Runs within the worker process. Rebuilds the message from its
+        packaged form and hands it off to the handler
+    """
+    message = WampMessage.load(data)
+    result = handler(
+        message,
+        *(message.args),
+        **(message.kwargs)
+    )
+
+    # Coroutine handlers get an event loop of their own in the worker
+    if inspect.iscoroutine(result):
+        result = asyncio.run(result)
+
+    # Generators can't be sent back to the parent so the chunks
+    # are collected into a list
+    elif inspect.isgenerator(result):
+        result = list(result)
+    elif inspect.isasyncgen(result):
+        async def collect(chunks):
+            return [ chunk async for chunk in chunks ]
+        result = asyncio.run(collect(result))
+
+    return result
+
+class ProcessPoolConcurrencyQueue(ConcurrencyQueue):
+    """ A ConcurrencyQueue that runs the handlers in a pool of worker
+        processes so that CPU bound handlers aren't serialized by the GIL.
+        The handler must be picklable (eg. a module level function) and
+        its return value must be picklable as well. The handler receives
+        a copy of the message so changes made to it are not seen by the
+        parent process. Additional configuration keys:
+
+        - processes: number of worker processes. Defaults to the CPU count
+        - mp_context: multiprocessing start method such as 'spawn' or
+            'forkserver'. Defaults to the platform default
+
+        If `concurrency_max` is not set, it defaults to `processes` so that
+        `queue_max` still applies to the jobs waiting on a free process
+    """
+    def __init__(self,
+                queue_name=None,
+                processes=None,
+                mp_context=None,
+                **kwargs
+                ):
+        self.processes = processes or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.executor = None
+        super(ProcessPoolConcurrencyQueue, self).__init__(queue_name, **kwargs)
+
+    def executor_get(self):
+        """ Returns the process pool, creating it if required
+        """
+        if self.executor is None:
+            mp_context = self.mp_context
+            if isinstance(mp_context, str):
+                mp_context = multiprocessing.get_context(mp_context)
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                                max_workers=self.processes,
+                                mp_context=mp_context,
+                            )
+        return self.executor
+
+    def queue_full(self):
+        concurrency_max = self.concurrency_max or self.processes
+        if self.active_count() >= concurrency_max:
+            return True
+        return False
+
+    def runner_start(self, event):
+        runner = event.runner
+        runner._queue = self
+        runner.mark_started()
+
+        data = runner.message.package()
+        try:
+            future = self.executor_get().submit(process_pool_invoke, runner.handler, data)
+
+        # If a worker died abruptly the pool is no longer usable. We
+        # start a fresh one and give it another go. The broken one still
+        # has to be shut down or its processes and thread hang around
+        except concurrent.futures.process.BrokenProcessPool:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            future = self.executor_get().submit(process_pool_invoke, runner.handler, data)
+
+        runner.future = future
+        future.add_done_callback(lambda future: self.runner_finished(runner, future))
+
+    def runner_finished(self, runner, future):
+        """ Invoked by the process pool when the job has completed
+        """
+        try:
+            try:
+                result = future.result()
+
+            # Cancelled before a worker process picked it up
+            except concurrent.futures.CancelledError:
                 pass
+            except Exception as ex:
+                # Subscription handlers have no one to report their errors
+                # to so they get logged like the ones run on the event loop
+                if runner.message == WAMP_EVENT:
+                    logger.error("Subscription handler failed: {ex}\n{traceback}".format(
+                        ex=ex,
+                        traceback=''.join(traceback.format_exception(
+                                      type(ex), ex, ex.__traceback__
+                                  )),
+                    ))
+                runner.handle_error(ex)
+            else:
+                runner.handle_result(result)
+        except Exception as ex:
+            logger.warning(f"Handling of process pool result failed: {ex}")
+        finally:
+            runner.mark_ended()
+            self.put_exit(runner)
 
+    def run(self):
+        try:
+            super(ProcessPoolConcurrencyQueue, self).run()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
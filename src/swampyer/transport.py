@@ -40,6 +40,11 @@ def register_transport(code):
 
 
 class Transport(object):
+
+    # Length of the last frame returned by `next()`, before it was
+    # deserialized. Used to account for the memory a message takes up
+    last_frame_size = 0
+
     def __init__(self, url, serializers=None, **options):
         self.url = url
         self.socket = None
@@ -89,8 +94,25 @@ class Transport(object):
     def recv_data(self, control_frame=True):
         raise ExNotImplemented("recv_data is not implemented")
 
+    def next_frame(self):
+        """ Returns the payload of the next message frame as it came off
+            the wire or None if there wasn't one
+        """
+        raise ExNotImplemented("next_frame is not implemented")
+
+    def decode(self, frame):
+        """ Deserializes a frame returned by `next_frame`. Doesn't touch
+            the connection so it's safe to call from any thread
+        """
+        return self.serializer.loads(frame)
+
     def next(self):
-        raise ExNotImplemented("next is not implemented")
+        """ Returns the next deserialized message
+        """
+        frame = self.next_frame()
+        if frame is None:
+            return
+        return self.decode(frame)
 
 if HAS_ALT_WEBSOCKETS_LIBRARY:
 
@@ -194,10 +216,11 @@ if HAS_ALT_WEBSOCKETS_LIBRARY:
             except Exception as ex:
                 raise ex
 
-        def next(self):
+        def next_frame(self):
             try:
                 data = self.recv_data()
-                return self.serializer.loads(data)
+                self.last_frame_size = len(data)
+                return data
             except wse.ConnectionClosedOK:
                 raise ExWAMPConnectionError("WAMP is currently disconnected!")
             except ExWAMPConnectionError:
@@ -313,17 +336,20 @@ else:
         def recv_data(self, control_frame=True):
             return self.socket.recv_data(control_frame)
 
-        def next(self):
+        def next_frame(self):
             """ Returns the next  buffer element
             """
             try:
                 opcode, data = self.recv_data(control_frame=True)
 
+                if opcode in ( websocket.ABNF.OPCODE_TEXT, websocket.ABNF.OPCODE_BINARY ):
+                    self.last_frame_size = len(data)
+
                 if opcode == websocket.ABNF.OPCODE_TEXT:
                     # Try to decode the data as a utf-8 string. Replace any inconvertible characters
                     # to the unicode `\uFFFD` character
                     data = data.decode('utf-8', 'replace')
-                    return self.serializer.loads(data)
+                    return data
 
                 if opcode == websocket.ABNF.OPCODE_CLOSE:
                     # Try to decode the data as a utf-8 string. Replace any inconvertible characters
@@ -335,7 +361,7 @@ else:
                     raise ExWAMPConnectionError(reason_text)
 
                 if opcode == websocket.ABNF.OPCODE_BINARY:
-                    return self.serializer.loads(data)
+                    return data
 
                 if opcode == websocket.ABNF.OPCODE_PONG:
                     duration = time.time() - float(data)
@@ -362,6 +388,105 @@ else:
             except ExWAMPConnectionError:
                 raise
 
+def rawsocket_handshake(serializer_code, buffer_size):
+    """ Returns the 4 byte handshake a rawsocket client opens the
+        connection with
+    """
+
+    # As noted in https://github.com/wamp-proto/wamp-proto/blob/master/rfc/text/advanced/ap_transport_rawsocket.md
+    #
+    # Client sends 4 bytes:
+    #
+    # Byte 1: 0x7F
+    # 
+    # Byte 2: High nybble: Length, Low nybble: Serializer
+    #       Length: Maximum message length client wishes to receive
+    #               0: 2**9 octets
+    #               1: 2**10 octets
+    #               ...
+    #               15: 2**24 octets
+    # 
+    #       Serializer: Numeric constants to identify what to use
+    #               1: JSON
+    #               2: MessagePack
+    #               3 - 15: Reserved
+    try:
+        serializer = SERIALIZERS.index(serializer_code) + 1
+    except ValueError:
+        raise ExWAMPConnectionError("Unknown serializer '{}' requested".format(serializer_code))
+    return struct.pack(
+                '!BBBB',
+                0x7f,
+                buffer_size << 4 | serializer,
+                0, 0 # Reserved
+            )
+
+def rawsocket_handshake_parse(server_handshake, serializer_code):
+    """ Validates the server's response to our handshake. `server_handshake`
+        should be the 4 bytes sent back by the server. Returns the maximum
+        message length the server is willing to receive
+    """
+    serializer = SERIALIZERS.index(serializer_code) + 1
+
+    server_magic = server_handshake[0:1]
+    if server_magic != b'\x7f':
+        raise ExWAMPConnectionError("Server is not speaking RawSocket. Received '{}' instead!".format(server_magic))
+
+    # Then next 3 bytes
+    server_handshake = struct.unpack('!B',server_handshake[1:2])[0]
+    server_serializer = server_handshake & 0x0f
+    server_buffer_size = server_handshake >> 4 | 0x0f
+
+    # If serializer is 0x00, there was an error
+    if server_serializer == 0x00:
+        raise ExWAMPConnectionError(RAWSOCKET_HANDSHAKE_ERRORS[server_buffer_size])
+
+    # Otherwise, we're still good and can parse things out
+    if server_serializer != serializer:
+        raise ExWAMPConnectionError(
+            "Server didn't want to use the same serializer! Got '{server_serializer}' but expected '{serializer}'".format(
+                server_serializer=server_serializer,
+                serializer=serializer,
+            ))
+
+    return 2**(9+server_buffer_size)
+
+def rawsocket_frame(payload, message_type=RAWSOCKET_MESSAGE_TYPE_REGULAR):
+    """ Wraps the payload in a rawsocket frame
+    """
+    if not isinstance(payload, (bytes, bytearray)):
+        payload = payload.encode('utf8')
+
+    header = struct.pack('!B',message_type)
+
+    # Python doesn't do 24bit ints so we tweak here
+    length = struct.pack('!I',len(payload))[1:]
+
+    return header + length + payload
+
+def rawsocket_header_parse(header):
+    """ Takes the 4 byte frame header and returns a tuple of
+        (message_type, message_length)
+    """
+    message_preamble = header[0]
+
+    magic = message_preamble & 0b11111000
+    if magic != 0:
+        raise ExMessageCorrupt("Received unexpected bits in message preamble")
+
+    # The last three bits of the preamble determine the message
+    # type
+    # 0: regular WAMP message
+    # 1: PING
+    # 2: PONG
+    # 3-7: reserved
+    message_type = message_preamble & 0b00000111
+
+    # The next 3 bytes denote the length of the upcoming serialized data
+    message_length = struct.unpack('!I', b'\0'+header[1:4])[0]
+
+    return message_type, message_length
+
 class RawsocketTransport(Transport):
     """
     Raw Socket transport is detailed here:
@@ -379,67 +504,18 @@ class RawsocketTransport(Transport):
     def perform_handshake(self,serializer_code):
         """ Negotiates the serialization format 
         """
-
-        # As noted in https://github.com/wamp-proto/wamp-proto/blob/master/rfc/text/advanced/ap_transport_rawsocket.md
-        #
-        # Client sends 4 bytes:
-        #
-        # Byte 1: 0x7F
-        # 
-        # Byte 2: High nybble: Length, Low nybble: Serializer
-        #       Length: Maximum message length client wishes to receive
-        #               0: 2**9 octets
-        #               1: 2**10 octets
-        #               ...
-        #               15: 2**24 octets
-        # 
-        #       Serializer: Numeric constants to identify what to use
-        #               1: JSON
-        #               2: MessagePack
-        #               3 - 15: Reserved
-        try:
-            serializer = SERIALIZERS.index(serializer_code) + 1
-        except ValueError:
-            raise ExWAMPConnectionError("Unknown serializer '{}' requested".format(serializer_code))
-        client_handshake = struct.pack(
-                                '!BBBB',
-                                0x7f,
-                                self.buffer_size << 4 | serializer,
-                                0, 0 # Reserved
-                            )
-
+        client_handshake = rawsocket_handshake(serializer_code, self.buffer_size)
         self.socket.send(client_handshake)
 
-                # Server will then respond with 4 bytes
-        server_magic = self.socket.recv(1)
-        if server_magic != b'\x7f':
-            raise ExWAMPConnectionError("Server is not speaking RawSocket. Received '{}' instead!".format(server_magic))
-
-        # Then next 3 bytes
-        server_handshake = struct.unpack('!B',self.socket.recv(1))[0]
-        server_serializer = server_handshake & 0x0f
-        server_buffer_size = server_handshake >> 4 | 0x0f
-
-        # If serializer is 0x00, there was an error
-        if server_serializer == 0x00:
-            raise ExWAMPConnectionError(RAWSOCKET_HANDSHAKE_ERRORS[server_buffer_size])
-
-        # Otherwise, we're still good and can parse things out
-        if server_serializer != serializer:
-            raise ExWAMPConnectionError(
-                "Server didn't want to use the same serializer! Got '{server_serializer}' but expected '{serializer}'".format(
-                    server_serializer=server_serializer,
-                    serializer=self.serializer,
-                ))
+        # Server will then respond with 4 bytes. All of them have to be
+        # read, the last 2 are reserved but would otherwise be taken
+        # for the start of the first frame
+        server_handshake = self.recv_exactly(4)
+        self.server_buffer_size = rawsocket_handshake_parse(server_handshake, serializer_code)
 
         # Serializer okay'd so let's use it
         self.serializer = load_serializer(serializer_code)
 
-        self.server_buffer_size = 2**(9+server_buffer_size)
-
-        # And skip the reserved bytes
-        server_reserved = self.socket.recv(2)
-
         return True
 
     def connect(self, **options):
@@ -462,44 +538,35 @@ class RawsocketTransport(Transport):
         return True
 
     def send(self, payload, message_type=RAWSOCKET_MESSAGE_TYPE_REGULAR):
-        if not isinstance(payload, (bytes, bytearray)):
-            payload = payload.encode('utf8')
-
-        header = struct.pack('!B',message_type)
-
-        # Python doesn't do 24bit ints so we tweak here
-        length = struct.pack('!I',len(payload))[1:]
-
-        send_data = header + length + payload
+        send_data = rawsocket_frame(payload, message_type)
         return self.socket.send(send_data)
 
     def close(self):
         return self.socket.close()
 
+    def recv_exactly(self, size):
+        """ Reads `size` bytes from the socket, waiting on more if they
+            arrive in pieces
+        """
+        data = b''
+        while len(data) < size:
+            received_data = self.socket.recv(size - len(data))
+            if not received_data:
+                raise ExWAMPConnectionError("Connection closed after {} of {} bytes".format(len(data), size))
+            data += received_data
+        return data
+
     def recv_data(self, control_frame=True):
         first_byte = self.socket.recv(1)
         if first_byte is None or len(first_byte) == 0:
             return
-        message_preamble = struct.unpack('!B',first_byte)[0]
         message_contents = self.socket.recv(3)
-
-        magic = message_preamble & 0b11111000
-        if magic != 0:
-            raise ExMessageCorrupt("Received unexpected bits in message preamble")
-
-        # The last three bits of the preamble determine the message
-        # type
-        # 0: regular WAMP message
-        # 1: PING
-        # 2: PONG
-        # 3-7: reserved
-        message_type = message_preamble & 0b00000111
+        message_type, message_length = rawsocket_header_parse(first_byte + message_contents)
 
         # If it's a regular message, the next 3 bytes denote the length of the upcoming
         # serialized data. We will convert that into the expected data length then
         # attempt to read that many bytes from the socket
         if message_type == RAWSOCKET_MESSAGE_TYPE_REGULAR:
-            message_length = struct.unpack('!I', b'\0'+message_contents)[0]
             expected_bytes = message_length
             message_payload = b''
             while expected_bytes:
@@ -524,12 +591,13 @@ class RawsocketTransport(Transport):
         # elif message_type == RAWSOCKET_MESSAGE_TYPE_PONG:
         #    return
 
-    def next(self):
+    def next_frame(self):
         """ Returns the next  buffer element
         """
         message_payload = self.recv_data()
         if not message_payload: return
-        return self.serializer.loads(message_payload)
+        self.last_frame_size = len(message_payload)
+        return message_payload
 
 @register_transport('unix')
 class UnixsocketTransport(RawsocketTransport):
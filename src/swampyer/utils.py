@@ -1,5 +1,104 @@
+import time
+import heapq
 import logging
+import itertools
+import threading
 
 logger = logging.getLogger('swampyer')
 
+class TimerHandle(object):
+    """ Returned by TimerScheduler.call_later. Call `cancel()` to stop
+        the callback from being run
+    """
+    __slots__ = ('scheduler', 'callback', 'args', 'cancelled')
 
+    def __init__(self, scheduler, callback, args):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+
+        # Timers that have already fired are no longer in the heap
+        scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler.timer_cancelled()
+
+class TimerScheduler(threading.Thread):
+    """ Runs callbacks at some point in the future from a single thread so
+        that things like call timeouts don't need a thread each. Callbacks
+        should be quick as they hold up every timer behind them
+    """
+
+    # When this many cancelled timers are sitting in the heap and they
+    # make up more than half of it, the heap gets rebuilt without them
+    compact_threshold = 1000
+
+    def __init__(self):
+        super(TimerScheduler, self).__init__()
+        self.daemon = True
+        self.condition = threading.Condition()
+        self.timers = []
+        self.sequence = itertools.count()
+        self.cancelled = 0
+        self.active = True
+
+    def call_later(self, delay, callback, *args):
+        """ Runs `callback(*args)` after `delay` seconds
+        """
+        handle = TimerHandle(self, callback, args)
+        with self.condition:
+            if not self.active:
+                raise RuntimeError("TimerScheduler has been shutdown")
+            if not self.is_alive():
+                self.start()
+            when = time.monotonic() + delay
+            heapq.heappush(self.timers, (when, next(self.sequence), handle))
+
+            # Only need to wake the thread if this is now the next timer due
+            if self.timers[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def timer_cancelled(self):
+        with self.condition:
+            self.cancelled += 1
+            if self.cancelled > self.compact_threshold \
+               and self.cancelled * 2 > len(self.timers):
+                self.timers = [ timer for timer in self.timers if not timer[2].cancelled ]
+                heapq.heapify(self.timers)
+                self.cancelled = 0
+
+    def shutdown(self):
+        with self.condition:
+            self.active = False
+            self.timers = []
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.active:
+                    return
+                if not self.timers:
+                    self.condition.wait()
+                    continue
+                when, sequence, handle = self.timers[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.timers)
+                handle.scheduler = None
+                if handle.cancelled:
+                    self.cancelled -= 1
+                    continue
+
+            try:
+                handle.callback(*handle.args)
+            except Exception as ex:
+                logger.warning(f"Timer callback failed: {ex}")
@@ -1,4 +1,5 @@
 import os
+import time
 import pathlib
 import json
 import logging
@@ -22,6 +23,62 @@ def load_nexus_db():
     snapshot_data = json.load(snapshot_fh)
     return snapshot_data
 
+def wait_for(condition, timeout=10, interval=0.01):
+    """ Polls `condition` until it returns a true value. Returns False
+        if that hasn't happened after `timeout` seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+def invocation_message(request_id=1, details=None, args=None, kwargs=None):
+    """ Returns an INVOCATION for runners that are put on a queue
+        directly
+    """
+    return swampyer.INVOCATION(
+                request_id=request_id,
+                registration_id=1,
+                details=details or {},
+                args=args or [],
+                kwargs=kwargs or {},
+            )
+
+class RecordingRunner(swampyer.ConcurrencyRunner):
+    """ A ConcurrencyRunner for exercising the queues without a router.
+        When run it adds its `label` to `started`, waits for `release`
+        (if there is one), sleeps for `duration` seconds and then adds its
+        `label` to `ended`. Errors the queue hands it are added to
+        `errors` as `(label, exception)`.
+
+        Any other keyword arguments, such as `options`, `payload_size`,
+        `conflation_key` or `owner`, are set as attributes
+    """
+    def __init__(self, label=None, started=None, release=None, message=None,
+                       duration=0, ended=None, errors=None, **attributes):
+        super(RecordingRunner, self).__init__(None, message)
+        self.label = label
+        self.started = started if started is not None else []
+        self.release = release
+        self.duration = duration
+        self.ended = ended if ended is not None else []
+        self.errors = errors if errors is not None else []
+        for k, v in attributes.items():
+            setattr(self, k, v)
+
+    def work(self):
+        self.started.append(self.label)
+        if self.release is not None:
+            self.release.wait()
+        if self.duration:
+            time.sleep(self.duration)
+        self.ended.append(self.label)
+
+    def handle_error(self, ex):
+        self.errors.append(( self.label, ex ))
+
 TICKET_USERNAME = 'user'
 TICKET_PASSWORD = 'pass'
 
@@ -36,6 +93,7 @@ def connect_service(
           password=None,
           auto_reconnect=False,
           max_payload_size=50_000_000,
+          **kwargs
           ):
 
     # Fixup the host
@@ -69,6 +127,45 @@ def connect_service(
                     concurrency_class=concurrency_class,
                     concurrency_configs=concurrency_configs,
                     max_payload_size=max_payload_size,
+                    **kwargs
                 ).start()
     return client
 
+
+async def connect_async_service(
+          url='ws://NEXUS_HOST:8282/ws',
+          serializer_code=None,
+          timeout=None,
+          username=None,
+          password=None,
+          max_payload_size=50_000_000,
+          ):
+
+    # Fixup the host
+    target_host = os.environ.get('NEXUS_HOST', 'nexus-swampyer')
+    url = url.replace('NEXUS_HOST', target_host)
+
+    snapshot_data = load_nexus_db()
+    users = snapshot_data['users']
+
+    if not username:
+        username = 'backend-1'
+    if password is None:
+        password = users[username]['plaintext_password']
+
+    logging.info(f"Connecting async to: {username}@{url}")
+
+    serializers = None
+    if serializer_code:
+        serializers = [ serializer_code ]
+    client = swampyer.AsyncWAMPClientTicket(
+                    url=url,
+                    username=username,
+                    password=password,
+                    realm=u"izaber",
+                    uri_base="",
+                    timeout=timeout or 10,
+                    serializers=serializers,
+                    max_payload_size=max_payload_size,
+                )
+    return await client.start()
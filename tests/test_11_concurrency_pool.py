@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+These tests drive the concurrency queues directly with simple runners
+so they do not require a connection to the WAMP router
+"""
+
+TRACKER_LOCK = threading.Lock()
+TRACKER = {
+    'active': 0,
+    'active_max': 0,
+    'completed': 0,
+    'threads': set(),
+}
+
+class SleepyRunner(RecordingRunner):
+    def __init__(self, duration):
+        super(SleepyRunner, self).__init__(duration=duration)
+
+    def work(self):
+        with TRACKER_LOCK:
+            TRACKER['active'] += 1
+            TRACKER['threads'].add(threading.get_ident())
+            if TRACKER['active'] > TRACKER['active_max']:
+                TRACKER['active_max'] = TRACKER['active']
+        super(SleepyRunner, self).work()
+        with TRACKER_LOCK:
+            TRACKER['active'] -= 1
+            TRACKER['completed'] += 1
+
+def reset_trackers():
+    TRACKER['active'] = 0
+    TRACKER['active_max'] = 0
+    TRACKER['completed'] = 0
+    TRACKER['threads'] = set()
+
+def test_pooled_queue():
+    reset_trackers()
+
+    concurrency_queue = swampyer.PooledConcurrencyQueue(
+                            'pooled',
+                            concurrency_max=2,
+                            queue_max=0,
+                        )
+    concurrency_queue.start()
+
+    # Workers are spawned up front to match the concurrency limit
+    assert concurrency_queue.stats()['workers'] == 2
+
+    for i in range(10):
+        concurrency_queue.put(SleepyRunner(0.1))
+
+    assert wait_for(lambda: TRACKER['completed'] == 10)
+
+    # Concurrency limits are still honoured and the jobs were run
+    # on the pre-spawned workers only
+    assert TRACKER['active_max'] == 2
+    assert len(TRACKER['threads']) == 2
+
+    assert wait_for(concurrency_queue.queue_empty)
+    stats = concurrency_queue.stats()
+    assert stats['run'] == 10
+    assert stats['waited'] == 8
+    assert stats['workers_spawned'] == 2
+
+    concurrency_queue.shutdown()
+
+def test_pooled_queue_reaping():
+    reset_trackers()
+
+    concurrency_queue = swampyer.PooledConcurrencyQueue(
+                            'reaped',
+                            concurrency_max=4,
+                            workers_min=1,
+                            idle_timeout=0.2,
+                            stack_size=512*1024,
+                        )
+    concurrency_queue.start()
+
+    for i in range(8):
+        concurrency_queue.put(SleepyRunner(0.1))
+    assert wait_for(lambda: TRACKER['completed'] == 8)
+    assert TRACKER['active_max'] == 4
+
+    # Workers above workers_min are reaped once they've idled long enough
+    assert wait_for(lambda: concurrency_queue.stats()['workers'] == 1)
+    assert concurrency_queue.stats()['workers_reaped'] == 3
+
+    concurrency_queue.shutdown()
+
+if __name__ == '__main__':
+    test_pooled_queue()
+    test_pooled_queue_reaping()
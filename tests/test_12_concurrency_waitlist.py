@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the ConcurrencyQueue scheduler directly. No router required
+"""
+
+def test_waitlist_order():
+    started = []
+    release = threading.Event()
+
+    concurrency_queue = swampyer.ConcurrencyQueue('fifo', concurrency_max=1)
+    concurrency_queue.start()
+
+    for i in range(5):
+        concurrency_queue.put(RecordingRunner(i, started, release))
+
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 4)
+    assert started == [0]
+
+    # Raising the limit should immediately start the waiting jobs
+    concurrency_queue.configure(concurrency_max=3)
+    assert wait_for(lambda: len(started) == 3)
+    assert concurrency_queue.waitlist_count() == 2
+
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert started == [0, 1, 2, 3, 4]
+
+    # Configuration changes are not errors
+    stats = concurrency_queue.stats()
+    assert stats['errors'] == 0
+    assert stats['waitlist_max'] == 4
+    assert stats['duration_datapoints'] == 5
+
+    concurrency_queue.shutdown()
+
+def test_shutdown_wakes_loop():
+    # Even with a long loop_timeout shutdown should be near immediate
+    # since the loop no longer polls
+    concurrency_queue = swampyer.ConcurrencyQueue('idle', loop_timeout=60)
+    concurrency_queue.start()
+    time.sleep(0.1)
+
+    start_time = time.time()
+    concurrency_queue.shutdown()
+    concurrency_queue.join(5)
+    assert not concurrency_queue.is_alive()
+    assert time.time() - start_time < 1
+
+if __name__ == '__main__':
+    test_waitlist_order()
+    test_shutdown_wakes_loop()
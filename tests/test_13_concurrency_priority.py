@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the PriorityConcurrencyQueue directly. No router required
+"""
+
+def test_priority_order():
+    started = []
+    release = threading.Event()
+
+    concurrency_queue = swampyer.PriorityConcurrencyQueue(
+                            'priority',
+                            concurrency_max=1,
+                            priority_default=5,
+                            priority_callable=lambda details: details.get('urgent') and -1 or None,
+                        )
+    concurrency_queue.start()
+
+    # Occupy the only slot so everything else has to wait
+    blocker = threading.Event()
+    concurrency_queue.put(RecordingRunner('blocker', started, blocker))
+    assert wait_for(lambda: started == ['blocker'])
+
+    concurrency_queue.put(RecordingRunner('batch', started, release, options={'priority': 10}))
+    concurrency_queue.put(RecordingRunner('default', started, release))
+    concurrency_queue.put(RecordingRunner('ui', started, release, options={'priority': 1}))
+    concurrency_queue.put(RecordingRunner('ui2', started, release, options={'priority': 1}))
+    concurrency_queue.put(RecordingRunner(
+                              'health',
+                              started,
+                              release,
+                              options={'priority': 10},
+                              message=swampyer.INVOCATION(details={'urgent': True}),
+                          ))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 5)
+
+    stats = concurrency_queue.stats()
+    assert stats['priorities'][10]['waiting'] == 1
+    assert stats['priorities'][-1]['waiting'] == 1
+
+    release.set()
+    blocker.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert started == ['blocker', 'health', 'ui', 'ui2', 'default', 'batch']
+
+    stats = concurrency_queue.stats()
+    assert stats['priorities'][1]['run'] == 2
+    assert stats['priorities'][10]['run'] == 1
+    assert stats['priorities'][10]['waiting'] == 0
+    assert stats['priorities'][10]['wait_duration_max'] > 0
+
+    concurrency_queue.shutdown()
+
+def test_priority_aging():
+    started = []
+    release = threading.Event()
+    release.set()
+    blocker = threading.Event()
+
+    # Each level of priority is worth 1 second of waiting
+    concurrency_queue = swampyer.PriorityConcurrencyQueue(
+                            'aging',
+                            concurrency_max=1,
+                            aging=1,
+                        )
+    concurrency_queue.start()
+    concurrency_queue.put(RecordingRunner('blocker', started, blocker))
+    assert wait_for(lambda: started == ['blocker'])
+
+    # This one has been waiting for 10 seconds so it should beat the
+    # fresher job that's only 5 levels better
+    starved = RecordingRunner('starved', started, release, options={'priority': 5})
+    starved.created_clock -= 10
+    concurrency_queue.put(starved)
+    concurrency_queue.put(RecordingRunner('fresh', started, release, options={'priority': 0}))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 2)
+
+    blocker.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert started == ['blocker', 'starved', 'fresh']
+
+    concurrency_queue.shutdown()
+
+if __name__ == '__main__':
+    test_priority_order()
+    test_priority_aging()
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+import os
+import logging
+import sys
+import time
+
+from lib import connect_service, wait_for, invocation_message, RecordingRunner
+import threading
+import concurrent.futures.process
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+# The handlers need to be module level functions so they can be
+# pickled over to the worker processes
+def cpu_invoke(event, count):
+    total = 0
+    for i in range(count):
+        total += i * i
+    return [os.getpid(), total]
+
+def slow_invoke(event, duration):
+    time.sleep(duration)
+    return os.getpid()
+
+def failing_invoke(event):
+    raise ValueError("Failed in the worker")
+
+def crashing_invoke(event):
+    os._exit(1)
+
+def failing_subscribe(event):
+    raise ValueError("Failed in the worker")
+
+class PoolRunner(RecordingRunner):
+    """ Records what the worker process sent back
+    """
+    def handle_result(self, result):
+        self.ended.append(result)
+
+CALL_ERRORS = []
+def slow_call(client):
+    def make_call():
+        try:
+            client.call('com.izaber.wamp.process.slow', 0.5)
+        except swampyer.ExInvocationError as ex:
+            CALL_ERRORS.append(ex)
+    return make_call
+
+def test_process_pool():
+    client = connect_service(
+                  timeout=60,
+                  concurrency_configs={
+                      'cpu': {
+                          '_class': swampyer.ProcessPoolConcurrencyQueue,
+                          'processes': 2,
+                          'queue_max': 2,
+                      },
+                  }
+              )
+    client2 = connect_service(timeout=60)
+
+    for uri, handler in (
+                ('com.izaber.wamp.process.cpu', cpu_invoke),
+                ('com.izaber.wamp.process.slow', slow_invoke),
+                ('com.izaber.wamp.process.fail', failing_invoke),
+                ('com.izaber.wamp.process.lambda', lambda event: 1),
+            ):
+        reg_result = client.register(
+                          uri,
+                          handler,
+                          details={"force_reregister": True},
+                          concurrency_queue='cpu',
+                      )
+        assert reg_result == swampyer.WAMP_REGISTERED
+
+    # The work is done in another process
+    pid, total = client2.call('com.izaber.wamp.process.cpu', 1000)
+    assert total == sum(i*i for i in range(1000))
+    assert pid != os.getpid()
+
+    # Errors raised in the worker make it back to the caller
+    try:
+        client2.call('com.izaber.wamp.process.fail')
+        assert False, "Should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert "Failed in the worker" in str(ex)
+
+    # As do handlers that can't be sent to the worker
+    try:
+        client2.call('com.izaber.wamp.process.lambda')
+        assert False, "Should have failed"
+    except swampyer.ExInvocationError:
+        pass
+
+    # 2 processes running plus 2 waiting. Everything else is rejected
+    thread_list = []
+    for i in range(8):
+        thr = threading.Thread(target=slow_call(client2))
+        thr.start()
+        thread_list.append(thr)
+        time.sleep(0.01)
+    for thr in thread_list:
+        thr.join()
+    assert len(CALL_ERRORS) == 4
+
+    stats = client.stats()['queues']['cpu']
+    assert stats['rejected'] == 4
+
+    client.shutdown()
+    client2.shutdown()
+
+def test_process_pool_recovery():
+    concurrency_queue = swampyer.ProcessPoolConcurrencyQueue('recovery', processes=1)
+    concurrency_queue.start()
+
+    # A worker that dies takes the pool down with it
+    runner = PoolRunner(handler=crashing_invoke, message=invocation_message())
+    concurrency_queue.put(runner)
+    assert wait_for(lambda: len(runner.errors) == 1)
+    assert isinstance(runner.errors[0][1], concurrent.futures.process.BrokenProcessPool)
+    broken = concurrency_queue.executor
+
+    # The next job gets a fresh pool and the broken one is shut down
+    shutdowns = []
+    broken_shutdown = broken.shutdown
+    def shutdown(wait=True, **kwargs):
+        shutdowns.append(wait)
+        broken_shutdown(wait=wait, **kwargs)
+    broken.shutdown = shutdown
+
+    results = []
+    concurrency_queue.put(PoolRunner(handler=cpu_invoke, message=invocation_message(args=[10]), ended=results))
+    assert wait_for(lambda: len(results) == 1, timeout=20)
+    assert results[0][1] == sum(i*i for i in range(10))
+    assert concurrency_queue.executor is not broken
+    assert shutdowns == [False]
+
+    # Failed subscription handlers are logged as there's no caller
+    # to send the error to
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logging.getLogger('swampyer').addHandler(handler)
+    try:
+        runner = PoolRunner(
+                      handler=failing_subscribe,
+                      message=swampyer.EVENT(
+                          subscription_id=1,
+                          publication_id=1,
+                          details={},
+                          args=[],
+                      ),
+                  )
+        concurrency_queue.put(runner)
+        assert wait_for(lambda: len(runner.errors) == 1, timeout=20)
+    finally:
+        logging.getLogger('swampyer').removeHandler(handler)
+    assert [ record.levelno for record in records ] == [logging.ERROR]
+    assert "Failed in the worker" in records[0].getMessage()
+
+    concurrency_queue.shutdown()
+
+if __name__ == '__main__':
+    test_process_pool()
+    test_process_pool_recovery()
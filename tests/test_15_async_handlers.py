@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+import asyncio
+import logging
+import sys
+import time
+
+from lib import connect_service
+import threading
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+TRACKER = {}
+TRACKER_MAX = {}
+RUNNER_THREADS = []
+async def async_invoke(event, queue_name):
+    TRACKER.setdefault(queue_name,0)
+    TRACKER_MAX.setdefault(queue_name,0)
+    TRACKER[queue_name] += 1
+    if TRACKER[queue_name] > TRACKER_MAX[queue_name]:
+        TRACKER_MAX[queue_name] = TRACKER[queue_name]
+    RUNNER_THREADS.append(len([
+        thread for thread in threading.enumerate()
+        if isinstance(thread, swampyer.ConcurrencyRunner)
+    ]))
+    await asyncio.sleep(0.5)
+    TRACKER[queue_name] -= 1
+    return queue_name
+
+async def async_failure(event):
+    await asyncio.sleep(0)
+    raise ValueError("Async failure")
+
+EVENTS = []
+async def async_subscribe(event, data):
+    await asyncio.sleep(0)
+    EVENTS.append(data)
+
+def invoke_a_bunch(client, method, iterations):
+    results = []
+    def make_call():
+        results.append(client.call('com.izaber.wamp.async.'+method, method))
+    thread_list = []
+    for i in range(iterations):
+        thr = threading.Thread(target=make_call)
+        thr.start()
+        thread_list.append(thr)
+    for thr in thread_list:
+        thr.join()
+    return results
+
+def test_async_handlers():
+    client = connect_service(
+                  timeout=60,
+                  concurrency_configs={
+                      'just2': {
+                          'concurrency_max': 2,
+                      },
+                  }
+              )
+    client2 = connect_service(timeout=60)
+
+    for queue_name in ('unlimited', 'just2'):
+        reg_result = client.register(
+                          'com.izaber.wamp.async.'+queue_name,
+                          async_invoke,
+                          details={"force_reregister": True},
+                          concurrency_queue=queue_name,
+                      )
+        assert reg_result == swampyer.WAMP_REGISTERED
+
+    # All 50 invocations should be in flight at the same time without
+    # requiring a thread each
+    start_time = time.time()
+    results = invoke_a_bunch(client2, 'unlimited', 50)
+    assert results == ['unlimited'] * 50
+    assert TRACKER_MAX['unlimited'] == 50
+    assert time.time() - start_time < 5
+    assert max(RUNNER_THREADS) == 0
+
+    # Queue limits still apply to coroutines
+    results = invoke_a_bunch(client2, 'just2', 6)
+    assert results == ['just2'] * 6
+    assert TRACKER_MAX['just2'] == 2
+
+    # Exceptions are sent back to the caller
+    reg_result = client.register(
+                      'com.izaber.wamp.async.failure',
+                      async_failure,
+                      details={"force_reregister": True},
+                  )
+    try:
+        client2.call('com.izaber.wamp.async.failure')
+        assert False, "Should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert "Async failure" in str(ex)
+
+    # Subscriptions can be coroutines too
+    sub_result = client.subscribe('com.izaber.wamp.async.event', async_subscribe)
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+    for i in range(5):
+        client2.publish('com.izaber.wamp.async.event', args=[i])
+    for i in range(50):
+        if len(EVENTS) == 5:
+            break
+        time.sleep(0.1)
+    assert sorted(EVENTS) == [0, 1, 2, 3, 4]
+
+    client.shutdown()
+    client2.shutdown()
+
+if __name__ == '__main__':
+    test_async_handlers()
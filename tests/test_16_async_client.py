@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import asyncio
+import json
+
+from lib import connect_async_service
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def hello(event,data):
+    return data
+
+async def hello_async(event,data):
+    await asyncio.sleep(0.01)
+    return data
+
+async def fail_async(event,data):
+    raise Exception("Nope")
+
+async def check_client(url):
+    client = await connect_async_service(url)
+    client2 = await connect_async_service(url)
+    assert client.is_connected()
+
+    # Check if we can register both plain and coroutine functions
+    reg_result = await client.register('com.izaber.wamp.hello', hello, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+    reg_async = await client.register('com.izaber.wamp.hello_async', hello_async, details={"force_reregister": True})
+    assert reg_async == swampyer.WAMP_REGISTERED
+    reg_fail = await client.register('com.izaber.wamp.fail_async', fail_async, details={"force_reregister": True})
+    assert reg_fail == swampyer.WAMP_REGISTERED
+
+    # Can we call data?
+    assert await client2.call('com.izaber.wamp.hello','something') == 'something'
+    assert await client2.call('com.izaber.wamp.hello_async','other') == 'other'
+
+    # Many calls in flight at the same time
+    results = await asyncio.gather(*[
+                    client2.call('com.izaber.wamp.hello_async', i)
+                    for i in range(50)
+                ])
+    assert results == list(range(50))
+
+    # Errors raised by the handler come back to the caller
+    try:
+        await client2.call('com.izaber.wamp.fail_async','x')
+        assert False, "Call should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert 'Nope' in str(ex)
+
+    unreg_result = await client.unregister(reg_result.registration_id)
+    assert unreg_result == swampyer.WAMP_UNREGISTERED
+
+    # Subscriptions with a callback
+    sub_data = []
+    async def sub_capture(event,data):
+        sub_data.append(data)
+
+    sub_result = await client.subscribe('com.izaber.wamp.pub.hello', sub_capture)
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    # Subscriptions consumed by async iteration
+    sub_iter = await client.subscribe('com.izaber.wamp.pub.hello_iter')
+    assert sub_iter == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(3):
+        for topic in ('com.izaber.wamp.pub.hello', 'com.izaber.wamp.pub.hello_iter'):
+            pub_result = await client2.publish(
+                    topic,
+                    options={
+                        'acknowledge': True,
+                        'exclude_me': False,
+                    },
+                    args=[i]
+                )
+            assert pub_result == swampyer.WAMP_PUBLISHED
+
+    received = []
+    async def consume():
+        async for event in client.events(sub_iter.subscription_id):
+            received.append(event.args[0])
+            if len(received) == 3:
+                break
+    await asyncio.wait_for(consume(), 5)
+    assert received == [0, 1, 2]
+
+    await asyncio.sleep(0.1)
+    assert sub_data == [0, 1, 2]
+
+    unsub_result = await client.unsubscribe(sub_result.subscription_id)
+    assert unsub_result == swampyer.WAMP_UNSUBSCRIBED
+
+    await client2.close()
+    await client.close()
+    assert not client.is_connected()
+
+    # Calls after the close should fail right away
+    try:
+        await client.call('com.izaber.wamp.hello','something')
+        assert False, "Call should have failed"
+    except swampyer.ExWAMPConnectionError:
+        pass
+
+def test_websocket():
+    asyncio.run(check_client('ws://NEXUS_HOST:8282/ws'))
+
+def test_tcpip():
+    asyncio.run(check_client('tcpip://NEXUS_HOST:18081'))
+
+def test_unix():
+    asyncio.run(check_client('unix:///volume/nexus-test-data/nexus.socket'))
+
+def test_context_manager():
+    async def check():
+        async with await connect_async_service() as client:
+            assert client.is_connected()
+        assert not client.is_connected()
+    asyncio.run(check())
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+async def fake_router(reply, split_handshake=False):
+    """ Starts a rawsocket server on a free local port that answers the
+        first message it receives with `reply`
+    """
+    async def handle(reader, writer):
+        await reader.readexactly(4)
+        # Max message length of 16M and JSON serialization
+        handshake = b'\x7f\xf1\x00\x00'
+        if split_handshake:
+            writer.write(handshake[:1])
+            await writer.drain()
+            await asyncio.sleep(0.1)
+            writer.write(handshake[1:])
+        else:
+            writer.write(handshake)
+        header = await reader.readexactly(4)
+        await reader.readexactly(int.from_bytes(header[1:], 'big'))
+        writer.write(swampyer.rawsocket_frame(json.dumps(reply.package())))
+        await writer.drain()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, 'tcpip://127.0.0.1:{}'.format(port)
+
+def test_abort():
+    async def check():
+        abort = swampyer.ABORT(
+                    details={'message': 'Go away'},
+                    reason='wamp.error.no_such_realm',
+                )
+        server, url = await fake_router(abort)
+        log_capture = ListHandler()
+        logging.getLogger('swampyer').addHandler(log_capture)
+        client = swampyer.AsyncWAMPClient(url=url, serializers=['json'])
+        try:
+            await client.start()
+            assert False, "Start should have been aborted"
+        except swampyer.ExAbort:
+            pass
+        finally:
+            logging.getLogger('swampyer').removeHandler(log_capture)
+            server.close()
+            await server.wait_closed()
+
+        # The close from within the reader task shouldn't trip over itself
+        await asyncio.sleep(0.1)
+        assert not client.is_connected()
+        errors = [ record for record in log_capture.records
+                    if record.levelno >= logging.ERROR ]
+        assert not errors, errors
+    asyncio.run(check())
+
+def test_split_handshake():
+    async def check():
+        goodbye = swampyer.GOODBYE(reason='wamp.close.normal')
+        server, url = await fake_router(goodbye, split_handshake=True)
+        transport = swampyer.TcpipsocketTransport(url, serializers=['json'])
+        loop = asyncio.get_running_loop()
+        try:
+            # The server sends the handshake in two pieces so the
+            # blocking transport has to wait on the rest of it
+            await loop.run_in_executor(None, transport.connect)
+            await loop.run_in_executor(None, transport.send_message, swampyer.HELLO(realm='realm1', details={}), 0)
+            message = await loop.run_in_executor(None, transport.next)
+            assert message == goodbye.package()
+        finally:
+            transport.close()
+            server.close()
+            await server.wait_closed()
+    asyncio.run(check())
+
+if __name__ == '__main__':
+    test_websocket()
+    test_tcpip()
+    test_unix()
+    test_context_manager()
+    test_abort()
+    test_split_handshake()
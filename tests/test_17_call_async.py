@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import concurrent.futures
+
+from lib import connect_service
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def hello(event,data):
+    time.sleep(0.05)
+    return data
+
+def fail(event,data):
+    raise Exception("Nope")
+
+def test_call_async():
+    client = connect_service(concurrency_max=300)
+    client2 = connect_service()
+
+    reg_result = client.register('com.izaber.wamp.hello', hello, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+    reg_fail = client.register('com.izaber.wamp.fail', fail, details={"force_reregister": True})
+    assert reg_fail == swampyer.WAMP_REGISTERED
+
+    # A single thread can keep hundreds of calls in flight. Each call takes
+    # 50ms so doing them one after the other would take 10 seconds
+    start = time.time()
+    futures = [ client2.call_async('com.izaber.wamp.hello', i) for i in range(200) ]
+    results = [ future.result(timeout=10) for future in futures ]
+    assert results == list(range(200))
+    assert time.time() - start < 5
+
+    # Nothing is left behind in the pending request table
+    assert client2._requests_pending == {}
+
+    # Errors come back through the future
+    future = client2.call_async('com.izaber.wamp.fail', 'x')
+    try:
+        future.result(timeout=10)
+        assert False, "Call should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert 'Nope' in str(ex)
+
+    # Acknowledged publishes
+    sub_data = []
+    def sub_capture(event,data):
+        sub_data.append(data)
+    sub_result = client.subscribe('com.izaber.wamp.pub.hello', sub_capture)
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    futures = [
+        client2.publish_async(
+            'com.izaber.wamp.pub.hello',
+            options={
+                'acknowledge': True,
+                'exclude_me': False,
+            },
+            args=[i]
+        )
+        for i in range(10)
+    ]
+    for future in futures:
+        assert future.result(timeout=10) == swampyer.WAMP_PUBLISHED
+
+    # Unacknowledged publishes resolve right away
+    future = client2.publish_async(
+            'com.izaber.wamp.pub.hello',
+            options={ 'acknowledge': False },
+            args=['unacked']
+        )
+    assert future.done()
+    assert future.result() is None
+
+    time.sleep(0.5)
+    assert sorted(sub_data[:10]) == list(range(10))
+
+    # Pending calls fail once we disconnect
+    future = client2.call_async('com.izaber.wamp.hello', 'late')
+    client2.shutdown()
+    try:
+        future.result(timeout=10)
+        assert False, "Call should have failed"
+    except swampyer.ExWAMPConnectionError:
+        pass
+    except concurrent.futures.TimeoutError:
+        assert False, "Call should have been resolved on disconnect"
+
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_call_async()
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import random
+
+from lib import connect_service
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def hello(event,data,delay=0.05):
+    time.sleep(delay)
+    if data == 'fail':
+        raise Exception("Nope")
+    return data
+
+def test_call_many():
+    client = connect_service(concurrency_max=100)
+    client2 = connect_service()
+
+    reg_result = client.register('com.izaber.wamp.hello', hello, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    # 100 calls of 50ms each with 20 in flight should take around 250ms
+    requests = [ ('com.izaber.wamp.hello', [i]) for i in range(100) ]
+    start = time.time()
+    results = list(client2.call_many(requests, window=20))
+    assert time.time() - start < 2.5
+    assert len(results) == 100
+    assert sorted(res.result for res in results) == list(range(100))
+    for res in results:
+        assert res.error is None
+        assert res.index == res.result
+        assert res.uri == 'com.izaber.wamp.hello'
+
+    # Ordered results come back in submission order even when the
+    # calls finish out of order. Errors do not abort the batch
+    requests = []
+    for i in range(50):
+        data = 'fail' if i % 10 == 5 else i
+        requests.append(('com.izaber.wamp.hello', [data], {'delay': random.uniform(0, 0.05)}))
+    results = list(client2.call_many(requests, window=10, ordered=True))
+    assert [ res.index for res in results ] == list(range(50))
+    for res in results:
+        if res.index % 10 == 5:
+            assert isinstance(res.error, swampyer.ExInvocationError)
+            assert res.result is None
+        else:
+            assert res.error is None
+            assert res.result == res.index
+
+    # Plain uris work and calls to unknown procedures are reported
+    results = list(client2.call_many(['com.izaber.wamp.nope', 'com.izaber.wamp.hello']))
+    assert len(results) == 2
+    for res in results:
+        assert res.error is not None
+
+    # Results are streamed back while the batch is still going
+    requests = ( ('com.izaber.wamp.hello', [i]) for i in range(20) )
+    start = time.time()
+    batch = client2.call_many(requests, window=2)
+    first = next(batch)
+    assert first.error is None
+    assert time.time() - start < 0.5
+    batch.close()
+
+    time.sleep(0.5)
+    assert client2._requests_pending == {}
+
+    client2.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_call_many()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+
+from lib import connect_service
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_call_stream():
+    client = connect_service()
+    client2 = connect_service(timeout=2)
+
+    # Progressive results are sent by hand here. The callee side
+    # is just a function that sends YIELDs with the progress option
+    def rows(event, count, final=None, delay=0, pause=0):
+        for i in range(count):
+            if delay:
+                time.sleep(delay)
+            client.send_message(swampyer.YIELD(
+                request_id = event.request_id,
+                options = { 'progress': True },
+                args = [i],
+            ))
+            # Gives the consumer time to take the first result
+            if pause and i == 0:
+                time.sleep(pause)
+        if final == 'fail':
+            raise Exception("Nope")
+        return final
+
+    reg_result = client.register('com.izaber.wamp.rows', rows, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    # Each progressive result is yielded as it arrives followed
+    # by the final result
+    results = list(client2.call_stream('com.izaber.wamp.rows', 10, 'done'))
+    assert results == list(range(10)) + ['done']
+
+    # Results arrive before the call is done
+    start = time.time()
+    stream = client2.call_stream('com.izaber.wamp.rows', 5, 'done', delay=0.2)
+    assert next(stream) == 0
+    assert time.time() - start < 0.5
+    assert list(stream) == [1, 2, 3, 4, 'done']
+
+    # A callee failure is raised after the results that made it through
+    received = []
+    try:
+        for row in client2.call_stream('com.izaber.wamp.rows', 3, 'fail'):
+            received.append(row)
+        assert False, "Stream should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert 'Nope' in str(ex)
+    assert received == [0, 1, 2]
+
+    # The plain call() still works against a streaming callee
+    assert client2.call('com.izaber.wamp.rows', 3, 'done') == 'done'
+
+    # A consumer that falls behind overflows the bounded buffer
+    client2.configure(stream_buffer_max=5)
+    stream = client2.call_stream('com.izaber.wamp.rows', 50, 'done', pause=0.2)
+    assert next(stream) == 0
+    time.sleep(1)
+    received = []
+    try:
+        for row in stream:
+            received.append(row)
+        assert False, "Stream should have overflowed"
+    except swampyer.ExStreamOverflow:
+        pass
+    assert received == [1, 2, 3, 4, 5]
+
+    # A stalled consumer overflows straight away rather than holding up
+    # the reader thread, so other calls still complete in the meantime
+    stream = client2.call_stream('com.izaber.wamp.rows', 50, 'done', pause=0.2)
+    assert next(stream) == 0
+    time.sleep(0.5)
+    start = time.time()
+    for i in range(5):
+        assert client2.call('com.izaber.wamp.rows', 3, 'done') == 'done'
+    assert time.time() - start < 1
+    assert client2._requests_pending == {}
+    try:
+        list(stream)
+        assert False, "Stream should have overflowed"
+    except swampyer.ExStreamOverflow:
+        pass
+
+    # A CallOptions timeout bounds the wait for each result so a stream
+    # that keeps delivering can outlast it. The router isn't told about
+    # the timeout as it would end the whole call
+    sent = []
+    send_message = client2.send_message
+    def send_capture(message):
+        sent.append(message)
+        return send_message(message)
+    client2.send_message = send_capture
+
+    options = swampyer.CallOptions(timeout=0.5)
+    start = time.time()
+    results = list(client2.call_stream('com.izaber.wamp.rows', 5, 'done', delay=0.2, options=options))
+    assert results == [0, 1, 2, 3, 4, 'done']
+    assert time.time() - start > 0.5
+    assert sent[0] == swampyer.WAMP_CALL
+    assert 'timeout' not in sent[0].options
+    client2.send_message = send_message
+
+    # But a stalled stream times out
+    received = []
+    try:
+        for row in client2.call_stream('com.izaber.wamp.rows', 3, 'done', pause=1, options=options):
+            received.append(row)
+        assert False, "Stream should have timed out"
+    except swampyer.ExCallTimeout:
+        pass
+    assert received == [0]
+    assert client2._requests_pending == {}
+
+    # Closing the stream early removes it from the pending table
+    client2.configure(stream_buffer_max=100)
+    stream = client2.call_stream('com.izaber.wamp.rows', 20, 'done', delay=0.01)
+    assert next(stream) == 0
+    stream.close()
+    assert client2._requests_pending == {}
+
+    client2.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_call_stream()
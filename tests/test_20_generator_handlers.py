@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import asyncio
+import threading
+
+from lib import connect_service, connect_async_service
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def rows(event, count, fail=False):
+    for i in range(count):
+        yield {'row': i}
+    if fail:
+        raise Exception("Nope")
+
+async def rows_async(event, count, fail=False):
+    for i in range(count):
+        await asyncio.sleep(0)
+        yield {'row': i}
+    if fail:
+        raise Exception("Nope")
+
+def check_callee(caller, uri):
+    # Callers asking for progress get each chunk
+    results = list(caller.call_stream(uri, 10))
+    assert results == [ {'row': i} for i in range(10) ]
+
+    # Callers that didn't get a list of all of the chunks
+    assert caller.call(uri, 10) == [ {'row': i} for i in range(10) ]
+    assert caller.call(uri, 0) == []
+
+    # Failures part way through reach the caller either way
+    received = []
+    try:
+        for row in caller.call_stream(uri, 3, fail=True):
+            received.append(row)
+        assert False, "Stream should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert 'Nope' in str(ex)
+    assert received == [ {'row': i} for i in range(3) ]
+
+    try:
+        caller.call(uri, 3, fail=True)
+        assert False, "Call should have failed"
+    except swampyer.ExInvocationError as ex:
+        assert 'Nope' in str(ex)
+
+def test_generator_handlers():
+    client = connect_service()
+    client2 = connect_service()
+
+    reg_result = client.register('com.izaber.wamp.rows', rows, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+    reg_result = client.register('com.izaber.wamp.rows_async', rows_async, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    check_callee(client2, 'com.izaber.wamp.rows')
+    check_callee(client2, 'com.izaber.wamp.rows_async')
+
+    client2.shutdown()
+    client.shutdown()
+
+def test_async_client_generator_handlers():
+    ready = threading.Event()
+    done = threading.Event()
+
+    async def serve():
+        client = await connect_async_service()
+        await client.register('com.izaber.wamp.rows_aio', rows, details={"force_reregister": True})
+        await client.register('com.izaber.wamp.rows_aio_async', rows_async, details={"force_reregister": True})
+        ready.set()
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+        await client.close()
+
+    server = threading.Thread(target=asyncio.run, args=(serve(),))
+    server.start()
+    assert ready.wait(10)
+
+    try:
+        client = connect_service()
+        check_callee(client, 'com.izaber.wamp.rows_aio')
+        check_callee(client, 'com.izaber.wamp.rows_aio_async')
+        client.shutdown()
+    finally:
+        done.set()
+        server.join()
+
+
+if __name__ == '__main__':
+    test_generator_handlers()
+    test_async_client_generator_handlers()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import asyncio
+import threading
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_call_cancel():
+    client = connect_service(concurrency_max=1)
+    client2 = connect_service()
+
+    interrupted = []
+    started = []
+    def slow(event, name, duration=2):
+        started.append(name)
+        end = time.time() + duration
+        while time.time() < end:
+            if event.cancelled:
+                interrupted.append(name)
+                return 'cancelled'
+            time.sleep(0.01)
+        return name
+
+    async def slow_async(event, name, duration=2):
+        started.append(name)
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            interrupted.append(name)
+            raise
+        return name
+
+    reg_result = client.register('com.izaber.wamp.slow', slow, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+    reg_result = client.register('com.izaber.wamp.slow_async', slow_async,
+                      details={"force_reregister": True}, concurrency_queue='unlimited')
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    # Per call timeouts give up on the call and interrupt the callee
+    start = time.time()
+    try:
+        client2.call('com.izaber.wamp.slow', 'timeout',
+                      options=swampyer.CallOptions(timeout=0.5))
+        assert False, "Call should have timed out"
+    except swampyer.ExCallTimeout:
+        pass
+    assert time.time() - start < 1.5
+    assert client2._requests_pending == {}
+    time.sleep(0.5)
+    assert interrupted == ['timeout']
+
+    # Timeouts also apply to call_async
+    future = client2.call_async('com.izaber.wamp.slow', 'async_timeout',
+                                options=swampyer.CallOptions(timeout=0.5))
+    try:
+        future.result(timeout=5)
+        assert False, "Call should have timed out"
+    except swampyer.ExCallTimeout:
+        pass
+    assert client2._requests_pending == {}
+    time.sleep(0.5)
+    assert interrupted[-1] == 'async_timeout'
+
+    # As does cancelling the future
+    future = client2.call_async('com.izaber.wamp.slow', 'cancel')
+    time.sleep(0.3)
+    assert future.cancel()
+    time.sleep(0.5)
+    assert interrupted[-1] == 'cancel'
+    assert client2._requests_pending == {}
+
+    # Calls that haven't started yet are dropped from the waitlist
+    busy = client2.call_async('com.izaber.wamp.slow', 'busy', 1)
+    time.sleep(0.2)
+    waiting = client2.call_async('com.izaber.wamp.slow', 'waiting')
+    time.sleep(0.2)
+    assert client.concurrency_queue_get('default').waitlist_count() == 1
+    waiting.cancel()
+    time.sleep(0.2)
+    assert client.concurrency_queue_get('default').waitlist_count() == 0
+    assert busy.result(timeout=5) == 'busy'
+    time.sleep(0.2)
+    assert 'waiting' not in started
+    assert client.concurrency_queue_get('default').stats()['cancelled'] == 4
+
+    # Coroutine handlers get cancelled on the event loop
+    future = client2.call_async('com.izaber.wamp.slow_async', 'coroutine')
+    time.sleep(0.3)
+    future.cancel()
+    time.sleep(0.3)
+    assert interrupted[-1] == 'coroutine'
+
+    # And calls that complete in time are unaffected
+    assert client2.call('com.izaber.wamp.slow', 'quick', 0.1,
+                        options=swampyer.CallOptions(timeout=5)) == 'quick'
+    assert client._invocations == {}
+
+    client2.shutdown()
+    client.shutdown()
+
+
+class CoroutineRunner(RecordingRunner):
+    """ Runs `work_async` on `loop` like the runners for `async def`
+        handlers do
+    """
+    def is_coroutine(self):
+        return True
+
+    def event_loop(self):
+        return self.loop
+
+    async def work_async(self):
+        self.work()
+
+def test_cancel_before_start():
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+
+    concurrency_queue = swampyer.ConcurrencyQueue('cancelled', concurrency_max=1, bytes_max=100)
+    concurrency_queue.start()
+
+    # Hold up the event loop so the coroutine is cancelled before
+    # it gets to take its first step
+    gate = threading.Event()
+    loop.call_soon_threadsafe(gate.wait)
+
+    started = []
+    runner = CoroutineRunner('cancelled', started, loop=loop, payload_size=60)
+    concurrency_queue.put(runner)
+    assert wait_for(lambda: runner.future is not None)
+    runner.cancel()
+    gate.set()
+
+    # The slot and bytes are given back so the next job can run
+    concurrency_queue.put(CoroutineRunner('next', started, loop=loop, payload_size=60))
+    assert wait_for(lambda: started == ['next'])
+    assert wait_for(concurrency_queue.queue_empty)
+    stats = concurrency_queue.stats()
+    assert stats['bytes'] == 0
+    assert stats['bytes_rejected'] == 0
+    assert stats['duration_datapoints'] == 2
+
+    concurrency_queue.shutdown()
+    loop.call_soon_threadsafe(loop.stop)
+
+if __name__ == '__main__':
+    test_call_cancel()
+    test_cancel_before_start()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+import logging
+import re
+import sys
+import time
+import threading
+
+from lib import wait_for, invocation_message, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises deadline based shedding in the ConcurrencyQueue. No router required
+"""
+
+class DeadlineRunner(RecordingRunner):
+    """ Records when it gets run or rejected
+    """
+    def __init__(self, label, log, release, timeout=None):
+        details = {}
+        if timeout:
+            details['timeout'] = timeout
+        super(DeadlineRunner, self).__init__(
+                label,
+                release=release,
+                message=invocation_message(label, details),
+            )
+        self.log = log
+
+    def work(self):
+        self.log.append(('run', self.label))
+        super(DeadlineRunner, self).work()
+
+    def handle_error(self, ex):
+        self.log.append(('error', self.label, ex))
+
+def test_invocation_timeout_shedding():
+    log = []
+    release = threading.Event()
+
+    concurrency_queue = swampyer.ConcurrencyQueue('deadline', concurrency_max=1)
+    concurrency_queue.start()
+
+    # The first job hogs the queue while the others wait. Job 1 has
+    # a 100ms timeout from the caller, job 2 has none
+    concurrency_queue.put(DeadlineRunner(0, log, release))
+    concurrency_queue.put(DeadlineRunner(1, log, release, timeout=100))
+    concurrency_queue.put(DeadlineRunner(2, log, release))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 2)
+
+    time.sleep(0.3)
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+
+    assert [ entry[:2] for entry in log ] == [('run', 0), ('error', 1), ('run', 2)]
+    assert isinstance(log[1][2], swampyer.ExDeadlineExpired)
+
+    # The error reports both the whole wait and how far past the
+    # deadline it went
+    waited, overrun = re.search(r'waited ([\d.]+)s, ([\d.]+)s past', str(log[1][2])).groups()
+    assert abs(float(waited) - float(overrun) - 0.1) < 0.01
+
+    stats = concurrency_queue.stats()
+    assert stats['shed'] == 1
+    assert stats['shed_wait']['count'] == 1
+    assert 0.2 < stats['shed_wait']['max'] < 1
+
+    concurrency_queue.shutdown()
+
+def test_max_wait_shedding():
+    log = []
+    release = threading.Event()
+
+    concurrency_queue = swampyer.ConcurrencyQueue('max_wait', concurrency_max=1, max_wait=0.1)
+    concurrency_queue.start()
+
+    concurrency_queue.put(DeadlineRunner(0, log, release))
+    for i in range(1, 5):
+        concurrency_queue.put(DeadlineRunner(i, log, release))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 4)
+
+    # Everything that waited is past the queue's max_wait
+    time.sleep(0.3)
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert [ entry[:2] for entry in log ] == [('run', 0)] + [ ('error', i) for i in range(1, 5) ]
+
+    # Jobs that don't have to wait are never shed
+    concurrency_queue.put(DeadlineRunner(5, log, release))
+    assert wait_for(lambda: ('run', 5) in log)
+
+    # The caller's timeout wins if it is the sooner of the two
+    concurrency_queue.configure(max_wait=60)
+    release.clear()
+    concurrency_queue.put(DeadlineRunner(6, log, release))
+    concurrency_queue.put(DeadlineRunner(7, log, release, timeout=50))
+    concurrency_queue.put(DeadlineRunner(8, log, release))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 2)
+    time.sleep(0.2)
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert [ entry[:2] for entry in log[-3:] ] == [('run', 6), ('error', 7), ('run', 8)]
+
+    assert concurrency_queue.stats()['shed'] == 5
+
+    concurrency_queue.shutdown()
+
+def test_priority_queue_shedding():
+    log = []
+    release = threading.Event()
+
+    concurrency_queue = swampyer.PriorityConcurrencyQueue('priority', concurrency_max=1)
+    concurrency_queue.start()
+
+    concurrency_queue.put(DeadlineRunner(0, log, release))
+    concurrency_queue.put(DeadlineRunner(1, log, release, timeout=50))
+    concurrency_queue.put(DeadlineRunner(2, log, release))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 2)
+    time.sleep(0.2)
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert [ entry[:2] for entry in log ] == [('run', 0), ('error', 1), ('run', 2)]
+    assert concurrency_queue.stats()['priorities'][0]['waiting'] == 0
+
+    concurrency_queue.shutdown()
+
+if __name__ == '__main__':
+    test_invocation_timeout_shedding()
+    test_max_wait_shedding()
+    test_priority_queue_shedding()
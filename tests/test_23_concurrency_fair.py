@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import threading
+
+from lib import wait_for, invocation_message, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the FairConcurrencyQueue scheduler directly. No router required
+"""
+
+class CallerRunner(RecordingRunner):
+    """ Logs the order in which runners get started
+    """
+    def __init__(self, caller, label, started, release, errors=None):
+        message = invocation_message(
+                      details={ 'caller_authid': caller, 'caller': 1234 },
+                  )
+        super(CallerRunner, self).__init__(label, started, release, message, errors=errors)
+
+def run_jobs(concurrency_queue, jobs):
+    """ Blocks the queue with a first job, queues up all the `jobs`
+        then lets them go one at a time and returns the order they ran in
+    """
+    started = []
+    gate = threading.Event()
+    concurrency_queue.put(CallerRunner('blocker', 'blocker', started, gate))
+    assert wait_for(lambda: started == ['blocker'])
+
+    release = threading.Event()
+    release.set()
+    for caller, label in jobs:
+        concurrency_queue.put(CallerRunner(caller, label, started, release))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == len(jobs))
+
+    gate.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    return started[1:]
+
+def test_round_robin():
+    concurrency_queue = swampyer.FairConcurrencyQueue('fair', concurrency_max=1)
+    concurrency_queue.start()
+
+    # A noisy caller queues up a burst, then a quiet one shows up. The quiet
+    # one should not have to wait for the burst to finish
+    jobs = [ ('noisy', 'n{}'.format(i)) for i in range(6) ]
+    jobs += [ ('quiet', 'q{}'.format(i)) for i in range(2) ]
+    order = run_jobs(concurrency_queue, jobs)
+    assert order == ['n0', 'q0', 'n1', 'q1', 'n2', 'n3', 'n4', 'n5']
+
+    stats = concurrency_queue.stats()
+    assert stats['callers']['noisy']['run'] == 6
+    assert stats['callers']['quiet']['run'] == 2
+    assert stats['callers']['quiet']['waiting'] == 0
+
+    concurrency_queue.shutdown()
+
+def test_weights():
+    concurrency_queue = swampyer.FairConcurrencyQueue(
+                              'weighted',
+                              concurrency_max=1,
+                              weights={ 'gold': 2, 'bronze': 0.5 },
+                          )
+    concurrency_queue.start()
+
+    jobs = [ ('gold', 'g{}'.format(i)) for i in range(4) ]
+    jobs += [ ('silver', 's{}'.format(i)) for i in range(4) ]
+    jobs += [ ('bronze', 'b{}'.format(i)) for i in range(2) ]
+    order = run_jobs(concurrency_queue, jobs)
+
+    # Gold gets two turns for every one silver gets. Bronze needs
+    # two rounds to build up enough for a single job
+    assert order == ['g0', 'g1', 's0', 'g2', 'g3', 's1', 'b0', 's2', 's3', 'b1']
+
+    concurrency_queue.shutdown()
+
+def test_caller_queue_max():
+    concurrency_queue = swampyer.FairConcurrencyQueue(
+                              'limited',
+                              concurrency_max=1,
+                              caller_queue_max=2,
+                          )
+    concurrency_queue.start()
+
+    rejected = []
+    started = []
+    release = threading.Event()
+    concurrency_queue.put(CallerRunner('blocker', 'blocker', started, release, rejected))
+    for i in range(4):
+        concurrency_queue.put(CallerRunner('noisy', 'n{}'.format(i), started, release, rejected))
+    concurrency_queue.put(CallerRunner('quiet', 'q0', started, release, rejected))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 3)
+    assert len(rejected) == 2
+
+    # The noisy caller's extra jobs are rejected but the quiet one gets in
+    assert [ label for label, ex in rejected ] == ['n2', 'n3']
+    assert isinstance(rejected[0][1], swampyer.ExWaitlistFull)
+
+    release.set()
+    assert wait_for(concurrency_queue.queue_empty)
+    assert started == ['blocker', 'n0', 'q0', 'n1']
+
+    stats = concurrency_queue.stats()
+    assert stats['callers']['noisy']['rejected'] == 2
+    assert stats['rejected'] == 2
+
+    concurrency_queue.shutdown()
+
+def test_invalid_weights():
+    # A caller that never gains any deficit would keep the scheduler
+    # spinning so weights have to be positive
+    for kwargs in (
+                { 'weights': { 'gold': 2, 'free': 0 } },
+                { 'weights': { 'gold': -1 } },
+                { 'weight_default': 0 },
+            ):
+        try:
+            swampyer.FairConcurrencyQueue('invalid', **kwargs)
+            assert False, "Weights should have been rejected"
+        except ValueError:
+            pass
+
+if __name__ == '__main__':
+    test_round_robin()
+    test_weights()
+    test_caller_queue_max()
+    test_invalid_weights()
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the RateLimitedConcurrencyQueue scheduler directly. No router required
+"""
+
+class TimedRunner(RecordingRunner):
+    """ Records when it got started
+    """
+    def __init__(self, label, started):
+        super(TimedRunner, self).__init__(label, started, errors=started)
+
+    def work(self):
+        self.started.append((self.label, time.monotonic()))
+
+def test_rate_limit():
+    started = []
+    concurrency_queue = swampyer.RateLimitedConcurrencyQueue('rate', rate=20, burst=2)
+    concurrency_queue.start()
+
+    start = time.monotonic()
+    for i in range(8):
+        concurrency_queue.put(TimedRunner(i, started))
+
+    # The burst goes right away and the rest trickle out at 20/s
+    assert wait_for(lambda: len(started) == 2)
+    assert concurrency_queue.waitlist_count() == 6
+    assert concurrency_queue.stats()['tokens'] < 1
+
+    assert wait_for(lambda: len(started) == 8)
+    assert [ label for label, when in started ] == list(range(8))
+    elapsed = started[-1][1] - start
+    assert 0.25 < elapsed < 0.6
+    for ( label, when ), ( next_label, next_when ) in zip(started[1:], started[2:]):
+        assert next_when - when > 0.03
+
+    # The bucket fills back up while idle but not past the burst size
+    time.sleep(0.3)
+    stats = concurrency_queue.stats()
+    assert stats['tokens'] == 2
+    assert stats['rate'] == 20
+    assert stats['burst'] == 2
+    assert stats['waitlist_max'] == 6
+
+    concurrency_queue.shutdown()
+
+def test_rate_limit_reject():
+    started = []
+    concurrency_queue = swampyer.RateLimitedConcurrencyQueue('reject', rate=5, burst=1, queue_max=2)
+    concurrency_queue.start()
+
+    for i in range(5):
+        concurrency_queue.put(TimedRunner(i, started))
+
+    # One runs, two wait and the rest are turned away
+    assert wait_for(lambda: len(started) == 3)
+    assert started[0][0] == 0
+    rejected = [ label for label, ex in started[1:] ]
+    assert rejected == [3, 4]
+    assert isinstance(started[1][1], swampyer.ExWaitlistFull)
+
+    assert wait_for(lambda: len(started) == 5, timeout=2)
+    assert [ label for label, when in started[3:] ] == [1, 2]
+    assert concurrency_queue.stats()['rejected'] == 2
+
+    concurrency_queue.shutdown()
+
+def test_rate_reconfigure():
+    started = []
+    concurrency_queue = swampyer.RateLimitedConcurrencyQueue('slow', rate=0.1, burst=1)
+    concurrency_queue.start()
+
+    for i in range(3):
+        concurrency_queue.put(TimedRunner(i, started))
+    assert wait_for(lambda: len(started) == 1)
+    time.sleep(0.2)
+    assert len(started) == 1
+
+    # Speeding up the rate releases the waiting jobs sooner
+    concurrency_queue.configure(rate=50)
+    assert wait_for(lambda: len(started) == 3, timeout=1)
+
+    concurrency_queue.shutdown()
+
+def test_rate_invalid():
+    # A bucket that never gets a token would hold its jobs forever
+    for options in ( {'rate': 0}, {'rate': -1}, {'rate': 1, 'burst': -1}, {'rate': 1, 'burst': 0.5} ):
+        try:
+            swampyer.RateLimitedConcurrencyQueue('invalid', **options)
+            assert False, "Queue should have rejected {}".format(options)
+        except ValueError:
+            pass
+
+    concurrency_queue = swampyer.RateLimitedConcurrencyQueue('valid', rate=10)
+    for options in ( {'rate': 0}, {'burst': -1} ):
+        try:
+            concurrency_queue.configure(**options)
+            assert False, "Configure should have rejected {}".format(options)
+        except ValueError:
+            pass
+
+    # Nothing was changed by the rejected updates
+    assert concurrency_queue.rate == 10
+    assert concurrency_queue.burst == 10
+
+if __name__ == '__main__':
+    test_rate_limit()
+    test_rate_limit_reject()
+    test_rate_reconfigure()
+    test_rate_invalid()
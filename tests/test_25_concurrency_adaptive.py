@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the AdaptiveConcurrencyQueue directly. No router required
+"""
+
+class Backend(object):
+    """ Pretends to be a service that handles `capacity` jobs at a time
+        without slowing down. Past that every extra job in flight makes
+        all of them slower
+    """
+    def __init__(self, capacity, duration=0.005):
+        self.capacity = capacity
+        self.duration = duration
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.done = 0
+
+    def work(self):
+        with self.lock:
+            self.inflight += 1
+            overload = max(0, self.inflight - self.capacity)
+        time.sleep(self.duration * ( 1 + overload ))
+        with self.lock:
+            self.inflight -= 1
+            self.done += 1
+
+class BackendRunner(RecordingRunner):
+    def work(self):
+        self.backend.work()
+
+def run_backlog(concurrency_queue, backend, jobs):
+    for i in range(jobs):
+        concurrency_queue.put(BackendRunner(backend=backend))
+    assert wait_for(lambda: backend.done == jobs, timeout=20)
+
+def test_adaptive_gradient():
+    backend = Backend(capacity=4)
+    concurrency_queue = swampyer.AdaptiveConcurrencyQueue(
+                                'gradient',
+                                adaptive_min=1,
+                                adaptive_max=50,
+                                adaptive_window=10,
+                            )
+    concurrency_queue.start()
+    assert concurrency_queue.concurrency_max == 1
+
+    # With a backlog the limit climbs until the backend starts to slow
+    # down and then settles near what the backend can take
+    run_backlog(concurrency_queue, backend, 600)
+    stats = concurrency_queue.stats()
+    history = stats['adaptive']['history']
+    assert history
+    assert max( entry['limit'] for entry in history ) > 1
+    assert 2 <= stats['concurrency_max'] <= 20
+    assert stats['concurrency_max'] == concurrency_queue.concurrency_max
+    assert stats['adaptive']['algorithm'] == 'gradient'
+
+    concurrency_queue.shutdown()
+
+def test_adaptive_aimd():
+    backend = Backend(capacity=4)
+    concurrency_queue = swampyer.AdaptiveConcurrencyQueue(
+                                'aimd',
+                                concurrency_max=30,
+                                adaptive_min=2,
+                                adaptive_max=30,
+                                adaptive_algorithm='aimd',
+                                adaptive_window=10,
+                                adaptive_backoff=0.5,
+                            )
+    concurrency_queue.start()
+    assert concurrency_queue.concurrency_max == 30
+
+    # Starting way past what the backend copes with, the limit gets cut
+    run_backlog(concurrency_queue, backend, 600)
+    stats = concurrency_queue.stats()
+    assert stats['concurrency_max'] < 30
+    assert stats['concurrency_max'] >= 2
+    assert any( entry['limit'] < 30 for entry in stats['adaptive']['history'] )
+
+    concurrency_queue.shutdown()
+
+def adaptive_window(concurrency_queue, run_duration, saturated=False):
+    """ Feeds the queue a window worth of run times
+    """
+    concurrency_queue.adaptive_saturated = saturated
+    concurrency_queue.adaptive_samples = [run_duration] * concurrency_queue.adaptive_window
+    concurrency_queue.adaptive_update()
+
+def assert_limit(concurrency_queue, limit):
+    assert abs(concurrency_queue.adaptive_limit - limit) < 1e-9, concurrency_queue.adaptive_limit
+    assert concurrency_queue.concurrency_max == int(limit)
+
+def test_adaptive_idle():
+    for algorithm in ( 'gradient', 'aimd' ):
+        concurrency_queue = swampyer.AdaptiveConcurrencyQueue(
+                                    'idle',
+                                    concurrency_max=3,
+                                    adaptive_max=50,
+                                    adaptive_window=5,
+                                    adaptive_algorithm=algorithm,
+                                )
+
+        # A queue that never hits its limit keeps it. Neither quick
+        # windows nor the odd slow one change anything
+        for i in range(10):
+            adaptive_window(concurrency_queue, 0.01)
+        assert_limit(concurrency_queue, 3)
+        adaptive_window(concurrency_queue, 0.05)
+        assert_limit(concurrency_queue, 3)
+        for i in range(10):
+            adaptive_window(concurrency_queue, 0.01)
+        assert_limit(concurrency_queue, 3)
+        assert not any( entry['saturated'] for entry in concurrency_queue.stats()['adaptive']['history'] )
+
+        # A limit set by hand is respected
+        concurrency_queue.configure(concurrency_max=7)
+        assert_limit(concurrency_queue, 7)
+
+def test_adaptive_update():
+    concurrency_queue = swampyer.AdaptiveConcurrencyQueue(
+                                'aimd',
+                                concurrency_max=3,
+                                adaptive_window=5,
+                                adaptive_algorithm='aimd',
+                                adaptive_backoff=0.9,
+                            )
+    adaptive_window(concurrency_queue, 0.01)
+    assert_limit(concurrency_queue, 3)
+
+    # Saturated windows add one at a time
+    adaptive_window(concurrency_queue, 0.01, saturated=True)
+    assert_limit(concurrency_queue, 4)
+
+    # Slowing down while saturated backs off. The fraction is kept so
+    # that it isn't lost to rounding
+    adaptive_window(concurrency_queue, 0.05, saturated=True)
+    assert_limit(concurrency_queue, 3.6)
+    adaptive_window(concurrency_queue, 0.05)
+    assert_limit(concurrency_queue, 3.6)
+    adaptive_window(concurrency_queue, 0.01, saturated=True)
+    assert_limit(concurrency_queue, 4.6)
+
+    # The gradient adds sqrt(limit) of headroom, a fifth at a time,
+    # while the run time holds steady
+    concurrency_queue = swampyer.AdaptiveConcurrencyQueue(
+                                'gradient',
+                                concurrency_max=4,
+                                adaptive_window=5,
+                            )
+    adaptive_window(concurrency_queue, 0.01)
+    assert_limit(concurrency_queue, 4)
+    adaptive_window(concurrency_queue, 0.01, saturated=True)
+    assert_limit(concurrency_queue, 4.4)
+
+    # Twice as slow as the baseline halves the proposed limit
+    concurrency_queue.adaptive_tolerance = 1.0
+    limit = concurrency_queue.adaptive_limit
+    baseline = concurrency_queue.adaptive_baseline * 1.01
+    gradient = max(0.5, baseline / 0.04)
+    adaptive_window(concurrency_queue, 0.04, saturated=True)
+    assert_limit(concurrency_queue, limit * 0.8 + ( limit * gradient + limit ** 0.5 ) * 0.2)
+    assert concurrency_queue.adaptive_limit < limit
+
+if __name__ == '__main__':
+    test_adaptive_gradient()
+    test_adaptive_aimd()
+    test_adaptive_idle()
+    test_adaptive_update()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_histogram():
+    histogram = swampyer.LatencyHistogram()
+    for i in range(1, 1001):
+        histogram.record(i / 1000.0)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 1000
+    assert snapshot['min'] == 0.001
+    assert snapshot['max'] == 1
+    for key, expected in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999)):
+        assert abs(snapshot[key] - expected) / expected < 0.1
+
+    # Memory doesn't grow with the number of values
+    buckets = len(histogram.buckets)
+    for i in range(10000):
+        histogram.record(i)
+    assert len(histogram.buckets) == buckets
+    assert histogram.snapshot()['max'] == 9999
+
+def test_queue_latency():
+    concurrency_queue = swampyer.ConcurrencyQueue('latency', concurrency_max=1)
+    concurrency_queue.start()
+
+    # Jobs run one at a time so the last ones wait for the earlier ones
+    for i in range(10):
+        concurrency_queue.put(RecordingRunner(duration=0.01))
+    assert wait_for(lambda: concurrency_queue.stats()['duration_datapoints'] == 10)
+
+    stats = concurrency_queue.stats()
+    latency = stats['latency']
+    assert latency['run']['count'] == 10
+    assert 0.009 < latency['run']['p50'] < 0.05
+    assert latency['wait']['p99'] > 0.05
+    assert latency['total']['max'] >= latency['run']['max']
+
+    # The averages use the same wait times as the histograms
+    assert stats['wait_duration'] > 0
+    assert abs(stats['wait_duration_avg'] - latency['wait']['avg']) < 1e-9
+
+    # Resetting starts a new window
+    stats = concurrency_queue.stats(reset=True)
+    assert stats['latency']['run']['count'] == 10
+    stats = concurrency_queue.stats()
+    assert stats['latency']['run']['count'] == 0
+    assert stats['run'] == 0
+    assert stats['last_reset'] > stats['timestamp'] - 1
+
+    concurrency_queue.put(RecordingRunner())
+    assert wait_for(lambda: concurrency_queue.stats()['latency']['run']['count'] == 1)
+
+    concurrency_queue.shutdown()
+
+def hello(event, data):
+    time.sleep(0.02)
+    return data
+
+def test_procedure_latency():
+    client = connect_service()
+    client2 = connect_service()
+
+    reg_result = client.register('com.izaber.wamp.hello', hello, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    for i in range(5):
+        assert client2.call('com.izaber.wamp.hello', i) == i
+
+    assert wait_for(lambda: 'com.izaber.wamp.hello' in client.stats()['procedures'])
+    stats = client.stats(reset=True)
+    procedure = stats['procedures']['com.izaber.wamp.hello']
+    assert procedure['run']['count'] == 5
+    assert procedure['run']['p50'] >= 0.02
+    assert stats['queues']['default']['latency']['run']['count'] == 5
+
+    stats = client.stats()
+    assert stats['procedures'] == {}
+    assert stats['invocations'] == 0
+    assert stats['queues']['default']['latency']['run']['count'] == 0
+
+    client2.shutdown()
+    client.shutdown()
+
+if __name__ == '__main__':
+    test_histogram()
+    test_queue_latency()
+    test_procedure_latency()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import connect_service, wait_for
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_subscription_batch():
+    client = connect_service()
+    client2 = connect_service()
+
+    # Batches fill up to batch_size
+    batches = []
+    def capture(events):
+        batches.append([ event.args[0] for event in events ])
+    sub_result = client.subscribe(
+                        'com.izaber.wamp.batch.size',
+                        capture,
+                        batch_size=10,
+                        batch_window=2000,
+                    )
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(30):
+        client2.publish(
+            'com.izaber.wamp.batch.size',
+            options={ 'acknowledge': True },
+            args=[i]
+        )
+    assert wait_for(lambda: len(batches) == 3)
+    assert sorted(sum(batches, [])) == list(range(30))
+    for batch in batches:
+        assert len(batch) == 10
+
+    # A partial batch goes out once the window passes
+    windowed = []
+    def capture_window(events):
+        windowed.append(( time.time(), [ event.args[0] for event in events ] ))
+    sub_result = client.subscribe(
+                        'com.izaber.wamp.batch.window',
+                        capture_window,
+                        batch_size=100,
+                        batch_window=200,
+                    )
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    start = time.time()
+    for i in range(5):
+        client2.publish(
+            'com.izaber.wamp.batch.window',
+            options={ 'acknowledge': True },
+            args=[i],
+            kwargs={ 'extra': i },
+        )
+    assert wait_for(lambda: len(windowed) == 1)
+    flushed, batch = windowed[0]
+    assert sorted(batch) == list(range(5))
+    assert 0.15 < flushed - start < 1.5
+
+    stats = client.stats()['batches']
+    assert stats['com.izaber.wamp.batch.size']['batches'] == 3
+    assert stats['com.izaber.wamp.batch.size']['flushed_size'] == 3
+    assert stats['com.izaber.wamp.batch.size']['batch_size_avg'] == 10
+    assert stats['com.izaber.wamp.batch.window']['flushed_window'] == 1
+    assert stats['com.izaber.wamp.batch.window']['events'] == 5
+
+    # Unsubscribing hands over whatever is left
+    client2.publish(
+        'com.izaber.wamp.batch.window',
+        options={ 'acknowledge': True },
+        args=['last'],
+    )
+    time.sleep(0.05)
+    client.unsubscribe(sub_result.subscription_id)
+    assert wait_for(lambda: len(windowed) == 2)
+    assert windowed[1][1] == ['last']
+
+    client2.shutdown()
+    client.shutdown()
+
+def test_subscription_batch_order():
+    calls = []
+    first_started = threading.Event()
+    release = threading.Event()
+    def dispatch(events, scheduled):
+        calls.append(('start', events, scheduled))
+        if events == [0, 1]:
+            first_started.set()
+            release.wait(5)
+        calls.append(('end', events, scheduled))
+
+    batch = swampyer.SubscriptionBatch(2, None, dispatch, None)
+
+    # The reader fills a batch and is still dispatching it when
+    # the window flushes the next one
+    reader = threading.Thread(target=lambda: [ batch.add(i) for i in range(2) ])
+    reader.start()
+    assert first_started.wait(5)
+    batch.add(2)
+
+    # The flush doesn't wait on the handler nor does it overtake
+    # the batch that is already being dispatched
+    flusher = threading.Thread(target=batch.flush, args=('flushed_window', True))
+    flusher.start()
+    flusher.join(1)
+    assert not flusher.is_alive()
+    assert calls == [('start', [0, 1], False)]
+
+    # The reader dispatches the flushed batch once it's done with its own
+    release.set()
+    reader.join(5)
+    assert calls == [
+        ('start', [0, 1], False),
+        ('end', [0, 1], False),
+        ('start', [2], False),
+        ('end', [2], False),
+    ]
+    stats = batch.stats()
+    assert stats['flushed_size'] == 1
+    assert stats['flushed_window'] == 1
+    assert stats['pending'] == 0
+
+
+if __name__ == '__main__':
+    test_subscription_batch()
+    test_subscription_batch_order()
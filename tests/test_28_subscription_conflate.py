@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_queue_conflate():
+    concurrency_queue = swampyer.ConcurrencyQueue('conflate', concurrency_max=1)
+    concurrency_queue.start()
+
+    seen = []
+    gate = threading.Event()
+
+    # The first job holds the only slot. Everything else waits and only
+    # the latest value per key survives
+    concurrency_queue.put(RecordingRunner('blocker', release=gate, ended=seen))
+    for i in range(10):
+        concurrency_queue.put(RecordingRunner(('a', i), release=gate, ended=seen, conflation_key='a'))
+        concurrency_queue.put(RecordingRunner(('b', i), release=gate, ended=seen, conflation_key='b'))
+    concurrency_queue.put(RecordingRunner('plain', release=gate, ended=seen))
+    assert wait_for(lambda: concurrency_queue.stats()['superseded'] == 18)
+    assert concurrency_queue.waitlist_count() == 3
+
+    # Replaced jobs keep their place in line
+    gate.set()
+    assert wait_for(lambda: len(seen) == 4)
+    assert seen == ['blocker', ('a', 9), ('b', 9), 'plain']
+
+    # Once run, a key starts afresh
+    gate.clear()
+    concurrency_queue.put(RecordingRunner('blocker', release=gate, ended=seen))
+    concurrency_queue.put(RecordingRunner(('a', 10), release=gate, ended=seen, conflation_key='a'))
+    concurrency_queue.put(RecordingRunner(('a', 11), release=gate, ended=seen, conflation_key='a'))
+    assert wait_for(lambda: concurrency_queue.stats()['superseded'] == 19)
+    gate.set()
+    assert wait_for(lambda: len(seen) == 6)
+    assert seen[4:] == ['blocker', ('a', 11)]
+
+    concurrency_queue.shutdown()
+
+def test_queue_transfer():
+    concurrency_queue = swampyer.ConcurrencyQueue('fifo', concurrency_max=1)
+    concurrency_queue.start()
+
+    seen = []
+    gate = threading.Event()
+    concurrency_queue.put(RecordingRunner('blocker', release=gate))
+    concurrency_queue.put(RecordingRunner(('a', 0), release=gate, ended=seen,
+                                          conflation_key='a', options={'priority': 5}))
+    concurrency_queue.put(RecordingRunner('plain', release=gate, ended=seen,
+                                          options={'priority': 1}))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 2)
+
+    # Jobs are moved over one at a time so they land in the new queue's
+    # own waitlist and conflation carries on from where it left off
+    priority_queue = swampyer.PriorityConcurrencyQueue('priority', concurrency_max=1)
+    priority_queue.transfer(concurrency_queue)
+    assert not concurrency_queue.is_alive()
+    assert priority_queue.waitlist_count() == 2
+    stats = priority_queue.stats()
+    assert stats['priorities'][5]['waiting'] == 1
+    assert stats['priorities'][1]['waiting'] == 1
+
+    priority_queue.start()
+    priority_queue.put(RecordingRunner(('a', 1), release=gate, ended=seen,
+                                       conflation_key='a', options={'priority': 5}))
+    assert wait_for(lambda: priority_queue.stats()['superseded'] == 1)
+    assert priority_queue.active_count() == 1
+    assert priority_queue.waitlist_count() == 1
+
+    gate.set()
+    assert wait_for(lambda: len(seen) == 2)
+    assert seen == ['plain', ('a', 1)]
+
+    priority_queue.shutdown()
+
+def test_subscription_conflate():
+    client = connect_service(
+                  concurrency_configs={
+                      'positions': {
+                          'concurrency_max': 1,
+                      },
+                  }
+              )
+    client2 = connect_service()
+
+    seen = []
+    def position(event, device, value):
+        time.sleep(0.1)
+        seen.append(( device, value ))
+
+    sub_result = client.subscribe(
+                        'com.izaber.wamp.positions',
+                        position,
+                        concurrency_queue='positions',
+                        conflate=True,
+                        conflate_key=lambda event: event.args[0],
+                    )
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(20):
+        for device in ( 'x', 'y' ):
+            client2.publish(
+                'com.izaber.wamp.positions',
+                options={ 'acknowledge': True },
+                args=[device, i]
+            )
+
+    # The handler falls behind but only ever works on the latest value
+    assert wait_for(lambda: ('x', 19) in seen and ('y', 19) in seen)
+    time.sleep(0.3)
+    assert len(seen) < 20
+    for device in ( 'x', 'y' ):
+        values = [ value for key, value in seen if key == device ]
+        assert values == sorted(values)
+
+    stats = client.stats()['queues']['positions']
+    assert stats['superseded'] + len(seen) == 40
+
+    client2.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_queue_conflate()
+    test_queue_transfer()
+    test_subscription_conflate()
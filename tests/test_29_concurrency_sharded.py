@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import random
+import threading
+
+from lib import wait_for, RecordingRunner
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+
+"""
+Exercises the ShardedConcurrencyQueue scheduler directly. No router required
+"""
+
+class Tracker(object):
+    """ Records the order jobs ran in per device and how many ran at once
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seen = {}
+        self.running = {}
+        self.active = 0
+        self.active_max = 0
+        self.overlaps = 0
+        self.done = 0
+
+class DeviceRunner(RecordingRunner):
+    def __init__(self, device, sequence, tracker, duration=0.005):
+        message = swampyer.EVENT(
+                      subscription_id=1,
+                      publication_id=1,
+                      details={},
+                      args=[device, sequence],
+                  )
+        super(DeviceRunner, self).__init__(
+                (device, sequence),
+                message=message,
+                duration=duration,
+                device=device,
+                sequence=sequence,
+                tracker=tracker,
+            )
+
+    def work(self):
+        tracker = self.tracker
+        with tracker.lock:
+            if tracker.running.get(self.device):
+                tracker.overlaps += 1
+            tracker.running[self.device] = True
+            tracker.active += 1
+            tracker.active_max = max(tracker.active, tracker.active_max)
+            tracker.seen.setdefault(self.device, []).append(self.sequence)
+        time.sleep(self.duration * random.random())
+        with tracker.lock:
+            tracker.running[self.device] = False
+            tracker.active -= 1
+            tracker.done += 1
+
+def test_sharded_order():
+    tracker = Tracker()
+    concurrency_queue = swampyer.ShardedConcurrencyQueue('sharded', shards=8, concurrency_max=6)
+    concurrency_queue.start()
+
+    devices = [ 'device-{}'.format(i) for i in range(20) ]
+    for sequence in range(25):
+        for device in devices:
+            concurrency_queue.put(DeviceRunner(device, sequence, tracker))
+    assert wait_for(lambda: tracker.done == 500)
+
+    # Each device saw its jobs in order and never two at once while
+    # devices ran alongside each other
+    for device in devices:
+        assert tracker.seen[device] == list(range(25))
+    assert tracker.overlaps == 0
+    assert 1 < tracker.active_max <= 6
+
+    stats = concurrency_queue.stats()
+    assert stats['shards'] == 8
+    assert len(stats['lanes']) <= 8
+    assert sum( lane['run'] for lane in stats['lanes'].values() ) == 500
+    for lane in stats['lanes'].values():
+        assert lane['waiting'] == 0
+        assert lane['running'] is False
+    assert max( lane['waitlist_max'] for lane in stats['lanes'].values() ) > 1
+
+    concurrency_queue.shutdown()
+
+def test_sharded_key():
+    tracker = Tracker()
+    concurrency_queue = swampyer.ShardedConcurrencyQueue(
+                                'keyed',
+                                shards=4,
+                                shard_key=lambda message: message.args[1] % 2,
+                            )
+    concurrency_queue.start()
+
+    # Only two keys so at most two jobs run at a time however many lanes
+    for sequence in range(20):
+        concurrency_queue.put(DeviceRunner('device', sequence, tracker, 0.01))
+    assert wait_for(lambda: tracker.done == 20)
+    assert tracker.active_max <= 2
+    assert len(concurrency_queue.stats()['lanes']) == 2
+
+    concurrency_queue.shutdown()
+
+if __name__ == '__main__':
+    test_sharded_order()
+    test_sharded_key()
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+
+from lib import connect_service, wait_for
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_backpressure():
+    client = connect_service(
+                  concurrency_max=1,
+                  backpressure_high=10,
+                  backpressure_low=2,
+              )
+    client2 = connect_service()
+
+    seen = []
+    def slow(event, i):
+        time.sleep(0.01)
+        seen.append(i)
+
+    sub_result = client.subscribe('com.izaber.wamp.backpressure', slow)
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(200):
+        client2.publish(
+            'com.izaber.wamp.backpressure',
+            options={ 'acknowledge': True },
+            args=[i]
+        )
+
+    # Nothing gets lost, the events just stay with the router and the
+    # socket until there's room for them
+    assert wait_for(lambda: len(seen) == 200, timeout=20)
+    assert seen == list(range(200))
+
+    stats = client.stats()
+    assert stats['queues']['default']['waitlist_max'] <= 10
+    assert stats['queues']['default']['rejected'] == 0
+    assert stats['backpressure_pauses'] > 0
+    assert stats['backpressure_duration'] > 0
+    assert stats['backpressure_timeouts'] == 0
+    assert stats['backpressure_paused'] is False
+
+    # The client still works normally afterwards
+    def hello(event, data):
+        return data
+    client.register('com.izaber.wamp.backpressure.hello', hello, details={"force_reregister": True})
+    assert client2.call('com.izaber.wamp.backpressure.hello', 'x') == 'x'
+
+    client2.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_backpressure()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_queue_budget():
+    budget = swampyer.ByteBudget(2500)
+    concurrency_queue = swampyer.ConcurrencyQueue('bytes', concurrency_max=1, bytes_max=2000)
+    concurrency_queue.budget = budget
+    concurrency_queue.start()
+
+    results = []
+    gate = threading.Event()
+
+    # Running and waiting jobs both count
+    concurrency_queue.put(RecordingRunner('a', release=gate, ended=results, errors=results, payload_size=1000))
+    concurrency_queue.put(RecordingRunner('b', release=gate, ended=results, errors=results, payload_size=800))
+    concurrency_queue.put(RecordingRunner('c', release=gate, ended=results, errors=results, payload_size=500))
+    assert wait_for(lambda: len(results) == 1)
+    label, ex = results[0]
+    assert label == 'c'
+    assert isinstance(ex, swampyer.ExBudgetExceeded)
+
+    stats = concurrency_queue.stats()
+    assert stats['bytes'] == 1800
+    assert stats['bytes_peak'] == 1800
+    assert stats['bytes_rejected'] == 1
+    assert budget.current == 1800
+
+    # The shared budget applies on top of the queue's own
+    other_queue = swampyer.ConcurrencyQueue('other', concurrency_max=1)
+    other_queue.budget = budget
+    other_queue.start()
+    other_queue.put(RecordingRunner('d', release=gate, ended=results, errors=results, payload_size=600))
+    other_queue.put(RecordingRunner('e', release=gate, ended=results, errors=results, payload_size=700))
+    assert wait_for(lambda: len(results) == 2)
+    label, ex = results[1]
+    assert label == 'e'
+    assert isinstance(ex, swampyer.ExBudgetExceeded)
+
+    # Bytes are given back once the jobs are done
+    gate.set()
+    assert wait_for(lambda: len(results) == 5)
+    assert wait_for(lambda: budget.current == 0)
+    assert concurrency_queue.stats()['bytes'] == 0
+    assert concurrency_queue.stats()['bytes_peak'] == 1800
+    budget_stats = budget.stats()
+    assert budget_stats['bytes_peak'] == 2400
+    assert budget_stats['bytes_rejected'] == 1
+
+    concurrency_queue.shutdown()
+    other_queue.shutdown()
+
+def hold(event, data):
+    time.sleep(0.5)
+    return len(data)
+
+def test_invocation_budget():
+    client = connect_service(
+                  concurrency_configs={
+                      'bulk': {
+                          'concurrency_max': 1,
+                          'bytes_max': 250_000,
+                      },
+                  }
+              )
+    client2 = connect_service()
+
+    reg_result = client.register(
+                      'com.izaber.wamp.bulk',
+                      hold,
+                      details={"force_reregister": True},
+                      concurrency_queue='bulk',
+                  )
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    # Each call carries ~100KB so only two fit in the queue at a time
+    payload = 'x' * 100_000
+    futures = [ client2.call_async('com.izaber.wamp.bulk', payload) for i in range(4) ]
+    succeeded = 0
+    failed = 0
+    for future in futures:
+        try:
+            assert future.result(timeout=10) == 100_000
+            succeeded += 1
+        except swampyer.ExInvocationError as ex:
+            assert 'budget' in str(ex)
+            failed += 1
+    assert succeeded == 2
+    assert failed == 2
+
+    # The last job lets go of its bytes just after it has replied
+    assert wait_for(lambda: client.stats()['queues']['bulk']['bytes'] == 0)
+    stats = client.stats()
+    assert stats['queues']['bulk']['bytes_peak'] > 200_000
+    assert stats['queues']['bulk']['bytes_rejected'] == 2
+    assert stats['bytes']['bytes_peak'] > 200_000
+
+    client2.shutdown()
+    client.shutdown()
+
+if __name__ == '__main__':
+    test_queue_budget()
+    test_invocation_budget()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_owner_reset():
+    concurrency_queue = swampyer.shared_queue_get('owners', concurrency_max=1)
+    assert swampyer.shared_queue_get('owners') is concurrency_queue
+    assert concurrency_queue.shared
+    swampyer.shared_queue_start(concurrency_queue)
+    swampyer.shared_queue_start(concurrency_queue)
+
+    seen = []
+    gate = threading.Event()
+    concurrency_queue.put(RecordingRunner('a0', release=gate, ended=seen, owner='a'))
+    for i in range(1, 4):
+        concurrency_queue.put(RecordingRunner('a{}'.format(i), release=gate, ended=seen, owner='a'))
+        concurrency_queue.put(RecordingRunner('b{}'.format(i), release=gate, ended=seen, owner='b'))
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 6)
+
+    owners = concurrency_queue.stats()['owners']
+    assert owners['a'] == { 'messages': 4, 'run': 1, 'rejected': 0, 'running': 1, 'waiting': 3 }
+    assert owners['b'] == { 'messages': 3, 'run': 0, 'rejected': 0, 'running': 0, 'waiting': 3 }
+
+    # Only the waiting jobs of 'a' go, the running one gets to finish
+    concurrency_queue.put_owner_reset('a')
+    assert wait_for(lambda: concurrency_queue.waitlist_count() == 3)
+    gate.set()
+    assert wait_for(lambda: len(seen) == 4)
+    assert seen == ['a0', 'b1', 'b2', 'b3']
+
+    assert wait_for(lambda: concurrency_queue.stats()['owners']['b']['running'] == 0)
+    owners = concurrency_queue.stats()['owners']
+    assert owners['b']['run'] == 3
+    assert owners['a']['waiting'] == 0
+
+    # A queue that was shut down without being removed from the registry
+    # gets replaced rather than handed out again
+    concurrency_queue.shutdown()
+    concurrency_queue.join(5)
+    replacement = swampyer.shared_queue_get('owners', concurrency_max=1)
+    assert replacement is not concurrency_queue
+    swampyer.shared_queue_start(replacement)
+    assert replacement.is_alive()
+
+    assert swampyer.shared_queue_remove('owners') is replacement
+    assert 'owners' not in swampyer.SHARED_QUEUES
+
+TRACKER = { 'active': 0, 'active_max': 0 }
+TRACKER_LOCK = threading.Lock()
+
+def busy(event, data):
+    with TRACKER_LOCK:
+        TRACKER['active'] += 1
+        TRACKER['active_max'] = max(TRACKER['active'], TRACKER['active_max'])
+    time.sleep(0.05)
+    with TRACKER_LOCK:
+        TRACKER['active'] -= 1
+    return data
+
+def test_shared_queues():
+    configs = {
+        'cpu': {
+            '_shared': 'test-cpu',
+            'concurrency_max': 2,
+        },
+    }
+    clients = [ connect_service(concurrency_configs=configs) for i in range(3) ]
+    caller = connect_service()
+
+    for i, client in enumerate(clients):
+        reg_result = client.register(
+                          'com.izaber.wamp.shared.{}'.format(i),
+                          busy,
+                          details={"force_reregister": True},
+                          concurrency_queue='cpu',
+                      )
+        assert reg_result == swampyer.WAMP_REGISTERED
+
+    # Three clients but only two handlers run at once between them
+    futures = [
+        caller.call_async('com.izaber.wamp.shared.{}'.format(i % 3), i)
+        for i in range(30)
+    ]
+    assert [ future.result(timeout=10) for future in futures ] == list(range(30))
+    assert TRACKER['active_max'] == 2
+
+    shared_queue = swampyer.SHARED_QUEUES['test-cpu']
+    for client in clients:
+        assert client.concurrency_queue_get('cpu') is shared_queue
+
+    # Usage is broken down by client
+    assert wait_for(lambda: shared_queue.stats()['running'] == 0)
+    owners = clients[0].stats()['queues']['cpu']['owners']
+    for client in clients:
+        assert owners[client.client_name]['run'] == 10
+
+    # A client going away leaves the queue running for the others
+    clients[0].shutdown()
+    assert shared_queue.is_alive()
+    assert caller.call('com.izaber.wamp.shared.1', 'still') == 'still'
+
+    # Clients move on to a fresh queue if the shared one gets shut down
+    shared_queue.shutdown()
+    shared_queue.join(5)
+    replacement = clients[1].concurrency_queue_get('cpu')
+    assert replacement is not shared_queue
+    assert replacement.is_alive()
+    assert clients[2].concurrency_queue_get('cpu') is replacement
+    assert caller.call('com.izaber.wamp.shared.2', 'again') == 'again'
+
+    for client in clients[1:]:
+        client.shutdown()
+    caller.shutdown()
+    swampyer.shared_queue_remove('test-cpu')
+
+
+if __name__ == '__main__':
+    test_owner_reset()
+    test_shared_queues()
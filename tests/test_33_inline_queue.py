@@ -0,0 +1,150 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import threading
+
+from lib import connect_service, wait_for, RecordingRunner
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+class InlineRunner(RecordingRunner):
+    """ Records the thread it was run in
+    """
+    def __init__(self, seen, duration=0, fail=False):
+        super(InlineRunner, self).__init__(started=seen, duration=duration)
+        self.fail = fail
+
+    def work(self):
+        self.label = threading.current_thread()
+        if self.fail:
+            raise Exception("Nope")
+        super(InlineRunner, self).work()
+
+def test_inline_queue():
+    concurrency_queue = swampyer.InlineConcurrencyQueue('inline', slow_threshold=0.02)
+    concurrency_queue.start()
+
+    # Jobs run before put() returns and in the thread that called it
+    seen = []
+    for i in range(100):
+        concurrency_queue.put(InlineRunner(seen))
+        assert len(seen) == i + 1
+    assert all( thread is threading.current_thread() for thread in seen )
+
+    stats = concurrency_queue.stats()
+    assert stats['messages'] == 100
+    assert stats['run'] == 100
+    assert stats['running'] == 0
+    assert stats['waited'] == 0
+    assert stats['slow'] == 0
+    assert stats['latency']['run']['count'] == 100
+
+    # Handlers that take too long are counted and reported by name
+    for i in range(3):
+        concurrency_queue.put(InlineRunner(seen, duration=0.03))
+    stats = concurrency_queue.stats(reset=True)
+    assert stats['slow'] == 3
+    slow = stats['slow_handlers']['None']
+    assert slow['count'] == 3
+    assert slow['run_duration_max'] >= 0.03
+
+    stats = concurrency_queue.stats()
+    assert stats['slow'] == 0
+    assert stats['slow_handlers'] == {}
+
+    # Errors that get out of the runner don't escape put() but they
+    # do get logged since there's no thread to report them
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logging.getLogger('swampyer').addHandler(handler)
+    try:
+        runner = InlineRunner(seen, fail=True)
+        concurrency_queue.put(runner)
+    finally:
+        logging.getLogger('swampyer').removeHandler(handler)
+    assert len(runner.errors) == 1
+    assert concurrency_queue.stats()['errors'] == 1
+    assert concurrency_queue.active_count() == 0
+    assert [ record.levelno for record in records ] == [logging.ERROR]
+    assert 'Nope' in records[0].getMessage()
+
+    # put_threaded() gives the runner a thread of its own
+    seen = []
+    concurrency_queue.put_threaded(InlineRunner(seen, duration=0.05))
+    assert wait_for(lambda: concurrency_queue.active_count() == 0)
+    assert len(seen) == 1
+    assert seen[0] is not threading.current_thread()
+    assert concurrency_queue.stats()['slow'] == 0
+
+    concurrency_queue.shutdown()
+
+def hello(event, data):
+    return data
+
+def test_inline_client():
+    client = connect_service()
+    client2 = connect_service()
+
+    reg_result = client.register('com.izaber.wamp.hello.inline', hello,
+                                 details={"force_reregister": True},
+                                 concurrency_queue='inline')
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    threads = []
+    def sub_capture(event, data):
+        threads.append(threading.current_thread())
+    sub_result = client.subscribe('com.izaber.wamp.pub.inline', sub_capture,
+                                  concurrency_queue='inline')
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(20):
+        assert client2.call('com.izaber.wamp.hello.inline', i) == i
+    for i in range(20):
+        client2.publish(
+            'com.izaber.wamp.pub.inline',
+            options={ 'acknowledge': True },
+            args=[i]
+        )
+
+    # The handlers ran in the client's reader thread
+    assert wait_for(lambda: len(threads) == 20)
+    assert all( thread is client for thread in threads )
+
+    # Batches flushed by the window timer don't run in the scheduler's
+    # thread, that would hold up every timer behind them
+    batch_threads = []
+    def batch_capture(events):
+        batch_threads.append(threading.current_thread())
+    sub_result = client.subscribe('com.izaber.wamp.pub.inline.batch', batch_capture,
+                                  concurrency_queue='inline', batch_window=50)
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+    for i in range(3):
+        client2.publish(
+            'com.izaber.wamp.pub.inline.batch',
+            options={ 'acknowledge': True },
+            args=[i]
+        )
+    assert wait_for(lambda: len(batch_threads) == 1)
+    assert batch_threads[0] is not client
+    assert not isinstance(batch_threads[0], swampyer.TimerScheduler)
+
+    concurrency_queue = client.concurrency_queue_get('inline')
+    assert isinstance(concurrency_queue, swampyer.InlineConcurrencyQueue)
+    stats = client.stats()['queues']['inline']
+    assert stats['run'] == 41
+    assert stats['slow'] == 0
+
+    client2.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_inline_queue()
+    test_inline_client()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import threading
+
+from lib import connect_service, wait_for
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def test_dispatch_lane():
+    seen = []
+    gate = threading.Event()
+    def dispatch(message):
+        gate.wait()
+        if message == 'fail':
+            raise Exception("Nope")
+        seen.append(( message, threading.current_thread() ))
+
+    lane = swampyer.DispatchLane('bulk', dispatch)
+    lane.start()
+
+    # Messages pile up while the lane is busy and come out in order
+    for i in range(50):
+        lane.put(i)
+    lane.put('fail')
+    lane.put(50)
+    assert wait_for(lambda: lane.backlog_count() >= 51)
+    gate.set()
+    assert wait_for(lambda: lane.backlog_count() == 0)
+    assert [ message for message, thread in seen ] == list(range(51))
+    assert all( thread is lane for message, thread in seen )
+
+    stats = lane.stats(reset=True)
+    assert stats['messages'] == 52
+    assert stats['errors'] == 1
+    assert stats['depth'] == 0
+    assert stats['depth_max'] == 52
+    assert stats['latency']['wait']['count'] == 52
+    assert stats['latency']['wait']['max'] > 0
+
+    # Handled right away in the calling thread
+    assert lane.handle('now') is None
+    assert seen[-1] == ( 'now', threading.current_thread() )
+    stats = lane.stats()
+    assert stats['messages'] == 1
+    assert stats['depth_max'] == 0
+
+    lane.shutdown()
+    lane.join(5)
+    assert not lane.is_alive()
+
+def hello(event, data):
+    return data
+
+def test_dispatch_lanes():
+    callee = connect_service()
+    client = connect_service(dispatch_lanes=True)
+    publisher = connect_service()
+
+    reg_result = callee.register('com.izaber.wamp.hello.lanes', hello, details={"force_reregister": True})
+    assert reg_result == swampyer.WAMP_REGISTERED
+
+    # Each event holds up the thread that dispatches it
+    threads = []
+    def sub_capture(event, data):
+        time.sleep(0.01)
+        threads.append(threading.current_thread())
+    sub_result = client.subscribe('com.izaber.wamp.pub.lanes', sub_capture,
+                                  concurrency_queue='inline')
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    for i in range(200):
+        publisher.publish('com.izaber.wamp.pub.lanes', args=[i])
+    assert wait_for(lambda: client.stats()['lanes']['bulk']['depth'] > 50)
+
+    # The flood of events is still being worked through but the result
+    # of the call doesn't have to wait for it
+    start = time.time()
+    assert client.call('com.izaber.wamp.hello.lanes', 'hi') == 'hi'
+    assert time.time() - start < 0.5
+    assert client.stats()['lanes']['bulk']['depth'] > 0
+
+    assert wait_for(lambda: len(threads) == 200)
+    bulk = client._dispatch_lanes['bulk']
+    assert all( thread is bulk for thread in threads )
+
+    stats = client.stats()['lanes']
+    assert stats['bulk']['messages'] == 200
+    assert stats['bulk']['depth'] == 0
+    assert stats['bulk']['depth_max'] > 50
+    assert stats['bulk']['latency']['wait']['max'] > 0.5
+    assert stats['control']['messages'] >= 1
+    assert stats['control']['latency']['wait']['max'] < 0.5
+
+    publisher.shutdown()
+    client.shutdown()
+    callee.shutdown()
+
+
+if __name__ == '__main__':
+    test_dispatch_lane()
+    test_dispatch_lanes()
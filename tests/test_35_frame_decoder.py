@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+import logging
+import sys
+import time
+import json
+import threading
+
+from lib import connect_service, wait_for
+
+import swampyer
+
+logging.basicConfig(stream=sys.stdout, level=30)
+# We want to see the protocol information
+# being exchanged
+#logging.basicConfig(stream=sys.stdout, level=1)
+
+def event_frame(sequence, size=0):
+    return json.dumps([
+                swampyer.WAMP_EVENT, 1, 1, {},
+                [ sequence, 'x' * size ]
+            ])
+
+def test_frame_decoder():
+    reader = threading.current_thread()
+    decoded_in = {}
+    sources = {}
+    def decode(frame, source):
+        message = swampyer.WampMessage.load(json.loads(frame))
+        decoded_in[message.args[0]] = threading.current_thread()
+        sources[message.args[0]] = source
+        # Large frames are slow to decode
+        if len(frame) >= 1000:
+            time.sleep(0.1)
+        return message
+
+    delivered = []
+    def deliver(message, received):
+        delivered.append(message.args[0])
+        return True
+
+    decoder = swampyer.FrameDecoder(decode, deliver, threshold=1000, workers=2)
+    decoder.start()
+
+    # With nothing in the way small frames are delivered right away
+    assert decoder.put(event_frame(0)) is True
+    assert delivered == [0]
+    assert decoded_in[0] is reader
+
+    # A large frame doesn't hold up the reader but everything after it
+    # is delivered after it
+    start = time.time()
+    decoder.put(event_frame(1, 2000))
+    for i in range(2, 10):
+        decoder.put(event_frame(i, 2000 if i % 3 == 0 else 0))
+    assert time.time() - start < 0.1
+    assert wait_for(lambda: len(delivered) == 10)
+    assert delivered == list(range(10))
+    assert decoded_in[1] is not reader
+    assert decoded_in[2] is reader
+
+    # Frames are decoded with the source they were put with, even
+    # when they're held back behind a large frame
+    decoder.put(event_frame(20, 2000), source='old')
+    decoder.put(event_frame(21), source='old')
+    decoder.put(event_frame(22), source='new')
+    assert wait_for(lambda: len(delivered) == 13)
+    assert delivered[-3:] == [20, 21, 22]
+    assert [ sources[i] for i in (20, 21, 22) ] == ['old', 'old', 'new']
+
+    # Decode failures are reported and don't hold up the frames behind
+    decoder.put(event_frame(10, 2000))
+    decoder.put('[not json')
+    decoder.put(event_frame(11))
+    assert wait_for(lambda: len(delivered) == 15)
+    assert delivered[-2:] == [10, 11]
+
+    stats = decoder.stats(reset=True)
+    assert stats['frames'] == 16
+    assert stats['offloaded'] == 6
+    assert stats['held'] == 9
+    assert stats['errors'] == 1
+    assert stats['pending'] == 0
+    assert stats['pending_max'] >= 8
+    assert stats['decode']['EVENT']['count'] == 15
+    assert stats['decode']['EVENT']['max'] >= 0.1
+
+    stats = decoder.stats()
+    assert stats['frames'] == 0
+    assert stats['decode'] == {}
+
+    decoder.shutdown()
+    decoder.join(5)
+    assert not decoder.is_alive()
+
+def test_frame_decoder_client():
+    client = connect_service(decode_threshold=10000)
+    publisher = connect_service()
+
+    sub_data = []
+    def sub_capture(event, sequence, data):
+        sub_data.append(( sequence, len(data) ))
+    sub_result = client.subscribe('com.izaber.wamp.pub.decode', sub_capture,
+                                  concurrency_queue='inline')
+    assert sub_result == swampyer.WAMP_SUBSCRIBED
+
+    # Large and small events are seen in the order they were published
+    for i in range(50):
+        size = 100000 if i % 5 == 0 else 10
+        publisher.publish('com.izaber.wamp.pub.decode', args=[i, 'x' * size])
+    assert wait_for(lambda: len(sub_data) == 50)
+    assert [ sequence for sequence, size in sub_data ] == list(range(50))
+    assert sub_data[0] == ( 0, 100000 )
+
+    stats = client.stats()['decoder']
+    assert stats['offloaded'] == 10
+    assert stats['decode']['EVENT']['count'] == 50
+    assert stats['pending'] == 0
+
+    # Calls still work with the decoder in the way
+    assert client.call('wamp.session.count') >= 1
+
+    publisher.shutdown()
+    client.shutdown()
+
+
+if __name__ == '__main__':
+    test_frame_decoder()
+    test_frame_decoder_client()